@@ -0,0 +1,157 @@
+import argparse
+import os
+from typing import Tuple
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter, add_gadget_filter_arguments
+from rop_chains import run_sweep
+from region_scan import REGION_CHUNK_SIZE, scan_writable_regions
+from stack_prefetcher import PREFETCH_MEMORY_LIMIT
+from incremental_scan import SNAPSHOT_PAGE_SIZE, build_snapshot_state, load_snapshot_state, scan_stacks_incremental
+from run_stats import NO_STATS, RunStats
+
+
+def add_analysis_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the command line arguments of the analysis of one dump folder, shared by __main__ and the
+    analysis client.
+    """
+    parser.add_argument("folder_name", help="Folder of the process dump")
+    parser.add_argument("distance_between_gadgets", type=int, nargs="?", help="Maximum DWORD separation (x)")
+    parser.add_argument("min_chain_length", type=int, nargs="?", help="Minimum ROPchain length (y)")
+    parser.add_argument(
+        "--x",
+        nargs="+",
+        type=int,
+        help="Sweep mode: list of values for x (ej.: --x 8 6 4 2). The stacks are scanned only once"
+    )
+    parser.add_argument(
+        "--y",
+        nargs="+",
+        type=int,
+        help="Sweep mode: list of values for y (ej.: --y 2 3 4 5)"
+    )
+    add_gadget_filter_arguments(parser)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to scan the stack files in parallel"
+    )
+    parser.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=0,
+        help="Number of stack files loaded ahead by background threads while the current one is scanned, "
+             "for slow storage. Used with --jobs 1"
+    )
+    parser.add_argument(
+        "--prefetch-memory",
+        type=lambda value: int(value, 0),
+        default=PREFETCH_MEMORY_LIMIT,
+        help="Maximum bytes of the stack files loaded ahead"
+    )
+    parser.add_argument(
+        "--scan-writable-regions",
+        action="store_true",
+        help="Also scan the writable regions of the dump (writable IMG regions and the regions of "
+             "data/results.txt, e.g. the heap) for ROPchains of pivoted stacks. Their results are written to "
+             "analysis_results/writable_regions"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=lambda value: int(value, 0),
+        default=REGION_CHUNK_SIZE,
+        help="Bytes of a writable region scanned by one process"
+    )
+    parser.add_argument(
+        "--top-chains",
+        type=int,
+        metavar="K",
+        help="Keep only the K best scored ROPchains of every (x, y) combination, written best first with "
+             "their score, instead of every ROPchain found. Memory and output do not grow with the dump"
+    )
+    parser.add_argument(
+        "--snapshot-state",
+        metavar="FILE",
+        help="Incremental mode for successive snapshots of the same process: reuse the hits of the stack pages "
+             "that did not change since the snapshot whose state is in FILE, then replace it with the state "
+             "of this one. Use one FILE per monitored process. The stacks are scanned in this process"
+    )
+    parser.add_argument(
+        "--snapshot-page-size",
+        type=lambda value: int(value, 0),
+        default=SNAPSHOT_PAGE_SIZE,
+        help="Bytes of stack covered by one fingerprint in incremental mode"
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="FILE",
+        help="Write a JSON report with the time of every stage and the counters of the run to FILE"
+    )
+
+
+def check_analysis_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Sets args.x and args.y from the positional arguments if --x and --y are not given.
+    """
+    if args.x is None:
+        args.x = [] if args.distance_between_gadgets is None else [args.distance_between_gadgets]
+    if args.y is None:
+        args.y = [] if args.min_chain_length is None else [args.min_chain_length]
+    if not args.x or not args.y:
+        parser.error("provide x and y either as positional arguments or with --x and --y")
+    if args.top_chains is not None and args.top_chains < 1:
+        parser.error("--top-chains must be at least 1")
+
+
+def run_analysis(fm: ProcessDumpManager, args: argparse.Namespace, gadget_filter: GadgetFilter, results_dir: str,
+                 stats: RunStats = NO_STATS) -> Tuple[dict, dict]:
+    """
+    Writes the ROPchains of every (x, y) combination of the arguments to results_dir, and those of the
+    writable regions to results_dir/writable_regions if asked. The stats report is saved to args.stats if
+    stats are enabled.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance of the dump folder of the arguments.
+        args (argparse.Namespace): The arguments of add_analysis_arguments.
+        gadget_filter (GadgetFilter): Decides which WORDs are gadget hits.
+        results_dir (str): Directory where the results files are written.
+        stats (RunStats): Records the time of every stage and the counters of the run.
+
+    Returns:
+        Tuple[dict, dict]: Number of ROPchains found for every (x, y) combination in the stacks and in the
+        writable regions (empty if they are not scanned).
+    """
+    fm.prefetch_depth = args.prefetch_depth
+    fm.prefetch_memory_limit = args.prefetch_memory
+    if args.snapshot_state:
+        snapshot_state = build_snapshot_state(fm, gadget_filter, args.snapshot_page_size)
+        chain_counts = run_sweep(
+            fm, args.x, args.y, results_dir, gadget_filter, stats=stats,
+            stack_hits_source=scan_stacks_incremental(fm, gadget_filter, load_snapshot_state(args.snapshot_state),
+                                                      snapshot_state, stats),
+            top_chains=args.top_chains
+        )
+        snapshot_state.save(args.snapshot_state)
+    else:
+        chain_counts = run_sweep(fm, args.x, args.y, results_dir, gadget_filter, args.jobs, stats,
+                                 top_chains=args.top_chains)
+    region_chain_counts = {}
+    if args.scan_writable_regions:
+        region_chain_counts = run_sweep(
+            fm, args.x, args.y, os.path.join(results_dir, "writable_regions"), gadget_filter, stats=stats,
+            stack_hits_source=scan_writable_regions(fm, gadget_filter, args.jobs, args.chunk_size, stats),
+            top_chains=args.top_chains
+        )
+
+    if stats.enabled:
+        stats.save_report(
+            args.stats,
+            folder_name=args.folder_name,
+            bitness=fm.bitness,
+            jobs=args.jobs,
+            chain_counts={f"{x}_{y}": count for (x, y), count in chain_counts.items()},
+            writable_region_chain_counts={f"{x}_{y}": count for (x, y), count in region_chain_counts.items()},
+        )
+    return chain_counts, region_chain_counts
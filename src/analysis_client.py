@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import sys
+
+from analysis import add_analysis_arguments, check_analysis_arguments
+from analysis_server import OUTPUT_FORMATS, add_server_address_arguments, send_request
+
+CLIENT_ARGUMENTS = ("socket", "port", "output_format", "output")
+PATH_ARGUMENTS = ("folder_name", "return_site_cache", "benign_index", "snapshot_state", "stats")  # sent as absolute paths
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Detection of ROP chains in memory dumps by a running "
+                                                 "analysis server (see analysis_server.py). Same arguments as "
+                                                 "__main__.")
+    add_analysis_arguments(parser)
+    add_server_address_arguments(parser)
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="files",
+        help="files: the server writes the results files to analysis_results, as __main__ does. "
+             "json: the ROPchains are returned and written as JSON to --output"
+    )
+    parser.add_argument("--output", metavar="FILE", help="File for the json output format (default: stdout)")
+    args = parser.parse_args()
+    check_analysis_arguments(parser, args)
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    arguments = {name: value for name, value in vars(args).items() if name not in CLIENT_ARGUMENTS}
+    for name in PATH_ARGUMENTS:
+        if arguments[name]:
+            arguments[name] = os.path.abspath(arguments[name])  # the server may run in another directory
+    request = {
+        "command": "analyze",
+        "arguments": arguments,
+        "output_format": args.output_format,
+        "results_dir": os.path.join(os.getcwd(), "analysis_results"),
+    }
+    response = send_request(request, args.socket, args.port)
+    if response["status"] != "ok":
+        print(f"Error: {response['error']}")
+        sys.exit(1)
+
+    if args.output_format == "json":
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(response, output_file)
+        else:
+            json.dump(response, sys.stdout)
@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+from process_dump_manager import ProcessDumpManager
+from dump_metadata_cache import get_source_signature
+from gadget_filter import GadgetFilter, build_gadget_filter
+from analysis import add_analysis_arguments, check_analysis_arguments, run_analysis
+from rop_chain_results import get_results_arrays_file_path, load_rop_chain_results
+from run_stats import NO_STATS, RunStats
+
+DEFAULT_PORT = 8731
+DEFAULT_MAX_FOLDERS = 8  # dump folders kept loaded
+DEFAULT_MAX_GADGET_FILTERS = 4  # gadget filter configurations kept with their caches
+OUTPUT_FORMATS = ("files", "json")
+OUTPUT_PATH_ARGUMENTS = ("return_site_cache", "snapshot_state", "stats")  # request paths the server writes to
+SOCKET_PERMISSIONS = 0o600  # only the user of the server can connect to its Unix socket
+
+
+class RequestArgumentParser(argparse.ArgumentParser):
+    """
+    ArgumentParser whose errors raise ValueError instead of exiting, for the arguments of a request.
+    """
+    def error(self, message: str):
+        raise ValueError(message)
+
+
+def get_request_argv(parser: argparse.ArgumentParser, arguments: dict) -> list:
+    """
+    Converts the arguments of a request, a dict of argument names (as in argparse.Namespace) and values, to
+    the command line that sets them, so they are converted and checked as on the command line. None values
+    keep their default.
+
+    Raises:
+        ValueError: If an argument is unknown or its value has the wrong shape.
+    """
+    actions = {action.dest: action for action in parser._actions if action.dest != "help"}
+    for name in arguments:
+        if name not in actions:
+            raise ValueError(f"unknown argument {name}")
+
+    optionals = []
+    positionals = []
+    for name, action in actions.items():
+        value = arguments.get(name)
+        if value is None:
+            continue
+        if isinstance(action, argparse._StoreTrueAction):
+            if not isinstance(value, bool):
+                raise ValueError(f"argument {name}: expected true or false")
+            if value:
+                optionals.append(action.option_strings[0])
+            continue
+        if action.nargs == "+":
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"argument {name}: expected a non-empty list")
+            values = value
+        else:
+            values = [value]
+        if any(isinstance(item, (bool, list, dict)) for item in values):
+            raise ValueError(f"argument {name}: invalid value {value!r}")
+        if action.option_strings and action.nargs is None:
+            optionals.append(f"{action.option_strings[0]}={value}")  # the value may start with "-"
+        elif action.option_strings:
+            optionals += [action.option_strings[0]] + [str(item) for item in values]
+        else:
+            positionals += [str(item) for item in values]
+    return optionals + ["--"] + positionals
+
+
+def get_request_arguments(request: dict) -> argparse.Namespace:
+    """
+    Builds the arguments of add_analysis_arguments of an analysis request: request["arguments"], a dict of
+    argument names (as in argparse.Namespace) and values, parsed and checked as the command line of __main__
+    (see get_request_argv), the others keeping their default.
+
+    Raises:
+        ValueError: If an argument is unknown or invalid, or the request has no folder, x or y.
+    """
+    arguments = request.get("arguments", {})
+    if not isinstance(arguments, dict):
+        raise ValueError("the request arguments are not an object")
+    if not arguments.get("folder_name"):
+        raise ValueError("the request has no folder_name")
+    parser = RequestArgumentParser()
+    add_analysis_arguments(parser)
+    args = parser.parse_args(get_request_argv(parser, arguments))
+    check_analysis_arguments(parser, args)
+    return args
+
+
+def get_chains_json(results_dir: str, distance_between_gadgets: int, min_chain_length: int) -> list:
+    """
+    Returns the ROPchains of one combination of parameters written to results_dir, as a list of
+    {"source": dump file or None, "score": score or None, "pairs": [[stack address, gadget address], ...]}.
+    The score is only set with --top-chains.
+    """
+    results = load_rop_chain_results(get_results_arrays_file_path(results_dir, distance_between_gadgets,
+                                                                  min_chain_length))
+    return [{"source": results.get_chain_source(chain_index), "score": results.get_chain_score(chain_index),
+             "pairs": results.get_chain(chain_index).tolist()} for chain_index in range(len(results))]
+
+
+class AnalysisServer:
+    def __init__(self, max_folders: int = DEFAULT_MAX_FOLDERS, max_gadget_filters: int = DEFAULT_MAX_GADGET_FILTERS,
+                 output_roots: List[str] | None = None):
+        """
+        Analyzes dump folders on request, keeping the most recently used ones loaded between requests so the
+        interpreter startup, the metadata parsing, the region index and the open IMG dump files are paid
+        only once per folder. Gadget filters are kept per configuration too, with their return site bitmaps
+        and validation results, which are keyed by region SHA-256 and so shared by all the folders.
+
+        Args:
+            max_folders (int): Maximum number of dump folders kept loaded. The least recently used is closed.
+            max_gadget_filters (int): Maximum number of gadget filter configurations kept.
+            output_roots (List[str] | None): Directories under which requests may make the server write files
+                (see check_output_path). By default the working directory of the server.
+        """
+        self.max_folders = max_folders
+        self.max_gadget_filters = max_gadget_filters
+        self.output_roots = [os.path.realpath(root) for root in (output_roots or [os.getcwd()])]
+        self.dump_managers = OrderedDict()  # absolute folder path -> (ProcessDumpManager, source signature)
+        self.gadget_filters = OrderedDict()  # gadget filter arguments -> GadgetFilter
+        self.requests_served = 0
+        self.shutdown_requested = False
+
+    def get_dump_manager(self, folder_name: str) -> Tuple[ProcessDumpManager, bool]:
+        """
+        Returns the ProcessDumpManager of a folder, loading it if it is not loaded or its results.txt files
+        (see ProcessDumpManager.get_metadata_source_paths) changed since it was loaded.
+
+        Returns:
+            Tuple[ProcessDumpManager, bool]: The ProcessDumpManager and whether it was already loaded.
+        """
+        folder_name = os.path.abspath(folder_name)
+        if folder_name in self.dump_managers:
+            fm, signature = self.dump_managers[folder_name]
+            if get_source_signature(fm.get_metadata_source_paths()) == signature:
+                self.dump_managers.move_to_end(folder_name)
+                return fm, True
+            del self.dump_managers[folder_name]
+            fm.close()
+
+        if not os.path.exists(folder_name):
+            raise IOError(f"no dump folder {folder_name}")
+        fm = ProcessDumpManager(folder_name)
+        signature = get_source_signature(fm.get_metadata_source_paths())
+        self.dump_managers[folder_name] = (fm, signature)
+        while len(self.dump_managers) > self.max_folders:
+            _, (evicted_fm, _) = self.dump_managers.popitem(last=False)
+            evicted_fm.close()
+        return fm, False
+
+    def check_output_path(self, path: str):
+        """
+        Checks that a path a request makes the server write to is inside one of the output roots, symbolic
+        links resolved, since any local user can send requests.
+
+        Raises:
+            PermissionError: If the path is outside the output roots.
+        """
+        real_path = os.path.realpath(path)
+        if not any(os.path.commonpath([real_path, root]) == root for root in self.output_roots):
+            raise PermissionError(f"{path} is outside the output directories of the server")
+
+    def get_gadget_filter(self, args: argparse.Namespace) -> GadgetFilter:
+        key = (args.call_filter, args.return_site_cache, args.validate_gadgets, args.validation_cache_size,
+               args.benign_index)
+        if key in self.gadget_filters:
+            self.gadget_filters.move_to_end(key)
+            return self.gadget_filters[key]
+        gadget_filter = self.gadget_filters[key] = build_gadget_filter(args)
+        while len(self.gadget_filters) > self.max_gadget_filters:
+            self.gadget_filters.popitem(last=False)
+        return gadget_filter
+
+    def analyze(self, request: dict) -> dict:
+        """
+        Runs one analysis request:
+            - arguments: the arguments of add_analysis_arguments (see get_request_arguments).
+            - output_format: "files" writes the results files to results_dir, as __main__ does, and "json"
+              returns the ROPchains in the response instead.
+            - results_dir: directory of the results files, required with the "files" format.
+        The results directory and the files of the arguments the server writes must be inside its output
+        roots.
+
+        Returns:
+            dict: The folder, whether it was already loaded, the time spent, the number of ROPchains of every
+            "x_y" combination and, with the "json" format, the ROPchains.
+        """
+        args = get_request_arguments(request)
+        output_format = request.get("output_format", "files")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unknown output format {output_format}")
+        if output_format == "files" and not request.get("results_dir"):
+            raise ValueError("the request has no results_dir")
+        if output_format == "files":
+            self.check_output_path(request["results_dir"])
+        for name in OUTPUT_PATH_ARGUMENTS:
+            if getattr(args, name):
+                self.check_output_path(getattr(args, name))
+
+        start_time = time.perf_counter()
+        stats = RunStats() if args.stats else NO_STATS
+        with stats.timer("metadata_load"):
+            fm, warm = self.get_dump_manager(args.folder_name)
+        gadget_filter = self.get_gadget_filter(args)
+
+        response = {"status": "ok", "folder_name": fm.folder_name, "warm": warm}
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            results_dir = request["results_dir"] if output_format == "files" else temporary_dir
+            chain_counts, region_chain_counts = run_analysis(fm, args, gadget_filter, results_dir, stats)
+            if output_format == "json":
+                response["chains"] = {f"{x}_{y}": get_chains_json(results_dir, x, y) for x, y in chain_counts}
+                if args.scan_writable_regions:
+                    response["writable_region_chains"] = {
+                        f"{x}_{y}": get_chains_json(os.path.join(results_dir, "writable_regions"), x, y)
+                        for x, y in region_chain_counts
+                    }
+        response["chain_counts"] = {f"{x}_{y}": count for (x, y), count in chain_counts.items()}
+        response["writable_region_chain_counts"] = {f"{x}_{y}": count for (x, y), count in region_chain_counts.items()}
+        response["elapsed_seconds"] = time.perf_counter() - start_time
+        return response
+
+    def get_status(self) -> dict:
+        return {
+            "status": "ok",
+            "folders": [folder_name for folder_name in self.dump_managers],
+            "gadget_filters": len(self.gadget_filters),
+            "requests_served": self.requests_served,
+        }
+
+    def handle_request(self, request: dict) -> dict:
+        """
+        Runs a request: {"command": "analyze", ...} (see analyze), {"command": "status"} or
+        {"command": "shutdown"}. Errors are returned as {"status": "error", "error": message}.
+        """
+        command = request.get("command", "analyze")
+        try:
+            if command == "analyze":
+                response = self.analyze(request)
+            elif command == "status":
+                response = self.get_status()
+            elif command == "shutdown":
+                self.shutdown_requested = True
+                response = {"status": "ok"}
+            else:
+                response = {"status": "error", "error": f"unknown command {command}"}
+        except Exception as e:
+            response = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        self.requests_served += 1
+        return response
+
+    def close(self):
+        for fm, _ in self.dump_managers.values():
+            fm.close()
+        self.dump_managers.clear()
+        self.gadget_filters.clear()
+
+
+class AnalysisRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON request per line from a connection and writes one JSON response per line.
+    """
+    def handle(self):
+        analysis_server = self.server.analysis_server
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"status": "error", "error": f"invalid request: {e}"}
+            else:
+                response = analysis_server.handle_request(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+            if analysis_server.shutdown_requested:
+                break
+
+
+class LocalTCPServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def serve(analysis_server: AnalysisServer, socket_path: str | None = None, port: int = DEFAULT_PORT):
+    """
+    Serves analysis requests on a Unix socket, or on a localhost TCP port if no socket path is given, until
+    a shutdown request is received. Connections are handled one at a time, so the loaded folders are never
+    used by two analyses at once. Only the user of the server can connect to the Unix socket, the TCP port
+    is open to every local user.
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left by a server that was killed
+        # created with its permissions, so no other user can connect before they are set
+        previous_umask = os.umask(0o777 & ~SOCKET_PERMISSIONS)
+        try:
+            server = socketserver.UnixStreamServer(socket_path, AnalysisRequestHandler)
+        finally:
+            os.umask(previous_umask)
+    else:
+        server = LocalTCPServer(("127.0.0.1", port), AnalysisRequestHandler)
+    server.analysis_server = analysis_server
+    try:
+        with server:
+            while not analysis_server.shutdown_requested:
+                server.handle_request()
+    finally:
+        analysis_server.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def send_request(request: dict, socket_path: str | None = None, port: int = DEFAULT_PORT) -> dict:
+    """
+    Sends one request to a running analysis server and returns its response.
+    """
+    if socket_path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socket_path)
+    else:
+        connection = socket.create_connection(("127.0.0.1", port))
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        raise ConnectionError("the analysis server closed the connection without answering")
+    return json.loads(line)
+
+
+def add_server_address_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--socket", metavar="PATH", help="Unix socket of the server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="localhost TCP port of the server, used if no --socket is given")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server that keeps dump folders loaded between ROP chain analyses. "
+                                                 "Requests are sent with analysis_client.py.")
+    add_server_address_arguments(parser)
+    parser.add_argument("--max-folders", type=int, default=DEFAULT_MAX_FOLDERS,
+                        help="Maximum number of dump folders kept loaded")
+    parser.add_argument("--max-gadget-filters", type=int, default=DEFAULT_MAX_GADGET_FILTERS,
+                        help="Maximum number of gadget filter configurations kept with their caches")
+    parser.add_argument("--output-root", action="append", metavar="DIR",
+                        help="Directory under which requests may write results, stats, snapshot states and return "
+                             "site bitmaps. Can be repeated (default: the working directory of the server)")
+    parser.add_argument("--stop", action="store_true", help="Stop the server running at the address")
+    args = parser.parse_args()
+
+    if args.stop:
+        send_request({"command": "shutdown"}, args.socket, args.port)
+    else:
+        serve(AnalysisServer(args.max_folders, args.max_gadget_filters, args.output_root), args.socket, args.port)
@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+from process_dump_manager import ProcessDumpManager
+from dump_storage import is_dump_archive
+from gadget_filter import GadgetFilter, add_gadget_filter_arguments, build_gadget_filter
+from rop_chains import run_sweep
+
+COMPLETION_MARKER = ".done"  # written inside the results directory of every analyzed folder
+SUMMARY_FILE = "summary.json"
+FOLDER_PATH_HASH_LENGTH = 12  # hex digits of the hash of the folder path in its results directory name
+
+
+def list_dump_folders(source: str) -> List[str]:
+    """
+    Lists the dump folders to analyze.
+
+    Args:
+        source (str): Either a directory whose subdirectories (or .zip, .tar and .tar.zst archives) are dump
+            folders (like 2264_26-11-2024_12-46-30_UTC) or a manifest file with one dump folder path per line.
+            Empty lines and lines starting with # are ignored in the manifest.
+
+    Returns:
+        List[str]: The paths of the dump folders.
+    """
+    if os.path.isdir(source):
+        return sorted(entry.path for entry in os.scandir(source) if entry.is_dir() or is_dump_archive(entry.name))
+
+    with open(source, 'r') as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith('#')]
+
+
+def get_folder_size(folder_name: str) -> int:
+    """
+    Returns the total size in bytes of the files of a dump folder, used to schedule the largest ones first.
+    """
+    if os.path.isfile(folder_name):  # archive
+        return os.path.getsize(folder_name)
+    size = 0
+    for root, _, file_names in os.walk(folder_name):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+
+def get_folder_results_dir(results_dir: str, folder_name: str) -> str:
+    """
+    Returns the results directory of a dump folder: its name followed by a hash of its absolute path, so
+    folders with the same name in different directories do not share it.
+    """
+    folder_path = os.path.abspath(folder_name)
+    path_hash = hashlib.sha256(folder_path.encode()).hexdigest()[:FOLDER_PATH_HASH_LENGTH]
+    return os.path.join(results_dir, f"{os.path.basename(folder_path)}_{path_hash}")
+
+
+def get_batch_parameters(distances_between_gadgets: List[int], min_chain_lengths: List[int],
+                         gadget_filter: GadgetFilter) -> dict:
+    """
+    Returns the parameters the results of a folder depend on, stored in its completion marker.
+    """
+    return {
+        "distances_between_gadgets": list(distances_between_gadgets),
+        "min_chain_lengths": list(min_chain_lengths),
+        **gadget_filter.get_signature(),
+    }
+
+
+def read_completion_marker(folder_results_dir: str, parameters: dict) -> dict | None:
+    """
+    Returns the summary stored in the completion marker of an analyzed folder, or None if the folder
+    has not been analyzed completely with these parameters (see get_batch_parameters).
+    """
+    try:
+        with open(os.path.join(folder_results_dir, COMPLETION_MARKER), 'r') as marker:
+            summary = json.load(marker)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(summary, dict) or summary.pop("parameters", None) != parameters:
+        return None
+    return summary
+
+
+def analyze_dump_folder(folder_name: str, distances_between_gadgets: List[int], min_chain_lengths: List[int],
+                        folder_results_dir: str, gadget_filter: GadgetFilter | None = None) -> dict:
+    """
+    Runs the sweep over one dump folder and writes its completion marker, with the parameters of the
+    analysis, once every results file is written.
+
+    Returns:
+        dict: Summary of the folder: its path and the number of ROPchains of every "x_y" combination.
+    """
+    if gadget_filter is None:
+        gadget_filter = GadgetFilter()
+    # a marker left by an analysis with other parameters must not survive a partial rewrite of the files
+    marker_path = os.path.join(folder_results_dir, COMPLETION_MARKER)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+
+    p_dump_manager = ProcessDumpManager(folder_name)
+    try:
+        chain_counts = run_sweep(p_dump_manager, distances_between_gadgets, min_chain_lengths, folder_results_dir,
+                                 gadget_filter)
+    finally:
+        p_dump_manager.close()
+
+    summary = {
+        "folder": folder_name,
+        "chain_counts": {f"{x}_{y}": count for (x, y), count in chain_counts.items()},
+    }
+    # the marker is replaced atomically, so an interrupted write never looks like a finished folder
+    with open(marker_path + ".tmp", 'w') as marker:
+        json.dump(dict(summary, parameters=get_batch_parameters(distances_between_gadgets, min_chain_lengths,
+                                                                gadget_filter)), marker)
+    os.replace(marker_path + ".tmp", marker_path)
+    return summary
+
+
+def run_batch(folder_names: List[str], distances_between_gadgets: List[int], min_chain_lengths: List[int],
+              results_dir: str, gadget_filter: GadgetFilter | None = None, jobs: int = 1) -> dict:
+    """
+    Analyzes many dump folders with a pool of worker processes. The folders are scheduled largest first so
+    the longest analyses do not end up running alone at the end. Folders with a completion marker from a
+    previous (maybe interrupted) batch with the same parameters are not analyzed again.
+
+    Args:
+        folder_names (List[str]): The dump folders.
+        distances_between_gadgets (List[int]): Values of x.
+        min_chain_lengths (List[int]): Values of y.
+        results_dir (str): Directory where a results directory is created for every folder.
+        gadget_filter (GadgetFilter | None): Decides which WORDs are gadget hits.
+        jobs (int): Number of worker processes.
+
+    Returns:
+        dict: Aggregated summary of the batch, also written to summary.json inside results_dir.
+    """
+    if gadget_filter is None:
+        gadget_filter = GadgetFilter()
+    os.makedirs(results_dir, exist_ok=True)
+    parameters = get_batch_parameters(distances_between_gadgets, min_chain_lengths, gadget_filter)
+    summaries = {}
+    pending = []
+    for folder_name in folder_names:
+        summary = read_completion_marker(get_folder_results_dir(results_dir, folder_name), parameters)
+        if summary is not None:
+            summaries[folder_name] = summary
+        else:
+            pending.append(folder_name)
+
+    pending.sort(key=get_folder_size, reverse=True)
+    print(f"{len(summaries)} folders already analyzed, {len(pending)} pending")
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(analyze_dump_folder, folder_name, distances_between_gadgets, min_chain_lengths,
+                            get_folder_results_dir(results_dir, folder_name), gadget_filter): folder_name
+            for folder_name in pending
+        }
+        for future in as_completed(futures):
+            folder_name = futures[future]
+            try:
+                summaries[folder_name] = future.result()
+                print(f"Done: {folder_name}")
+            except Exception as e:
+                summaries[folder_name] = {"folder": folder_name, "error": str(e)}
+                print(f"Error analyzing {folder_name}: {e}")
+
+    batch_summary = {
+        "distances_between_gadgets": distances_between_gadgets,
+        "min_chain_lengths": min_chain_lengths,
+        "call_filter": gadget_filter.call_filter,
+        "validate_gadgets": parameters["validate_gadgets"],
+        "benign_index": parameters["benign_index"],
+        "folders": [summaries[folder_name] for folder_name in folder_names],
+    }
+    with open(os.path.join(results_dir, SUMMARY_FILE), 'w') as summary_file:
+        json.dump(batch_summary, summary_file, indent=2)
+    return batch_summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detection of ROP chains in many dump folders.")
+    parser.add_argument("source", help="Directory of dump folders or manifest file with one folder per line")
+    parser.add_argument("--x", nargs="+", type=int, required=True, help="List of values for x (ej.: --x 8 6 4 2)")
+    parser.add_argument("--y", nargs="+", type=int, required=True, help="List of values for y (ej.: --y 2 3 4 5)")
+    parser.add_argument("--output-dir", default="analysis_results", help="Directory for the results of every folder")
+    add_gadget_filter_arguments(parser)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of folders analyzed in parallel")
+    args = parser.parse_args()
+
+    run_batch(list_dump_folders(args.source), args.x, args.y, args.output_dir, build_gadget_filter(args), args.jobs)
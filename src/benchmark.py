@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import List
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter, add_gadget_filter_arguments, build_gadget_filter
+from rop_chains import run_sweep
+from run_stats import RunStats
+from synthetic_dump import add_synthetic_dump_arguments, generate_dump_folder_from_arguments
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def get_peak_rss() -> int | None:
+    """
+    Returns the peak resident set size of the process in bytes, or None if it cannot be measured.
+    """
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss if sys.platform == "darwin" else peak_rss * 1024  # bytes on macOS, KiB elsewhere
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_benchmark(folder_name: str, distances_between_gadgets: List[int], min_chain_lengths: List[int],
+                  gadget_filter: GadgetFilter, results_dir: str, jobs: int = 1) -> dict:
+    """
+    Runs the analysis of a dump folder through run_sweep, as __main__ does, with every stage timed by
+    RunStats: metadata_load, stack_mapping, region_lookup, the checks enabled in gadget_filter (e.g.
+    call_filter, validation, benign_filter), segmentation and writer.
+
+    Args:
+        folder_name (str): The dump folder.
+        distances_between_gadgets (List[int]): Values of x.
+        min_chain_lengths (List[int]): Values of y.
+        gadget_filter (GadgetFilter): The checks to benchmark.
+        results_dir (str): Directory where the results files are written.
+        jobs (int): Number of processes used to scan the stack files.
+
+    Returns:
+        dict: The RunStats report (stage seconds, counters, WORDs per second, cache hit rates) with the
+        folder, the number of ROPchains of every (x, y) combination and the peak RSS.
+    """
+    stats = RunStats()
+    with stats.timer("metadata_load"):
+        fm = ProcessDumpManager(folder_name)
+    try:
+        chain_counts = run_sweep(fm, distances_between_gadgets, min_chain_lengths, results_dir, gadget_filter, jobs,
+                                 stats)
+    finally:
+        fm.close()
+
+    return stats.get_report(
+        folder_name=folder_name,
+        bitness=fm.bitness,
+        stacks=len(fm.stack_info),
+        img_regions=len(fm.dmp_info),
+        jobs=jobs,
+        chain_counts={f"{x}_{y}": count for (x, y), count in chain_counts.items()},
+        peak_rss_bytes=get_peak_rss(),
+    )
+
+
+def print_report(report: dict):
+    print(f"Folder: {report['folder_name']} ({report['bitness']} bits, {report['stacks']} stacks, "
+          f"{report['img_regions']} IMG regions, {report['jobs']} jobs)")
+    print(f"WORDs: {report['counters'].get('words_scanned', 0)}, hits: {report['counters'].get('gadget_hits', 0)}")
+    print(f"Total: {report['elapsed_seconds']:.3f} s, {report['words_per_second']:,.0f} WORDs/s")
+    for stage, seconds in report["stage_seconds"].items():
+        print(f"    {stage:<16}{seconds:10.4f} s")
+    for cache, hit_rate in report["cache_hit_rates"].items():
+        print(f"Cache {cache}: {hit_rate:.1%} hits")
+    if report["peak_rss_bytes"] is not None:
+        print(f"Peak RSS: {report['peak_rss_bytes'] / (1 << 20):.1f} MiB")
+    for parameters, count in report["chain_counts"].items():
+        print(f"ROPchains_{parameters}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the ROPchain detection on a dump folder.")
+    parser.add_argument("folder_name", nargs="?",
+                        help="Dump folder to analyze. If omitted, a synthetic dump folder is generated")
+    parser.add_argument("--x", nargs="+", type=int, default=[8, 6, 4, 2], help="List of values for x")
+    parser.add_argument("--y", nargs="+", type=int, default=[2, 3, 4, 5], help="List of values for y")
+    add_gadget_filter_arguments(parser)
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes used to scan the stack files")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    add_synthetic_dump_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        folder_name = args.folder_name
+        if folder_name is None:
+            folder_name = os.path.join(temp_dir, "synthetic_dump")
+            generate_dump_folder_from_arguments(folder_name, args)
+        report = run_benchmark(folder_name, args.x, args.y, build_gadget_filter(args),
+                               os.path.join(temp_dir, "analysis_results"), args.jobs)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
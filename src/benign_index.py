@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import time
+from typing import List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+
+BENIGN_INDEX_VERSION = 1  # increase when the keys or the format of the index change
+BLOOM_BITS_PER_KEY = 16  # about 0.05% false positives with BLOOM_HASH_COUNT hashes
+BLOOM_HASH_COUNT = 8
+
+
+def mix64(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer: a bijection of uint64 that spreads every input bit over the whole output.
+    """
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def get_region_keys(dmp_info: List[dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the lowest address of every region, the first 64 bits of its SHA-256 and whether it has one.
+    """
+    region_starts = np.zeros(max(len(dmp_info), 1), dtype=np.uint64)
+    sha256_keys = np.zeros(max(len(dmp_info), 1), dtype=np.uint64)
+    has_sha256 = np.zeros(max(len(dmp_info), 1), dtype=bool)
+    for region_id, region in enumerate(dmp_info):
+        region_starts[region_id] = region["Memory region"][0]
+        if region["SHA-256"]:
+            sha256_keys[region_id] = int(region["SHA-256"][:16], 16)
+            has_sha256[region_id] = True
+    return region_starts, sha256_keys, has_sha256
+
+
+def get_return_site_keys(fm: ProcessDumpManager, addresses: np.ndarray,
+                         region_keys: Tuple[np.ndarray, np.ndarray, np.ndarray] | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the ASLR independent key of every address: a 64-bit hash of the SHA-256 of the IMG region that
+    contains it and of its offset inside the region, so the same return site of a module has the same key
+    in every dump, wherever the module is loaded.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance of the dump folder.
+        addresses (np.ndarray): Array of addresses.
+        region_keys (Tuple[np.ndarray, np.ndarray, np.ndarray] | None): get_region_keys of the dump, computed
+            here if not given.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The uint64 key of every address and a mask that is False where the
+        address is not in an IMG region with a SHA-256 (its key is then meaningless).
+    """
+    region_starts, sha256_keys, has_sha256 = region_keys if region_keys is not None else get_region_keys(fm.dmp_info)
+    addresses = np.asarray(addresses, dtype=np.uint64)
+    region_ids = fm.region_index.lookup_many(addresses)
+    is_valid = region_ids >= 0
+    is_valid[is_valid] = has_sha256[region_ids[is_valid]]
+    region_ids = np.where(is_valid, region_ids, 0)
+    offsets = addresses - region_starts[region_ids]
+    return mix64(sha256_keys[region_ids] ^ offsets), is_valid
+
+
+class BenignIndex:
+    def __init__(self, keys: np.ndarray, metadata: dict | None = None, bloom_bits_per_key: int = BLOOM_BITS_PER_KEY):
+        """
+        Set of known-benign return sites (see get_return_site_keys), e.g. the ordinary return addresses seen
+        in dumps of clean processes. The keys are kept as a sorted array, with a Bloom filter in front so
+        most of the addresses that are not in the set are rejected with one hash and a few bit tests,
+        without searching the array.
+
+        Args:
+            keys (np.ndarray): uint64 keys of the benign return sites.
+            metadata (dict | None): Information about how the index was built, stored with it.
+            bloom_bits_per_key (int): Size of the Bloom filter.
+        """
+        self.keys = np.unique(np.asarray(keys, dtype=np.uint64))
+        self.metadata = dict(metadata or {}, key_count=len(self.keys))
+        bit_count = 64
+        while bit_count < len(self.keys) * bloom_bits_per_key:
+            bit_count <<= 1
+        self.bloom_mask = np.uint64(bit_count - 1)
+        is_set = np.zeros(bit_count, dtype=bool)
+        is_set[self.get_bloom_positions(self.keys).ravel()] = True
+        self.bloom = np.packbits(is_set, bitorder='little')  # bit i is bit i % 8 of byte i // 8
+        self.region_keys = None  # get_region_keys of the last dump checked
+        self.region_keys_source = None  # its dmp_info
+
+    def get_bloom_positions(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Returns the BLOOM_HASH_COUNT bit positions of every key, by double hashing, shape (len(keys), count).
+        """
+        hashes = mix64(keys)
+        first = hashes & np.uint64(0xFFFFFFFF)
+        step = (hashes >> np.uint64(32)) | np.uint64(1)
+        return (first[:, None] + step[:, None] * np.arange(BLOOM_HASH_COUNT, dtype=np.uint64)[None, :]) & self.bloom_mask
+
+    def contains_keys(self, keys: np.ndarray) -> np.ndarray:
+        positions = self.get_bloom_positions(keys)
+        bits = (self.bloom[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        maybe = bits.all(axis=1)
+        # the Bloom filter has false positives, the keys that pass it are confirmed in the sorted array
+        candidates = keys[maybe]
+        found = np.searchsorted(self.keys, candidates)
+        found = np.minimum(found, max(len(self.keys) - 1, 0))
+        maybe[maybe] = self.keys[found] == candidates if len(self.keys) else False
+        return maybe
+
+    def are_benign(self, fm: ProcessDumpManager, addresses: np.ndarray) -> np.ndarray:
+        """
+        Checks, for every address at once, if it is a known-benign return site.
+
+        Returns:
+            np.ndarray: Boolean mask, True where the address is in the index.
+        """
+        if self.region_keys_source is not fm.dmp_info:
+            self.region_keys = get_region_keys(fm.dmp_info)
+            self.region_keys_source = fm.dmp_info
+        keys, is_valid = get_return_site_keys(fm, addresses, self.region_keys)
+        is_benign = np.zeros(len(keys), dtype=bool)
+        is_benign[is_valid] = self.contains_keys(keys[is_valid])
+        return is_benign
+
+    def __getstate__(self) -> dict:
+        # the keys of the regions are computed again by worker processes
+        return dict(self.__dict__, region_keys=None, region_keys_source=None)
+
+    def get_signature(self) -> dict:
+        """
+        Identifies the contents of the index, for caches of results that depend on it.
+        """
+        return {"created": self.metadata.get("created"), "key_count": len(self.keys)}
+
+    def save(self, file_path: str):
+        metadata = dict(self.metadata, version=BENIGN_INDEX_VERSION)
+        with open(file_path + ".tmp", 'wb') as index_file:
+            np.savez(index_file, keys=self.keys, metadata=np.array(json.dumps(metadata)))
+        os.replace(file_path + ".tmp", file_path)
+
+
+def load_benign_index(file_path: str) -> BenignIndex:
+    """
+    Loads an index saved by BenignIndex.save. The Bloom filter is built again, which is fast.
+
+    Raises:
+        ValueError: If the file has another version.
+    """
+    with np.load(file_path) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata.get("version") != BENIGN_INDEX_VERSION:
+            raise ValueError(f"{file_path} is not a benign return site index of version {BENIGN_INDEX_VERSION}")
+        keys = data["keys"]
+    return BenignIndex(keys, metadata)
+
+
+def build_benign_index(folder_names: List[str], gadget_filter=None, min_dumps: int = 1) -> BenignIndex:
+    """
+    Builds the index from a corpus of dumps of clean processes: every gadget hit of their stacks is taken
+    as a benign return site.
+
+    Args:
+        folder_names (List[str]): The dump folders of the corpus.
+        gadget_filter (GadgetFilter | None): Decides which WORDs are gadget hits. By default every WORD that
+            points to an IMG region.
+        min_dumps (int): Minimum number of dumps a return site must be found in to be kept, to leave out
+            stale pointers that only happen to be in one stack.
+
+    Returns:
+        BenignIndex: The index.
+    """
+    # imported here, rop_chains and gadget_filter import this module
+    from rop_chains import scan_stacks
+    from gadget_filter import GadgetFilter
+
+    if gadget_filter is None:
+        gadget_filter = GadgetFilter()
+    dump_keys = []
+    for folder_name in folder_names:
+        fm = ProcessDumpManager(folder_name)
+        try:
+            region_keys = get_region_keys(fm.dmp_info)
+            keys = [get_return_site_keys(fm, stack_hits.hit_values, region_keys) for stack_hits in
+                    scan_stacks(fm, gadget_filter) if len(stack_hits.hit_values)]
+        finally:
+            fm.close()
+        dump_keys.append(np.unique(np.concatenate([stack_keys[is_valid] for stack_keys, is_valid in keys]
+                                                  or [np.zeros(0, dtype=np.uint64)])))
+        print(f"Done: {folder_name} ({len(dump_keys[-1])} return sites)")
+
+    keys, counts = np.unique(np.concatenate(dump_keys or [np.zeros(0, dtype=np.uint64)]), return_counts=True)
+    metadata = {"created": time.time(), "dump_count": len(folder_names), "min_dumps": min_dumps,
+                "call_filter": gadget_filter.call_filter}
+    return BenignIndex(keys[counts >= min_dumps], metadata)
+
+
+if __name__ == "__main__":
+    from batch import list_dump_folders
+    from gadget_filter import build_gadget_filter, add_gadget_filter_arguments
+
+    parser = argparse.ArgumentParser(description="Builds the index of known-benign return sites from dumps of "
+                                                 "clean processes, used with --benign-index.")
+    parser.add_argument("output", help="File of the index (.npz)")
+    parser.add_argument("source", help="Directory of clean dump folders or manifest file with one folder per line")
+    parser.add_argument("--min-dumps", type=int, default=1,
+                        help="Minimum number of dumps a return site must be found in to be kept")
+    add_gadget_filter_arguments(parser)
+    args = parser.parse_args()
+    args.benign_index = None  # the corpus is not filtered by another index
+
+    index = build_benign_index(list_dump_folders(args.source), build_gadget_filter(args), args.min_dumps)
+    index.save(args.output)
+    print(f"{len(index.keys)} benign return sites saved to {args.output}")
@@ -0,0 +1,239 @@
+import numpy as np
+from typing import Tuple
+from process_dump_manager import ProcessDumpManager
+
+# Define the size of the instruction in bytes for each instruction depending on the bitness
+# Use the opcode as the key to the dictionary and the bitness as the key to the nested dictionary
+CALL_INSTRUCTION_SIZES = {
+    0xE8: {  # CALL rel16 or rel32 (near relative direct)
+        # 32: [5, 3],  # rel16 (with operand override) or rel32
+        32: [5],  # rel16 (with operand override) or rel32
+        64: [5],  # rel32 (always 32-bit relative offset in 64-bit mode)
+    },
+    0x9A: {  # CALL ptr16:16 or ptr16:32 (far absolute direct)
+        # 32: [7, 3],  # ptr16:32
+        32: [7],  # ptr16:32
+        64: None,  # Not valid in 64-bit mode
+    },
+    0xFF: {
+        2: {
+            # CALL r/m16, r/m32, r/m64 (near absolute indirect)
+            # 32: [2, 3, 6, 7, 10, 4, 7, 8, 11],  # r/m32 [reg, reg+disp8, reg+disp32 and mem, mem+disp8, mem+disp32, SIB+reg, ...]
+            # 64: [2, 3, 6, 10, 11, 14, 4, 7, 12],  # r/m64 [reg, reg+disp8, reg+disp32, mem+disp8, mem+disp32, SIB+reg, ...]
+            # Mejor los valores más comunes (sin disp ni SIB)
+            32: [2, 6],  # reg y mem
+            64: [2, 10],  # reg y mem
+        },
+        3: {
+            # and CALL m16:16, m16:32, m16:64 (far absolute indirect)
+            # 32: [8, 6],  # m16:16, m16:32
+            32: [8],  # m16:16, m16:32
+            64: [12],  # m16:64
+        },
+    }
+}
+
+
+def is_prev_instruction_call(fm: ProcessDumpManager, address: int) -> bool:
+    """
+    Check if the previous instruction at the given address is an x86 CALL instruction.
+    The instruction is read from the memory dump files using the FileManager instance.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        address (int): Address of the instruction to check.
+
+    Returns:
+        bool: True if the previous instruction is a CALL instruction, False otherwise.
+    """
+    # check if 0xE8
+    possible_instruction_sizes = CALL_INSTRUCTION_SIZES[0xE8][fm.bitness]
+    for size in possible_instruction_sizes:
+        call_instruction = fm.access_img_dump_file(address - size)
+        if call_instruction is None:
+            return False
+        if call_instruction[0] == 0xE8:
+            return True
+
+    # check if 0x9A
+    possible_instruction_sizes = CALL_INSTRUCTION_SIZES[0x9A][fm.bitness]
+    if possible_instruction_sizes is not None:
+        for size in possible_instruction_sizes:
+            call_instruction = fm.access_img_dump_file(address - size)
+            if call_instruction is None:
+                return False
+            if call_instruction[0] == 0x9A:
+                return True
+
+    # check if 0xFF /2
+    possible_instruction_sizes = CALL_INSTRUCTION_SIZES[0xFF][2][fm.bitness]
+    for size in possible_instruction_sizes:
+        call_instruction = fm.access_img_dump_file(address - size)
+        if call_instruction is None:
+            return False
+        if call_instruction[0] == 0xFF:
+            if len(call_instruction) < 2:
+                return False
+            modrm = call_instruction[1]
+            reg = (modrm & 0b00111000) >> 3  # Extract Reg bits
+            # near absolute indirect requires Reg field to be 2
+            if reg == 2:
+                return True
+
+    # check if 0xFF /3
+    possible_instruction_sizes = CALL_INSTRUCTION_SIZES[0xFF][3][fm.bitness]
+    for size in possible_instruction_sizes:
+        call_instruction = fm.access_img_dump_file(address - size)
+        if call_instruction is None:
+            return False
+        if call_instruction[0] == 0xFF:
+            if len(call_instruction) < 2:
+                return False
+            modrm = call_instruction[1]
+            reg = (modrm & 0b00111000) >> 3
+            # far absolute indirect requires Reg field to be 3
+            if reg == 3:
+                return True
+
+    return False
+
+
+# Lookup tables for the batch check. Every encoding is identified by the number of bytes between its
+# opcode and the return address, which is the full length of the instruction (prefixes excluded).
+MAX_CALL_INSTRUCTION_SIZE = 8  # 9A ptr16:32 (7 bytes) plus room for the operand size override prefix
+CALL_DECODER_VERSION = 1  # increase when decode_call_instructions changes, so stored return site bitmaps are rebuilt
+OPERAND_SIZE_OVERRIDE_PREFIX = 0x66
+
+# Reg field (bits 5-3) of every ModRM byte, the opcode extension for 0xFF
+MODRM_REG = (np.arange(256, dtype=np.uint8) >> 3) & 0b111
+
+
+def build_ff_instruction_lengths() -> np.ndarray:
+    """
+    Builds the table with the length of a 0xFF instruction (opcode + ModRM + SIB + displacement) indexed
+    by its ModRM and SIB bytes. The SIB byte only matters when the ModRM byte requires one. The lengths are
+    the same for 32-bit and 64-bit code (in 64-bit mode, mod 00 r/m 101 is RIP + disp32 instead of disp32).
+
+    Returns:
+        np.ndarray: uint8 array of shape (256, 256).
+    """
+    modrm = np.arange(256)[:, None]
+    sib = np.arange(256)[None, :]
+    mod = modrm >> 6
+    rm = modrm & 0b111
+    has_sib = (mod != 3) & (rm == 0b100)
+    displacement = np.select(
+        [mod == 1, mod == 2, (mod == 0) & (rm == 0b101), (mod == 0) & has_sib & ((sib & 0b111) == 0b101)],
+        [1, 4, 4, 4],
+        0
+    )
+    return (2 + has_sib + displacement).astype(np.uint8)
+
+
+FF_INSTRUCTION_LENGTHS = build_ff_instruction_lengths()
+FF_INSTRUCTION_SIZES = sorted(set(FF_INSTRUCTION_LENGTHS.ravel().tolist()))  # 2, 3, 4, 6, 7
+
+# Sizes of the direct CALL encodings depending on the bitness, with the prefix that the encoding
+# needs right before the opcode (None if it needs no prefix)
+DIRECT_CALL_ENCODINGS = {
+    0xE8: {
+        32: [(5, None), (3, OPERAND_SIZE_OVERRIDE_PREFIX)],  # rel32, rel16
+        64: [(5, None)],  # rel32
+    },
+    0x9A: {
+        32: [(7, None), (5, OPERAND_SIZE_OVERRIDE_PREFIX)],  # ptr16:32, ptr16:16
+        64: [],  # Not valid in 64-bit mode
+    },
+}
+
+
+def gather_preceding_bytes(fm: ProcessDumpManager, addresses: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the count bytes that precede each address from the memory mapped IMG dump files. Column k of
+    the result holds the byte at address - (count - k), so the byte at address - size is in column count - size.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        addresses (np.ndarray): Array of addresses.
+        count (int): Number of bytes to read before each address.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: uint8 matrix of shape (len(addresses), count) with the bytes and a
+        boolean matrix of the same shape that is False where the byte is not in any IMG dump file.
+    """
+    positions = np.asarray(addresses, dtype=np.uint64)[:, None] - np.arange(count, 0, -1, dtype=np.uint64)[None, :]
+    region_ids = fm.region_index.lookup_many(positions)
+    preceding_bytes = np.zeros(positions.shape, dtype=np.uint8)
+    available = region_ids >= 0
+
+    for region_id in np.unique(region_ids[available]).tolist():
+        selected = region_ids == region_id
+        region_bytes = fm.get_img_region_array(region_id)
+        offsets = positions[selected] - np.uint64(fm.dmp_info[region_id]["Memory region"][0])
+        in_file = offsets < len(region_bytes)
+        if len(region_bytes):
+            preceding_bytes[selected] = np.where(in_file, region_bytes[np.minimum(offsets, len(region_bytes) - 1)], 0)
+        available[selected] = in_file
+
+    return preceding_bytes, available
+
+
+def are_prev_instructions_call(fm: ProcessDumpManager, addresses: np.ndarray) -> np.ndarray:
+    """
+    Batch version of is_prev_instruction_call. Checks, for every address at once, if the bytes before it
+    end with an x86 CALL instruction (see decode_call_instructions).
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        addresses (np.ndarray): Array of candidate return addresses.
+
+    Returns:
+        np.ndarray: Boolean mask, True where the previous instruction is a CALL instruction.
+    """
+    preceding_bytes, available = gather_preceding_bytes(fm, addresses, MAX_CALL_INSTRUCTION_SIZE)
+    return decode_call_instructions(preceding_bytes, available, fm.bitness)
+
+
+def decode_call_instructions(preceding_bytes: np.ndarray, available: np.ndarray, bitness: int) -> np.ndarray:
+    """
+    Checks, for every row of MAX_CALL_INSTRUCTION_SIZE bytes, if the row ends with an x86 CALL instruction:
+    E8 (near relative), 9A (far absolute, 32-bit only) and FF /2, FF /3 (near and far absolute indirect)
+    with every ModRM/SIB/displacement length. An encoding is accepted only when its length decoded from
+    the ModRM and SIB bytes ends exactly at the end of the row.
+
+    Args:
+        preceding_bytes (np.ndarray): uint8 matrix of shape (n, MAX_CALL_INSTRUCTION_SIZE), as returned by
+            gather_preceding_bytes.
+        available (np.ndarray): Boolean matrix of the same shape, False where the byte is unknown.
+        bitness (int): Bitness of the process.
+
+    Returns:
+        np.ndarray: Boolean mask, True where the row ends with a CALL instruction.
+    """
+    def byte_before(size: int) -> np.ndarray:
+        column = MAX_CALL_INSTRUCTION_SIZE - size
+        return np.where(available[:, column], preceding_bytes[:, column].astype(np.int16), -1)
+
+    is_call = np.zeros(len(preceding_bytes), dtype=bool)
+
+    for opcode, encodings in DIRECT_CALL_ENCODINGS.items():
+        for size, prefix in encodings[bitness]:
+            matches = byte_before(size) == opcode
+            if prefix is not None:
+                matches &= byte_before(size + 1) == prefix
+            is_call |= matches
+
+    for size in FF_INSTRUCTION_SIZES:
+        opcode = byte_before(size)
+        modrm = byte_before(size - 1)
+        sib = byte_before(size - 2) if size > 2 else np.zeros_like(modrm)
+        candidates = (opcode == 0xFF) & (modrm >= 0) & (sib >= 0)
+        modrm = np.where(candidates, modrm, 0)
+        sib = np.where(candidates, sib, 0)
+        reg = MODRM_REG[modrm]
+        ends_at_address = FF_INSTRUCTION_LENGTHS[modrm, sib] == size
+        near = reg == 2
+        far = (reg == 3) & ((modrm >> 6) != 3)  # the far pointer is always in memory
+        is_call |= candidates & ends_at_address & (near | far)
+
+    return is_call
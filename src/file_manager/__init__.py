@@ -1 +0,0 @@
-import process_dump_manager
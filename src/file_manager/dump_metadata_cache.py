@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+from typing import List
+
+METADATA_INDEX_VERSION = 3  # increase when the parsed information or its format changes
+METADATA_INDEX_SUFFIX = ".rop_index.json"
+
+
+def get_metadata_index_path(folder_name: str) -> str:
+    """
+    Returns the path of the metadata index of a dump folder, a file next to the folder.
+    """
+    return folder_name.rstrip("\\/") + METADATA_INDEX_SUFFIX
+
+
+def get_source_signature(source_paths: List[str]) -> List[List[int] | None] | None:
+    """
+    Returns the (size, modification time) of every source file, None for the ones that do not exist (e.g.
+    the optional data/results.txt), or None if one of them cannot be read.
+    """
+    signature = []
+    for source_path in source_paths:
+        try:
+            file_stat = os.stat(source_path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        except OSError:
+            return None
+        signature.append([file_stat.st_size, file_stat.st_mtime_ns])
+    return signature
+
+
+def load_dump_metadata(folder_name: str, source_paths: List[str]) -> dict | None:
+    """
+    Loads the metadata index of a dump folder if it is still valid: same version and the source files
+    (the results.txt files it was parsed from) have the same size and modification time.
+
+    Args:
+        folder_name (str): The dump folder.
+        source_paths (List[str]): The files the metadata is parsed from.
+
+    Returns:
+        dict | None: The parsed metadata ("stack_info", "bitness", "dmp_info", "data_info" and, for some
+        archives, "storage_index"), or None if there is no valid index.
+    """
+    signature = get_source_signature(source_paths)
+    if signature is None:
+        return None
+
+    try:
+        with open(get_metadata_index_path(folder_name), 'r') as index_file:
+            index = json.load(index_file)
+    except (IOError, ValueError):
+        return None
+
+    if index.get("version") != METADATA_INDEX_VERSION or index.get("sources") != signature:
+        return None
+
+    metadata = index["metadata"]
+    for region in metadata["dmp_info"] + metadata["data_info"]:
+        region["Memory region"] = tuple(region["Memory region"])
+    return metadata
+
+
+def save_dump_metadata(folder_name: str, source_paths: List[str], metadata: dict):
+    """
+    Stores the parsed metadata of a dump folder in its metadata index, atomically. Every writer uses its own
+    temporary file, so processes loading the same folder at the same time (batch runs, the analysis server)
+    do not write into the same file. Errors are ignored (e.g. read-only evidence stores), the metadata is
+    then parsed again on the next run.
+    """
+    signature = get_source_signature(source_paths)
+    if signature is None:
+        return
+
+    index_path = get_metadata_index_path(folder_name)
+    index = {"version": METADATA_INDEX_VERSION, "sources": signature, "metadata": metadata}
+    try:
+        index_file = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(index_path)),
+                                                 prefix=os.path.basename(index_path), suffix=".tmp", delete=False)
+    except OSError:
+        return
+    try:
+        with index_file:
+            json.dump(index, index_file)
+        os.replace(index_file.name, index_path)
+    except OSError:
+        try:
+            os.remove(index_file.name)
+        except OSError:
+            pass
@@ -0,0 +1,676 @@
+import abc
+import bisect
+import io
+import mmap
+import os
+import struct
+import tarfile
+import zipfile
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # only needed for .tar.zst dump folders
+    zstandard = None
+
+STORAGE_BLOCK_SIZE = 1 << 20  # bytes decompressed at once for the random reads of compressed files
+MAX_CACHED_BYTES = 256 << 20  # bytes of decompressed blocks kept in memory by every archive, and of zstd frames
+MAX_CACHED_FRAME_SIZE = 16 << 20  # larger zstd frames are streamed instead of being decompressed whole
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar",)
+ZSTD_TAR_SUFFIXES = (".tar.zst", ".tar.zstd", ".tzst")
+
+
+def map_file(file) -> mmap.mmap | bytes:
+    """
+    Memory maps a whole file for reading. Empty files cannot be mapped and are returned as empty bytes.
+    """
+    try:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return b''
+
+
+def close_map(file_map: mmap.mmap | bytes):
+    if isinstance(file_map, mmap.mmap):
+        try:
+            file_map.close()
+        except BufferError:
+            # views of the map are still alive, it is released together with them
+            pass
+
+
+class BlockCache:
+    def __init__(self, max_bytes: int = MAX_CACHED_BYTES):
+        """
+        LRU cache of decompressed blocks of the files of an archive, keyed by (file, block number).
+
+        Args:
+            max_bytes (int): Maximum bytes of the blocks kept in memory. Larger blocks are not cached.
+        """
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.size = 0  # bytes of the cached blocks
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, read_block: Callable[[], bytes]) -> bytes:
+        block = self.blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self.blocks.move_to_end(key)
+            return block
+
+        self.misses += 1
+        block = read_block()
+        if len(block) <= self.max_bytes:
+            self.blocks[key] = block
+            self.size += len(block)
+            while self.size > self.max_bytes:
+                self.size -= len(self.blocks.popitem(last=False)[1])
+        return block
+
+
+class StorageMember(abc.ABC):
+    def __init__(self, size: int):
+        """
+        One file of a dump folder opened from a DumpStorage.
+
+        Args:
+            size (int): Size of the file in bytes.
+        """
+        self.size = size
+
+    @abc.abstractmethod
+    def read(self, offset: int, size: int) -> memoryview:
+        """
+        Returns size bytes at the given offset of the file, fewer if the file ends before.
+        """
+
+    @abc.abstractmethod
+    def get_buffer(self) -> memoryview:
+        """
+        Returns the whole contents of the file as an object supporting the buffer protocol.
+        """
+
+    def prefault(self):
+        """
+        Brings the contents of a memory mapped file into memory, so later accesses do not wait for the disk.
+        Safe to call from a background thread while other members of the same storage are used.
+        """
+        pass
+
+    def load(self) -> bool:
+        """
+        Reads the whole file into memory ahead of its use, from a background thread (see prefault). Files
+        read from a shared stream, like the compressed files of an archive, are left as they are.
+
+        Returns:
+            bool: True if the contents are in memory, and so get_buffer can be called from the thread.
+        """
+        self.prefault()
+        return False
+
+    def close(self):
+        pass
+
+
+class MappedMember(StorageMember):
+    def __init__(self, view: memoryview, file=None, file_map: mmap.mmap | bytes | None = None):
+        """
+        A file whose contents are a zero-copy view of a memory mapped file: a file of a directory or an
+        uncompressed file of an archive.
+
+        Args:
+            view (memoryview): The contents of the file.
+            file: File object to close together with the member, if it owns one.
+            file_map (mmap.mmap | bytes | None): Memory map to close together with the member, if it owns one.
+        """
+        super().__init__(len(view))
+        self.view = view
+        self.file = file
+        self.file_map = file_map
+
+    def read(self, offset: int, size: int) -> memoryview:
+        return self.view[offset:offset + size]
+
+    def get_buffer(self) -> memoryview:
+        return self.view
+
+    def prefault(self):
+        # touching one byte per page faults the pages in, numpy releases the GIL meanwhile
+        if len(self.view):
+            np.frombuffer(self.view, dtype=np.uint8)[::mmap.PAGESIZE].sum()
+
+    def load(self) -> bool:
+        if self.file is None:  # view of a mapped archive
+            self.prefault()
+            return True
+        # one large read of the file instead of page faults, the file and its map are not needed anymore
+        buffer = bytearray(len(self.view))
+        self.file.seek(0)
+        self.file.readinto(buffer)
+        self.view = memoryview(buffer)
+        close_map(self.file_map)
+        self.file_map = None
+        self.file.close()
+        self.file = None
+        return True
+
+    def close(self):
+        self.view = memoryview(b'')
+        if self.file_map is not None:
+            close_map(self.file_map)
+            self.file_map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BlockMember(StorageMember):
+    def __init__(self, key: str, size: int, read_block: Callable[[int], bytes], block_cache: BlockCache,
+                 block_size: int = STORAGE_BLOCK_SIZE):
+        """
+        A compressed file of an archive. Random reads decompress only the blocks of block_size bytes they
+        touch, and the blocks are kept in the block cache of the archive.
+
+        Args:
+            key (str): Name of the file in the archive, part of the keys of the block cache.
+            size (int): Size of the decompressed file in bytes.
+            read_block (Callable[[int], bytes]): Decompresses the block with the given number.
+            block_cache (BlockCache): Cache of decompressed blocks of the archive.
+            block_size (int): Size of a block in bytes.
+        """
+        super().__init__(size)
+        self.key = key
+        self.read_block = read_block
+        self.block_cache = block_cache
+        self.block_size = block_size
+        self.buffer = None  # whole contents, once get_buffer is called
+
+    def read(self, offset: int, size: int) -> memoryview:
+        if self.buffer is not None:
+            return self.buffer[offset:offset + size]
+        end = min(offset + size, self.size)
+        if end <= offset:
+            return memoryview(b'')
+
+        first_block, last_block = offset // self.block_size, (end - 1) // self.block_size
+        blocks = [self.block_cache.get((self.key, block_number), lambda: self.read_block(block_number))
+                  for block_number in range(first_block, last_block + 1)]
+        data = blocks[0] if len(blocks) == 1 else b''.join(blocks)
+        start = offset - first_block * self.block_size
+        return memoryview(data)[start:start + end - offset]
+
+    def get_buffer(self) -> memoryview:
+        # whole file accesses (e.g. decoding every offset of a region) decompress it once, without the cache
+        if self.buffer is None:
+            self.buffer = memoryview(b''.join(self.read_block(block_number) for block_number in
+                                              range(-(-self.size // self.block_size))))
+        return self.buffer
+
+    def close(self):
+        self.buffer = None
+
+
+class DumpStorage(abc.ABC):
+    def __init__(self, path: str):
+        """
+        Access to the files of a dump folder, given by their path relative to the folder with / as separator
+        (e.g. "stacks/results.txt"). Subclasses implement a plain directory and the supported archives.
+
+        Args:
+            path (str): The dump folder or archive.
+        """
+        self.path = path
+
+    def get_source_paths(self, names: List[str]) -> List[str]:
+        """
+        Returns the files of the file system whose size and modification time tell if the given files
+        changed (see dump_metadata_cache).
+        """
+        return [self.path]
+
+    def get_display_path(self, name: str) -> str:
+        return os.path.join(self.path, *name.split('/'))
+
+    @abc.abstractmethod
+    def open_member(self, name: str) -> StorageMember:
+        """
+        Opens a file of the dump folder.
+
+        Raises:
+            IOError: If the file does not exist or cannot be read.
+        """
+
+    def read_text(self, name: str) -> str:
+        member = self.open_member(name)
+        try:
+            return bytes(member.get_buffer()).decode('utf-8', errors='replace')
+        finally:
+            member.close()
+
+    def get_block_cache_stats(self) -> dict:
+        return {}
+
+    def get_index(self) -> dict | None:
+        """
+        Returns the JSON serializable information the storage found by reading the whole archive (e.g. where
+        every file is), stored in the metadata index of the dump folder so it is not read again. None if the
+        storage has nothing worth storing.
+        """
+        return None
+
+    def set_index(self, index: dict):
+        """
+        Restores the information returned by get_index.
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def __getstate__(self) -> dict:
+        return self.__dict__.copy()
+
+
+class DirectoryStorage(DumpStorage):
+    """
+    Plain dump folder on disk. Files are memory mapped, nothing is copied.
+    """
+
+    def get_source_paths(self, names: List[str]) -> List[str]:
+        return [self.get_display_path(name) for name in names]
+
+    def open_member(self, name: str) -> StorageMember:
+        file = open(self.get_display_path(name), 'rb')
+        file_map = map_file(file)
+        return MappedMember(memoryview(file_map), file, file_map)
+
+    def read_text(self, name: str) -> str:
+        with open(self.get_display_path(name), 'r') as file:
+            return file.read()
+
+
+class ArchiveStorage(DumpStorage):
+    def __init__(self, path: str, max_cached_bytes: int = MAX_CACHED_BYTES):
+        """
+        Dump folder stored in an archive. The folder may be the root of the archive or its only top-level
+        directory; its files are found by their path relative to it.
+
+        Args:
+            path (str): The archive.
+            max_cached_bytes (int): Maximum bytes of the decompressed blocks kept in memory.
+        """
+        super().__init__(path)
+        self.max_cached_bytes = max_cached_bytes
+        self.block_cache = BlockCache(max_cached_bytes)
+        self.archive_file = None
+        self.archive_map = None
+        self.members = None  # relative name -> archive specific information, see load_members
+
+    def __getstate__(self) -> dict:
+        # open archives, maps and caches are created again by worker processes, the list of files is kept
+        return dict(super().__getstate__(), archive_file=None, archive_map=None, block_cache=None)
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.block_cache = BlockCache(self.max_cached_bytes)
+
+    def get_archive_map(self) -> mmap.mmap | bytes:
+        if self.archive_map is None:
+            self.archive_file = open(self.path, 'rb')
+            self.archive_map = map_file(self.archive_file)
+        return self.archive_map
+
+    @abc.abstractmethod
+    def load_members(self) -> dict:
+        """
+        Returns the files of the archive, keyed by their full name inside the archive.
+        """
+
+    def get_members(self) -> dict:
+        if self.members is None:
+            members = self.load_members()
+            # the dump folder is the directory that contains results.txt
+            prefixes = [name[:-len("results.txt")] for name in members
+                        if name == "results.txt" or name.endswith("/results.txt")]
+            prefix = min((prefix for prefix in prefixes if not prefix.endswith("stacks/")), key=len, default="")
+            self.members = {name[len(prefix):]: member for name, member in members.items() if name.startswith(prefix)}
+        return self.members
+
+    def get_member_info(self, name: str):
+        member = self.get_members().get(name)
+        if member is None:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        return member
+
+    def get_display_path(self, name: str) -> str:
+        return f"{self.path}:{name}"
+
+    def get_block_cache_stats(self) -> dict:
+        return {"block_cache_hits": self.block_cache.hits, "block_cache_misses": self.block_cache.misses}
+
+    def close(self):
+        self.block_cache = BlockCache(self.max_cached_bytes)
+        if self.archive_map is not None:
+            close_map(self.archive_map)
+            self.archive_map = None
+        if self.archive_file is not None:
+            self.archive_file.close()
+            self.archive_file = None
+
+
+class ZipStorage(ArchiveStorage):
+    """
+    Dump folder stored in a .zip archive. Stored (uncompressed) files are zero-copy views of the memory
+    mapped archive, compressed files are read in blocks through the block cache.
+    """
+
+    def __init__(self, path: str, max_cached_bytes: int = MAX_CACHED_BYTES):
+        super().__init__(path, max_cached_bytes)
+        self.zip_file = None
+        self.zip_file_pid = None  # process that opened zip_file
+        self.open_files = {}  # name -> seekable decompressed stream of the file
+
+    def __getstate__(self) -> dict:
+        return dict(super().__getstate__(), zip_file=None, zip_file_pid=None, open_files={})
+
+    def get_zip_file(self) -> zipfile.ZipFile:
+        if self.zip_file is None or self.zip_file_pid != os.getpid():
+            # a forked worker process must not share the file offset of the archive with its parent
+            self.zip_file = zipfile.ZipFile(self.path)
+            self.zip_file_pid = os.getpid()
+            self.open_files = {}
+        return self.zip_file
+
+    def load_members(self) -> dict:
+        return {info.filename: info for info in self.get_zip_file().infolist() if not info.is_dir()}
+
+    def open_member(self, name: str) -> StorageMember:
+        info = self.get_member_info(name)
+        if info.compress_type == zipfile.ZIP_STORED:
+            # the data follows the local file header, whose name and extra field lengths may differ from
+            # the ones of the central directory
+            archive_map = self.get_archive_map()
+            name_length, extra_length = struct.unpack_from("<HH", archive_map, info.header_offset + 26)
+            data_offset = info.header_offset + 30 + name_length + extra_length
+            return MappedMember(memoryview(archive_map)[data_offset:data_offset + info.file_size])
+        return BlockMember(name, info.file_size, lambda block_number: self.read_block(name, block_number),
+                           self.block_cache)
+
+    def read_block(self, name: str, block_number: int) -> bytes:
+        zip_file = self.get_zip_file()
+        stream = self.open_files.get(name)
+        if stream is None:
+            stream = self.open_files[name] = zip_file.open(self.get_member_info(name))
+        # seeking forward decompresses up to the block, seeking backward starts again from the beginning
+        stream.seek(block_number * STORAGE_BLOCK_SIZE)
+        return stream.read(STORAGE_BLOCK_SIZE)
+
+    def close(self):
+        for stream in self.open_files.values():
+            stream.close()
+        self.open_files = {}
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+        super().close()
+
+
+class TarStorage(ArchiveStorage):
+    """
+    Dump folder stored in an uncompressed .tar archive. Files are zero-copy views of the memory mapped archive.
+    """
+
+    def load_members(self) -> dict:
+        with tarfile.open(self.path, 'r:') as tar_file:
+            return {info.name: (info.offset_data, info.size) for info in tar_file if info.isfile()}
+
+    def open_member(self, name: str) -> StorageMember:
+        offset, size = self.get_member_info(name)
+        return MappedMember(memoryview(self.get_archive_map())[offset:offset + size])
+
+
+def get_zstd_frame_size(data: mmap.mmap | bytes, offset: int) -> Tuple[int, int | None]:
+    """
+    Walks the headers of the zstd frame (or skippable frame) at the given offset without decompressing it.
+
+    Returns:
+        Tuple[int, int | None]: Compressed size of the frame and its decompressed size if the frame header
+        records it (None for skippable frames too).
+    """
+    magic, = struct.unpack_from("<I", data, offset)
+    if magic & 0xFFFFFFF0 == 0x184D2A50:  # skippable frame
+        return 8 + struct.unpack_from("<I", data, offset + 4)[0], None
+    if magic != 0xFD2FB528:
+        raise ValueError(f"Not a zstd frame at offset {offset}")
+
+    descriptor = data[offset + 4]
+    content_size_flag, single_segment = descriptor >> 6, (descriptor >> 5) & 1
+    content_size_length = (1 if single_segment else 0, 2, 4, 8)[content_size_flag]
+    position = offset + 5 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 3]
+    content_size = None
+    if content_size_length:
+        content_size = int.from_bytes(data[position:position + content_size_length], 'little')
+        content_size += 256 if content_size_length == 2 else 0
+    position += content_size_length
+
+    while True:
+        block_header = int.from_bytes(data[position:position + 3], 'little')
+        block_type, block_size = (block_header >> 1) & 3, block_header >> 3
+        position += 3 + (1 if block_type == 1 else block_size)  # RLE blocks store a single byte
+        if block_header & 1:
+            break
+    if descriptor & 4:  # content checksum
+        position += 4
+    return position - offset, content_size
+
+
+class ZstdTarStorage(ArchiveStorage):
+    """
+    Dump folder stored in a zstd compressed .tar archive. The archive is indexed by zstd frames once, then
+    random reads decompress only the frames they touch. Frames up to MAX_CACHED_FRAME_SIZE bytes are
+    decompressed whole and kept in a cache of frames, separate from the cache of blocks of the files.
+    Larger frames, like the single frame written by default by the zstd tool, are streamed: reads forward
+    continue the decompression where the last one stopped, reads backward start it again from the beginning
+    of the frame, and only the blocks of the files read are kept. Archives with small independent frames
+    (e.g. written by pzstd) are therefore much faster to read at random than single frame archives.
+    The frames and the files of the archive are found by decompressing it once, and stored in the metadata
+    index of the dump folder (see get_index). Requires the zstandard package.
+    """
+
+    def __init__(self, path: str, max_cached_bytes: int = MAX_CACHED_BYTES):
+        if zstandard is None:
+            raise ImportError("the zstandard package is required to read .tar.zst dump folders")
+        super().__init__(path, max_cached_bytes)
+        self.frame_cache = BlockCache(max_cached_bytes)  # decompressed frames, keyed by ("frame", frame number)
+        self.frame_stream = None  # (frame number, stream reader, position in the frame) of the streamed frame
+        self.frames = None  # (decompressed offsets, compressed offsets, compressed sizes) of the frames
+
+    def __getstate__(self) -> dict:
+        return dict(super().__getstate__(), frame_cache=None, frame_stream=None)
+
+    def __setstate__(self, state: dict):
+        super().__setstate__(state)
+        self.frame_cache = BlockCache(self.max_cached_bytes)
+
+    def get_frames(self) -> tuple:
+        if self.frames is None:
+            archive_map = self.get_archive_map()
+            decompressed_offsets, compressed_offsets, compressed_sizes = [], [], []
+            offset = decompressed_offset = 0
+            while offset < len(archive_map):
+                frame_size, content_size = get_zstd_frame_size(archive_map, offset)
+                if archive_map[offset] != 0x28:  # skippable frame, no data
+                    offset += frame_size
+                    continue
+                if content_size is None:
+                    content_size = self.get_streamed_frame_size(offset, frame_size)
+                decompressed_offsets.append(decompressed_offset)
+                compressed_offsets.append(offset)
+                compressed_sizes.append(frame_size)
+                decompressed_offset += content_size
+                offset += frame_size
+            decompressed_offsets.append(decompressed_offset)
+            self.frames = decompressed_offsets, compressed_offsets, compressed_sizes
+        return self.frames
+
+    def open_frame_stream(self, offset: int, size: int):
+        return zstandard.ZstdDecompressor().stream_reader(memoryview(self.get_archive_map())[offset:offset + size])
+
+    def get_streamed_frame_size(self, offset: int, size: int) -> int:
+        """
+        Returns the decompressed size of a frame whose header does not record it (e.g. compressed from a
+        pipe), decompressing it in blocks that are dropped.
+        """
+        content_size = 0
+        with self.open_frame_stream(offset, size) as reader:
+            while True:
+                chunk = reader.read(STORAGE_BLOCK_SIZE)
+                if not chunk:
+                    return content_size
+                content_size += len(chunk)
+
+    def decompress_frame(self, offset: int, size: int) -> bytes:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(self.get_archive_map()[offset:offset + size])
+
+    def read_streamed_frame(self, frame: int, start: int, size: int) -> bytes:
+        """
+        Returns size bytes at the given offset of a decompressed frame, fewer if it ends before, by
+        decompressing it sequentially.
+        """
+        _, compressed_offsets, compressed_sizes = self.get_frames()
+        if self.frame_stream is None or self.frame_stream[0] != frame or self.frame_stream[2] > start:
+            self.close_frame_stream()
+            self.frame_stream = (frame, self.open_frame_stream(compressed_offsets[frame], compressed_sizes[frame]), 0)
+        frame, reader, position = self.frame_stream
+        while position < start:
+            skipped = len(reader.read(min(STORAGE_BLOCK_SIZE, start - position)))
+            if not skipped:
+                break
+            position += skipped
+        data = []
+        remaining = size
+        while remaining:
+            chunk = reader.read(remaining)
+            if not chunk:
+                break
+            data.append(chunk)
+            remaining -= len(chunk)
+        self.frame_stream = (frame, reader, position + size - remaining)
+        return b''.join(data)
+
+    def read_decompressed(self, offset: int, size: int) -> bytes:
+        """
+        Returns size bytes at the given offset of the decompressed tar stream.
+        """
+        decompressed_offsets, compressed_offsets, compressed_sizes = self.get_frames()
+        end = min(offset + size, decompressed_offsets[-1])
+        data = []
+        frame = bisect.bisect_right(decompressed_offsets, offset) - 1
+        while offset < end:
+            start = offset - decompressed_offsets[frame]
+            if decompressed_offsets[frame + 1] - decompressed_offsets[frame] > MAX_CACHED_FRAME_SIZE:
+                chunk = self.read_streamed_frame(frame, start, end - offset)
+            else:
+                frame_data = self.frame_cache.get(
+                    ("frame", frame), lambda: self.decompress_frame(compressed_offsets[frame], compressed_sizes[frame])
+                )
+                chunk = frame_data[start:start + end - offset]
+            if not chunk:
+                break
+            data.append(chunk)
+            offset += len(chunk)
+            frame += 1
+        return b''.join(data)
+
+    def load_members(self) -> dict:
+        with tarfile.open(fileobj=DecompressedStream(self), mode='r:') as tar_file:
+            return {info.name: (info.offset_data, info.size) for info in tar_file if info.isfile()}
+
+    def open_member(self, name: str) -> StorageMember:
+        offset, size = self.get_member_info(name)
+        return BlockMember(name, size, lambda block_number: self.read_decompressed(
+            offset + block_number * STORAGE_BLOCK_SIZE, min(STORAGE_BLOCK_SIZE, size - block_number * STORAGE_BLOCK_SIZE)
+        ), self.block_cache)
+
+    def get_block_cache_stats(self) -> dict:
+        return dict(super().get_block_cache_stats(), frame_cache_hits=self.frame_cache.hits,
+                    frame_cache_misses=self.frame_cache.misses)
+
+    def get_index(self) -> dict:
+        return {"frames": [list(column) for column in self.get_frames()],
+                "members": {name: list(member) for name, member in self.get_members().items()}}
+
+    def set_index(self, index: dict):
+        self.frames = tuple(index["frames"])
+        self.members = {name: tuple(member) for name, member in index["members"].items()}
+
+    def close_frame_stream(self):
+        if self.frame_stream is not None:
+            self.frame_stream[1].close()
+            self.frame_stream = None
+
+    def close(self):
+        # the frame index is kept, it is only built once per archive
+        self.close_frame_stream()
+        self.frame_cache = BlockCache(self.max_cached_bytes)
+        super().close()
+
+
+class DecompressedStream(io.RawIOBase):
+    def __init__(self, storage: ZstdTarStorage):
+        """
+        Seekable read-only file object over the decompressed tar stream of a ZstdTarStorage, used to list
+        the files of the archive with tarfile.
+        """
+        self.storage = storage
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        size = self.storage.get_frames()[0][-1]
+        self.position = (offset, self.position + offset, size + offset)[whence]
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        data = self.storage.read_decompressed(self.position, len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def is_dump_archive(path: str) -> bool:
+    return path.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES + ZSTD_TAR_SUFFIXES)
+
+
+def open_dump_storage(path: str) -> DumpStorage:
+    """
+    Returns the storage of a dump folder: a plain directory, a .zip, .tar or .tar.zst archive of it, or a
+    Windows minidump file presented as a dump folder.
+    """
+    # imported here, minidump builds on this module
+    from minidump import MinidumpStorage, is_minidump
+
+    lower_path = path.lower()
+    if os.path.isfile(path) and is_minidump(path):
+        return MinidumpStorage(path)
+    if os.path.isdir(path) or not is_dump_archive(path):
+        return DirectoryStorage(path)
+    if lower_path.endswith(ZIP_SUFFIXES):
+        return ZipStorage(path)
+    if lower_path.endswith(TAR_SUFFIXES):
+        return TarStorage(path)
+    return ZstdTarStorage(path)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from dump_storage import StorageMember
+
+
+class ImgRegionCache:
+    def __init__(self, open_region_file: Callable[[int], StorageMember], max_open_handles: int = 64):
+        """
+        LRU bounded cache of open IMG dump files. Files stay open between accesses, so reading from a region
+        only opens its file the first time (or after it has been evicted). Files of a plain directory are
+        memory mapped, files of archives are read through their storage (see dump_storage).
+
+        Args:
+            open_region_file (Callable[[int], StorageMember]): Opens the IMG dump file of a region id.
+            max_open_handles (int): Maximum number of files kept mapped at the same time.
+        """
+        if max_open_handles < 1:
+            raise ValueError("max_open_handles must be at least 1")
+
+        self.open_region_file = open_region_file
+        self.max_open_handles = max_open_handles
+        self.entries = OrderedDict()  # region id -> StorageMember, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_read = 0  # bytes of the views returned by read and get_array
+
+    def get_member(self, region_id: int) -> StorageMember:
+        """
+        Returns the open IMG dump file of the region, opening it if it is not cached.
+
+        Raises:
+            IOError: If the file cannot be opened.
+        """
+        member = self.entries.get(region_id)
+        if member is not None:
+            self.hits += 1
+            self.entries.move_to_end(region_id)
+            return member
+
+        self.misses += 1
+        member = self.open_region_file(region_id)
+        self.entries[region_id] = member
+        if len(self.entries) > self.max_open_handles:
+            self.evictions += 1
+            self.release(next(iter(self.entries)))
+        return member
+
+    def read(self, region_id: int, offset: int, size: int) -> memoryview:
+        """
+        Returns size bytes at the given offset of the IMG dump file of the region, a zero-copy view if the
+        file is memory mapped. Shorter if the file ends before.
+        """
+        view = self.get_member(region_id).read(offset, size)
+        self.bytes_read += len(view)
+        return view
+
+    def get_array(self, region_id: int) -> np.ndarray:
+        """
+        Returns a uint8 array with the whole contents of the IMG dump file of the region, zero-copy if the
+        file is memory mapped.
+        """
+        region_array = np.frombuffer(self.get_member(region_id).get_buffer(), dtype=np.uint8)
+        self.bytes_read += len(region_array)
+        return region_array
+
+    def release(self, region_id: int):
+        """
+        Unmaps and closes the IMG dump file of the region.
+        """
+        self.entries.pop(region_id).close()
+
+    def close(self):
+        """
+        Unmaps and closes every cached file.
+        """
+        while self.entries:
+            self.release(next(iter(self.entries)))
+
+    def hit_rate(self) -> float:
+        accesses = self.hits + self.misses
+        return self.hits / accesses if accesses else 0.0
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit/miss counters of the cache, to size max_open_handles for dumps with many modules.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes_read": self.bytes_read,
+            "hit_rate": self.hit_rate(),
+            "open_handles": len(self.entries),
+            "max_open_handles": self.max_open_handles,
+        }
@@ -0,0 +1,372 @@
+import bisect
+import hashlib
+import struct
+from typing import List, Tuple
+
+from dump_storage import DumpStorage, MappedMember, StorageMember, close_map, map_file
+
+MINIDUMP_SIGNATURE = b'MDMP'
+
+# Stream types of the minidump stream directory
+THREAD_LIST_STREAM = 3
+MODULE_LIST_STREAM = 4
+MEMORY_LIST_STREAM = 5
+SYSTEM_INFO_STREAM = 7
+MEMORY64_LIST_STREAM = 9
+MEMORY_INFO_LIST_STREAM = 16
+
+PROCESSOR_ARCHITECTURE_BITNESS = {0: 32, 5: 32, 6: 64, 9: 64, 12: 64}  # x86, ARM, IA64, AMD64, ARM64
+IMAGE_FILE_MACHINE_BITNESS = {0x14C: 32, 0x1C4: 32, 0x8664: 64, 0xAA64: 64}  # i386, ARMNT, AMD64, ARM64
+PE_SIGNATURE = b'PE\0\0'
+DOS_HEADER_SIZE = 0x40  # up to e_lfanew, the offset of the PE signature
+MEM_COMMIT = 0x1000
+MEM_PRIVATE = 0x20000
+MEM_IMAGE = 0x1000000
+WRITABLE_PAGE_PROTECTIONS = 0x04 | 0x08 | 0x40 | 0x80  # PAGE_READWRITE, PAGE_WRITECOPY and their EXECUTE versions
+PAGE_PROTECTIONS = {
+    0x01: "PAGE_NOACCESS",
+    0x02: "PAGE_READONLY",
+    0x04: "PAGE_READWRITE",
+    0x08: "PAGE_WRITECOPY",
+    0x10: "PAGE_EXECUTE",
+    0x20: "PAGE_EXECUTE_READ",
+    0x40: "PAGE_EXECUTE_READWRITE",
+    0x80: "PAGE_EXECUTE_WRITECOPY",
+}
+PAGE_MODIFIERS = {0x100: "PAGE_GUARD", 0x200: "PAGE_NOCACHE", 0x400: "PAGE_WRITECOMBINE"}
+
+THREAD_STRUCT = struct.Struct("<IIIIQQII8x")  # MINIDUMP_THREAD, with its stack MINIDUMP_MEMORY_DESCRIPTOR
+MODULE_STRUCT = struct.Struct("<QIIII84x")  # MINIDUMP_MODULE, up to ModuleNameRva
+MEMORY_DESCRIPTOR_STRUCT = struct.Struct("<QII")  # MINIDUMP_MEMORY_DESCRIPTOR
+MEMORY_DESCRIPTOR64_STRUCT = struct.Struct("<QQ")  # MINIDUMP_MEMORY_DESCRIPTOR64
+MEMORY_INFO_STRUCT = struct.Struct("<QQI4xQIII4x")  # MINIDUMP_MEMORY_INFO
+
+
+def is_minidump(path: str) -> bool:
+    try:
+        with open(path, 'rb') as file:
+            return file.read(4) == MINIDUMP_SIGNATURE
+    except OSError:
+        return False
+
+
+def get_protection_name(protect: int) -> str:
+    """
+    Returns the PAGE_* name of a memory protection, with its modifiers (e.g. PAGE_READWRITE | PAGE_GUARD).
+    """
+    names = [PAGE_PROTECTIONS.get(protect & 0xFF, f"0x{protect & 0xFF:x}")]
+    names += [name for flag, name in PAGE_MODIFIERS.items() if protect & flag]
+    return " | ".join(names)
+
+
+class Minidump:
+    def __init__(self, data):
+        """
+        Parses the stream directory of a Windows minidump and the streams needed to find stacks and IMG
+        regions. Nothing is copied: the memory of the process is described as (address, size, offset in the
+        file) ranges.
+
+        Args:
+            data: The contents of the minidump file (usually its memory map).
+
+        Raises:
+            ValueError: If data is not a minidump or the bitness of the process cannot be found (see
+                parse_bitness).
+        """
+        if bytes(data[:4]) != MINIDUMP_SIGNATURE:
+            raise ValueError("Not a minidump file")
+        self.data = data
+        stream_count, directory_rva = struct.unpack_from("<II", data, 8)
+        self.streams = {}  # stream type -> (size, rva)
+        for stream_number in range(stream_count):
+            stream_type, size, rva = struct.unpack_from("<III", data, directory_rva + stream_number * 12)
+            self.streams.setdefault(stream_type, (size, rva))
+
+        self.memory_ranges = self.parse_memory_ranges()  # sorted (address, size, file offset)
+        self.range_starts = [memory_range[0] for memory_range in self.memory_ranges]
+        self.threads = self.parse_threads()
+        self.modules = self.parse_modules()
+        self.memory_info = self.parse_memory_info()
+        self.bitness = self.parse_bitness()
+
+    def parse_bitness(self) -> int:
+        """
+        Reads the bitness of the process from the processor architecture of the SystemInfo stream. Without
+        that stream (or with an unknown architecture), it is inferred from the machine of the PE headers of
+        the dumped modules, or else from addresses that do not fit in 32 bits.
+
+        Raises:
+            ValueError: If the bitness cannot be found.
+        """
+        if SYSTEM_INFO_STREAM in self.streams:
+            architecture, = struct.unpack_from("<H", self.data, self.streams[SYSTEM_INFO_STREAM][1])
+            if architecture in PROCESSOR_ARCHITECTURE_BITNESS:
+                return PROCESSOR_ARCHITECTURE_BITNESS[architecture]
+
+        for module in self.modules:
+            bitness = self.get_module_bitness(module["base_address"])
+            if bitness is not None:
+                return bitness
+        addresses = [thread["stack_address"] + thread["stack_size"] for thread in self.threads]
+        addresses += [memory_range[0] + memory_range[1] for memory_range in self.memory_ranges]
+        if any(address > 1 << 32 for address in addresses):
+            return 64
+        raise ValueError("The minidump has no SystemInfo stream with a known processor architecture and the "
+                         "bitness of the process cannot be inferred from its modules or addresses")
+
+    def get_module_bitness(self, base_address: int) -> int | None:
+        """
+        Returns the bitness of the machine of the PE header of a module, or None if its header is not dumped
+        or not valid.
+        """
+        dos_header = self.read_memory(base_address, DOS_HEADER_SIZE)
+        if dos_header is None or dos_header[:2] != b'MZ':
+            return None
+        pe_offset, = struct.unpack_from("<I", dos_header, 0x3C)
+        pe_header = self.read_memory(base_address + pe_offset, len(PE_SIGNATURE) + 2)
+        if pe_header is None or pe_header[:len(PE_SIGNATURE)] != PE_SIGNATURE:
+            return None
+        machine, = struct.unpack_from("<H", pe_header, len(PE_SIGNATURE))
+        return IMAGE_FILE_MACHINE_BITNESS.get(machine)
+
+    def parse_memory_ranges(self) -> List[Tuple[int, int, int]]:
+        """
+        Reads the Memory64List stream of full memory dumps, whose ranges are stored one after the other from
+        BaseRva, and the MemoryList stream of smaller dumps, whose ranges have their own Rva.
+        """
+        memory_ranges = []
+        if MEMORY64_LIST_STREAM in self.streams:
+            rva = self.streams[MEMORY64_LIST_STREAM][1]
+            range_count, offset = struct.unpack_from("<QQ", self.data, rva)
+            for address, size in MEMORY_DESCRIPTOR64_STRUCT.iter_unpack(
+                    self.data[rva + 16:rva + 16 + range_count * MEMORY_DESCRIPTOR64_STRUCT.size]):
+                memory_ranges.append((address, size, offset))
+                offset += size
+        if MEMORY_LIST_STREAM in self.streams:
+            rva = self.streams[MEMORY_LIST_STREAM][1]
+            range_count, = struct.unpack_from("<I", self.data, rva)
+            for address, size, offset in MEMORY_DESCRIPTOR_STRUCT.iter_unpack(
+                    self.data[rva + 4:rva + 4 + range_count * MEMORY_DESCRIPTOR_STRUCT.size]):
+                memory_ranges.append((address, size, offset))
+        memory_ranges.sort()
+        return memory_ranges
+
+    def parse_threads(self) -> List[dict]:
+        if THREAD_LIST_STREAM not in self.streams:
+            return []
+        rva = self.streams[THREAD_LIST_STREAM][1]
+        thread_count, = struct.unpack_from("<I", self.data, rva)
+        threads = []
+        for thread_number in range(thread_count):
+            tid, _, _, _, teb, stack_address, stack_size, stack_rva = THREAD_STRUCT.unpack_from(
+                self.data, rva + 4 + thread_number * THREAD_STRUCT.size
+            )
+            threads.append({"tid": tid, "teb": teb, "stack_address": stack_address, "stack_size": stack_size,
+                            "stack_rva": stack_rva})
+        return threads
+
+    def parse_modules(self) -> List[dict]:
+        if MODULE_LIST_STREAM not in self.streams:
+            return []
+        rva = self.streams[MODULE_LIST_STREAM][1]
+        module_count, = struct.unpack_from("<I", self.data, rva)
+        modules = []
+        for module_number in range(module_count):
+            base, size, _, _, name_rva = MODULE_STRUCT.unpack_from(self.data, rva + 4 + module_number * MODULE_STRUCT.size)
+            name_length, = struct.unpack_from("<I", self.data, name_rva)
+            name = bytes(self.data[name_rva + 4:name_rva + 4 + name_length]).decode('utf-16-le', errors='replace')
+            modules.append({"name": name, "base_address": base, "size": size})
+        return modules
+
+    def parse_memory_info(self) -> List[dict]:
+        if MEMORY_INFO_LIST_STREAM not in self.streams:
+            return []
+        rva = self.streams[MEMORY_INFO_LIST_STREAM][1]
+        header_size, entry_size, entry_count = struct.unpack_from("<IIQ", self.data, rva)
+        memory_info = []
+        for entry_number in range(entry_count):
+            address, _, _, size, state, protect, memory_type = MEMORY_INFO_STRUCT.unpack_from(
+                self.data, rva + header_size + entry_number * entry_size
+            )
+            memory_info.append({"base_address": address, "size": size, "state": state, "protect": protect,
+                                "type": memory_type})
+        return memory_info
+
+    def find_memory(self, address: int, size: int) -> Tuple[int, int] | None:
+        """
+        Returns the offset in the file of the memory at address and how many of the size bytes are dumped
+        contiguously from there, or None if the address is not in the dump.
+        """
+        range_number = bisect.bisect_right(self.range_starts, address) - 1
+        if range_number < 0:
+            return None
+        range_address, range_size, range_offset = self.memory_ranges[range_number]
+        if address >= range_address + range_size:
+            return None
+        return range_offset + address - range_address, min(size, range_address + range_size - address)
+
+    def read_memory(self, address: int, size: int) -> bytes | None:
+        """
+        Returns the size bytes of memory at address, or None if they are not all dumped contiguously.
+        """
+        memory = self.find_memory(address, size)
+        if memory is None or memory[1] < size:
+            return None
+        return bytes(self.data[memory[0]:memory[0] + size])
+
+    def get_stacks(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Returns the (tid, address, size, file offset) of the dumped stack of every thread. Full memory dumps
+        may not give the Rva of the stacks, they are then found in the memory ranges.
+        """
+        stacks = []
+        for thread in self.threads:
+            if thread["stack_size"] == 0:
+                continue
+            if thread["stack_rva"] and thread["stack_rva"] + thread["stack_size"] <= len(self.data):
+                stacks.append((thread["tid"], thread["stack_address"], thread["stack_size"], thread["stack_rva"]))
+                continue
+            memory = self.find_memory(thread["stack_address"], thread["stack_size"])
+            if memory is not None:
+                stacks.append((thread["tid"], thread["stack_address"], memory[1], memory[0]))
+        return stacks
+
+    def get_image_regions(self) -> List[Tuple[int, int, int, str]]:
+        """
+        Returns the (address, size, file offset, memory protection) of the dumped memory that belongs to
+        mapped images, split at the boundaries of the regions of the MemoryInfoList stream so every region
+        has a single protection. Without that stream, the ranges of the modules of the ModuleList stream
+        are used and the protection is unknown.
+        """
+        if self.memory_info:
+            image_regions = [(info["base_address"], info["size"], get_protection_name(info["protect"]))
+                             for info in self.memory_info if info["type"] == MEM_IMAGE]
+        else:
+            image_regions = [(module["base_address"], module["size"], "UNKNOWN") for module in self.modules]
+        return self.get_dumped_regions(image_regions)
+
+    def get_data_regions(self) -> List[Tuple[int, int, int, str]]:
+        """
+        Returns the (address, size, file offset, memory protection) of the dumped committed private memory
+        that is writable, e.g. the heap, where a pivoted stack can be placed. The stacks of the threads are
+        left out, they are scanned as stacks. Needs the MemoryInfoList stream.
+        """
+        stacks = [(thread["stack_address"], thread["stack_address"] + thread["stack_size"]) for thread in self.threads]
+        data_regions = [(info["base_address"], info["size"], get_protection_name(info["protect"]))
+                        for info in self.memory_info
+                        if info["type"] == MEM_PRIVATE and info["state"] == MEM_COMMIT
+                        and info["protect"] & WRITABLE_PAGE_PROTECTIONS
+                        and not any(low < info["base_address"] + info["size"] and info["base_address"] < high
+                                    for low, high in stacks)]
+        return self.get_dumped_regions(data_regions)
+
+    def get_dumped_regions(self, memory_regions: List[Tuple[int, int, str]]) -> List[Tuple[int, int, int, str]]:
+        """
+        Splits (address, size, memory protection) regions into the parts that are dumped contiguously.
+
+        Returns:
+            List[Tuple[int, int, int, str]]: (address, size, file offset, memory protection) of every part.
+        """
+        regions = []
+        for address, size, protection in sorted(memory_regions):
+            end = address + size
+            while address < end:
+                memory = self.find_memory(address, end - address)
+                if memory is None:
+                    # skip to the next dumped range
+                    range_number = bisect.bisect_right(self.range_starts, address)
+                    if range_number >= len(self.memory_ranges):
+                        break
+                    address = self.memory_ranges[range_number][0]
+                    continue
+                offset, dumped_size = memory
+                regions.append((address, dumped_size, offset, protection))
+                address += dumped_size
+        return regions
+
+
+class MinidumpStorage(DumpStorage):
+    """
+    Windows minidump presented as a dump folder: results.txt, stacks/results.txt, data/results.txt and the
+    region, stack and data files are generated from the streams, and every file is a zero-copy view of the
+    memory mapped minidump. The MEM_IMAGE memory is in results.txt and the writable private memory (see
+    Minidump.get_data_regions) in data/results.txt, so it is scanned but never taken as gadget targets.
+    The SHA-256 of every region is computed when results.txt is read, so with the metadata index it is
+    only done the first time a minidump is analyzed.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = None
+        self.file_map = None
+        self.members = None  # file name -> (offset, size)
+        self.image_regions = None  # (file name, memory protection) of every region file
+        self.data_regions = None  # (file name, memory protection) of every data region file, see get_data_regions
+        self.bitness = None
+
+    def __getstate__(self) -> dict:
+        return dict(super().__getstate__(), file=None, file_map=None)
+
+    def get_file_map(self):
+        if self.file_map is None:
+            self.file = open(self.path, 'rb')
+            self.file_map = map_file(self.file)
+        return self.file_map
+
+    def get_members(self) -> dict:
+        if self.members is None:
+            minidump = Minidump(self.get_file_map())
+            self.members = {}
+            for tid, address, size, offset in minidump.get_stacks():
+                self.members[f"stacks/{tid:x}_{address:x}_{size:x}.dmp"] = (offset, size)
+            self.image_regions = []
+            for address, size, offset, protection in minidump.get_image_regions():
+                file_name = f"{address:x}_{size:x}.dmp"
+                self.members[file_name] = (offset, size)
+                self.image_regions.append((file_name, protection))
+            self.data_regions = []
+            for address, size, offset, protection in minidump.get_data_regions():
+                file_name = f"{address:x}_{size:x}.dmp"
+                self.members["data/" + file_name] = (offset, size)
+                self.data_regions.append((file_name, protection))
+            self.bitness = minidump.bitness
+        return self.members
+
+    def get_display_path(self, name: str) -> str:
+        return f"{self.path}:{name}"
+
+    def read_text(self, name: str) -> str:
+        members = self.get_members()
+        if name == "stacks/results.txt":
+            lines = [f"Filename: {file_name[len('stacks/'):]}" for file_name in members if file_name.startswith("stacks/")]
+        elif name == "results.txt":
+            lines = [f"Bitness of the process: {self.bitness}"]
+            lines += self.get_region_lines(self.image_regions, "")
+        elif name == "data/results.txt":
+            lines = self.get_region_lines(self.data_regions, "data/")
+        else:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        return "\n".join(lines) + "\n"
+
+    def get_region_lines(self, regions: List[Tuple[str, str]], directory: str) -> List[str]:
+        lines = []
+        for file_name, protection in regions:
+            offset, size = self.get_members()[directory + file_name]
+            sha256 = hashlib.sha256(memoryview(self.get_file_map())[offset:offset + size]).hexdigest()
+            lines.append(f"Filename: {file_name}, SHA-256: {sha256}, Memory protection: {protection}")
+        return lines
+
+    def open_member(self, name: str) -> StorageMember:
+        member = self.get_members().get(name)
+        if member is None:
+            raise FileNotFoundError(f"{name} not found in {self.path}")
+        offset, size = member
+        return MappedMember(memoryview(self.get_file_map())[offset:offset + size])
+
+    def close(self):
+        if self.file_map is not None:
+            close_map(self.file_map)
+            self.file_map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -1,23 +1,50 @@
-from typing import List, Tuple, Union
+import numpy as np
+from typing import Iterator, List, Tuple, Union
+from dump_metadata_cache import load_dump_metadata, save_dump_metadata
+from dump_storage import StorageMember, open_dump_storage
+from img_region_cache import ImgRegionCache
+from region_index import RegionIndex
+from stack_prefetcher import PREFETCH_MEMORY_LIMIT, StackPrefetcher
+
+METADATA_SOURCE_FILES = ['stacks/results.txt', 'results.txt', 'data/results.txt']  # parsed by load_metadata
 
 
 class ProcessDumpManager:
-    def __init__(self, folder_name: str):
+    def __init__(self, folder_name: str, max_open_img_files: int = 64, use_metadata_index: bool = True,
+                 prefetch_depth: int = 0, prefetch_memory_limit: int = PREFETCH_MEMORY_LIMIT):
         """
         Initializes a FileManager object with the specified folder name. It parses the results.txt file
         inside the folder and stores the extracted information as attributes.
 
         Args:
-            folder_name (str): The name of the folder containing the results.txt file.
+            folder_name (str): The name of the folder containing the results.txt file, or a .zip, .tar or
+                .tar.zst archive of the folder, read without extracting it (see dump_storage).
+            max_open_img_files (int): Maximum number of IMG dump files kept memory mapped at the same time.
+            use_metadata_index (bool): Load the parsed results.txt files from the metadata index stored next
+                to the folder, and create it if it is missing or outdated (see dump_metadata_cache).
+            prefetch_depth (int): Number of stack dmp files loaded ahead by background threads in
+                iter_stack_words (see stack_prefetcher). 0 maps every file when it is reached.
+            prefetch_memory_limit (int): Maximum bytes of the stack dmp files loaded ahead.
         """
 
         self.folder_name = folder_name  # folder where the dmp files are
-        self.stack_info = self.parse_stacks_result_file()  # list of dictionaries with info related to the stack dmp files
-        self.bitness, self.dmp_info = self.parse_results_file() # bitness of the process and list of dictionaries with info related to the dmp files
+        self.storage = open_dump_storage(folder_name)  # access to the files of the folder or archive
+        try:
+            self.load_metadata(use_metadata_index)  # stack_info, bitness, dmp_info and data_info
+        except Exception:
+            self.storage.close()
+            raise
+        self.region_index = RegionIndex([region["Memory region"] for region in self.dmp_info])  # region ids are dmp_info positions
+        self.img_cache = ImgRegionCache(self.open_img_dump_file, max_open_img_files)  # open IMG dump files
         self.word_size = self.bitness // 8  # size of a word in bytes
+        self.word_dtype = np.dtype('<u4') if self.word_size == 4 else np.dtype('<u8')  # little endian WORD
         self.current_file_index = -1     # index for stack_info of the currently open file
-        self.current_file = None
+        self.current_file = None    # StorageMember of the currently open stack dmp file
         self.current_file_offset = 0    # next byte to read
+        self.current_mmap = None    # contents of the currently open stack dmp file, memory mapped if possible
+        self.current_words = None   # zero-copy view of current_mmap as an array of WORDs
+        self.prefetch_depth = prefetch_depth  # stack dmp files loaded ahead by iter_stack_words
+        self.prefetch_memory_limit = prefetch_memory_limit
 
         #print(f"folder_name: {self.folder_name}")
         #print(f"stack_info: {self.stack_info}")
@@ -28,41 +55,101 @@ class ProcessDumpManager:
         #print(f"current_file: {self.current_file}")
         #print(f"current_file_offset: {self.current_file_offset}")
 
+    def __getstate__(self) -> dict:
+        """
+        Pickles the parsed dump information and the region index, but not the open files, so the instance
+        can be sent to worker processes.
+        """
+        state = self.__dict__.copy()
+        state.update(current_file_index=-1, current_file=None, current_file_offset=0, current_mmap=None,
+                     current_words=None, img_cache=self.img_cache.max_open_handles)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.img_cache = ImgRegionCache(self.open_img_dump_file, state["img_cache"])
+
+    def get_stacks_results_file_path(self) -> str:
+        return self.storage.get_display_path('stacks/results.txt')
+
+    def get_results_file_path(self) -> str:
+        return self.storage.get_display_path('results.txt')
+
+    def get_metadata_source_paths(self) -> List[str]:
+        """
+        Returns the paths of the files the metadata is parsed from, whose signature tells if it changed.
+        """
+        return self.storage.get_source_paths(METADATA_SOURCE_FILES)
+
+    def load_metadata(self, use_metadata_index: bool = True):
+        """
+        Sets stack_info (list of dictionaries with info related to the stack dmp files), bitness (bitness of
+        the process), dmp_info (list of dictionaries with info related to the dmp files, sorted by address)
+        and data_info (same for the data dmp files, see parse_data_results_file), either from the metadata
+        index of the folder or by parsing the results.txt files.
+
+        Args:
+            use_metadata_index (bool): Use the metadata index of the folder.
+        """
+        source_paths = self.get_metadata_source_paths()
+        metadata = load_dump_metadata(self.folder_name, source_paths) if use_metadata_index else None
+
+        if metadata is None:
+            stack_info = self.parse_stacks_result_file()
+            bitness, dmp_info = self.parse_results_file()
+            if dmp_info is not None:
+                dmp_info.sort(key=lambda region: region["Memory region"])
+            data_info = sorted(self.parse_data_results_file(), key=lambda region: region["Memory region"])
+            metadata = {"stack_info": stack_info, "bitness": bitness, "dmp_info": dmp_info, "data_info": data_info}
+            storage_index = self.storage.get_index()
+            if storage_index is not None:
+                metadata["storage_index"] = storage_index
+            if use_metadata_index and stack_info is not None and dmp_info is not None:
+                save_dump_metadata(self.folder_name, source_paths, metadata)
+        elif "storage_index" in metadata:
+            # the archive does not have to be read again to find its files
+            self.storage.set_index(metadata["storage_index"])
+
+        self.stack_info = metadata["stack_info"]
+        self.bitness = metadata["bitness"]
+        self.dmp_info = metadata["dmp_info"]
+        self.data_info = metadata["data_info"]
+
     def parse_stacks_result_file(self) -> List[dict] | None:
         """
         Parses the results.txt file inside the folder specified during object initialization and extracts
-        thread ID, memory address, stack size, and file name from the filenames listed in the file.
+        thread ID, memory address, stack size, and file name from the filenames listed in the file, and the
+        SHA-256 of the files.
 
         Returns:
             List[dict]: A list of dictionaries, where each dictionary contains the file name, thread ID,
-            memory address, and stack size extracted from the filenames. Returns None if an error
+            memory address, stack size and SHA-256 extracted from the filenames. Returns None if an error
             occurs while opening or reading the file.
         """
 
-        file_path = self.folder_name + '\\stacks\\results.txt'
+        file_path = self.get_stacks_results_file_path()
         stack_info = []
 
         try:
-            with open(file_path, 'r') as file:
-                contents = file.read()
-                file.close()
-
-                lines = contents.split('\n')
-
-                for line in lines:
-                    if line.startswith('Filename:'):
-                        filename_parts = line.split(', SHA-256:')[0].split(' ')[1].split('_')[0:-1] + [line.split('_')[-1].split('.')[0]]
-                        file_name = filename_parts[0] + '_' + filename_parts[1] + '_' + filename_parts[2] + '.dmp'
-                        tid = int(filename_parts[0], 16)
-                        memory_address = filename_parts[1]
-                        stack_size = int(filename_parts[2], 16)
-
-                        stack_info.append({
-                            'file_name': file_name,
-                            'tid': tid,
-                            'memory_address': memory_address,
-                            'stack_size': stack_size
-                        })
+            contents = self.storage.read_text('stacks/results.txt')
+            lines = contents.split('\n')
+
+            for line in lines:
+                if line.startswith('Filename:'):
+                    filename_parts = line.split(', SHA-256:')[0].split(' ')[1].split('_')[0:-1] + [line.split('_')[-1].split('.')[0]]
+                    file_name = filename_parts[0] + '_' + filename_parts[1] + '_' + filename_parts[2] + '.dmp'
+                    tid = int(filename_parts[0], 16)
+                    memory_address = filename_parts[1]
+                    stack_size = int(filename_parts[2], 16)
+
+                    stack_info.append({
+                        'file_name': file_name,
+                        'tid': tid,
+                        'memory_address': memory_address,
+                        'base_address': int(memory_address, 16),
+                        'stack_size': stack_size,
+                        'SHA-256': line.split(', SHA-256:')[1].strip() if ', SHA-256:' in line else None
+                    })
 
             return stack_info
 
@@ -85,34 +172,19 @@ class ProcessDumpManager:
         :trows:
             IOError: If the file cannot be opened or read.
         """
-        file_path = self.folder_name + '\\results.txt'
+        file_path = self.get_results_file_path()
         dmp_list = []
 
         try:
-            with open(file_path, 'r') as file:
-                lines = file.readlines()
-                bitness = None
-
-                for line in lines:
-                    if line.startswith("Bitness of the process:"):
-                        bitness = int(line.split(":")[1].strip())
-
-                    elif line.startswith("Filename:"):
-                        lines_separated_by_comma = line.split(",")
-                        filename = lines_separated_by_comma[0].split(":")[1].strip()
-                        sha256 = lines_separated_by_comma[1].split(":")[1].strip()
-                        memory_protection = lines_separated_by_comma[2].split(":")[1].strip()
-                        lowest_memory_address = int(filename.split("_")[0], 16)
-                        highest_memory_address = lowest_memory_address + int(filename.split("_")[1].split(".")[0], 16) - 1
-
-                        dmp_info = {
-                            "Filename": filename,
-                            "SHA-256": sha256,
-                            "Memory protection": memory_protection,
-                            "Memory region": (lowest_memory_address, highest_memory_address)
-                        }
-
-                        dmp_list.append(dmp_info)
+            lines = self.storage.read_text('results.txt').splitlines(keepends=True)
+            bitness = None
+
+            for line in lines:
+                if line.startswith("Bitness of the process:"):
+                    bitness = int(line.split(":")[1].strip())
+
+                elif line.startswith("Filename:"):
+                    dmp_list.append(self.parse_region_line(line))
 
         except IOError:
             print(f"Error: Could not open or read file {file_path}")
@@ -120,44 +192,136 @@ class ProcessDumpManager:
 
         return bitness, dmp_list
 
+    def parse_region_line(self, line: str) -> dict:
+        """
+        Parses the "Filename: <lowest address>_<size>.dmp, SHA-256: ..., Memory protection: ..." line of a
+        region in results.txt or data/results.txt.
+        """
+        lines_separated_by_comma = line.split(",")
+        filename = lines_separated_by_comma[0].split(":")[1].strip()
+        sha256 = lines_separated_by_comma[1].split(":")[1].strip()
+        memory_protection = lines_separated_by_comma[2].split(":")[1].strip()
+        lowest_memory_address = int(filename.split("_")[0], 16)
+        highest_memory_address = lowest_memory_address + int(filename.split("_")[1].split(".")[0], 16) - 1
+
+        return {
+            "Filename": filename,
+            "SHA-256": sha256,
+            "Memory protection": memory_protection,
+            "Memory region": (lowest_memory_address, highest_memory_address)
+        }
+
+    def parse_data_results_file(self) -> List[dict]:
+        """
+        Parses the optional data/results.txt file, with the format of results.txt, that lists the dumped
+        memory that is not part of a mapped image (e.g. the heap), in data/<lowest address>_<size>.dmp files.
+        These regions are only scanned for ROPchains of pivoted stacks (see region_scan). They are not in
+        region_index, so their WORDs are never taken as gadget addresses.
+
+        Returns:
+            List[dict]: The regions, as the entries of dmp_info with data/ in their Filename. Empty if the
+            folder has no data/results.txt.
+        """
+        try:
+            lines = self.storage.read_text('data/results.txt').splitlines()
+        except IOError:
+            return []
+        return [dict(region, Filename='data/' + region["Filename"]) for region in
+                (self.parse_region_line(line) for line in lines if line.startswith("Filename:"))]
+
     def get_next_direction(self) -> Union[Tuple[int, bytes], None]:
         """
         Returns the next WORD pointed by the next address to be read from the current dmp file.
+        Thin wrapper over the memory mapped WORD array of the current file (see map_stack_dmp_file).
 
         Returns:
             Tuple[int, bytes] | None: A tuple containing the address and the WORD at that address in the current dmp file.
             Returns None if the end of the file is reached.
         """
 
-        try:
-            if self.current_file is None or \
-                    self.current_file_offset >= self.stack_info[self.current_file_index]['stack_size']:
-                return None
-        except IndexError as e:
-            print(f"IndexError occurred: {e}")
-            # Handle the error as needed, e.g., return a default value or log it
+        if self.current_words is None:
             return None
 
-        try:
-            self.current_file.seek(self.current_file_offset)
-            word = self.current_file.read(self.word_size)
-            m_a = self.stack_info[self.current_file_index]["memory_address"]
-            base_address = int(self.stack_info[self.current_file_index]["memory_address"], 16)
-            address = base_address + self.current_file_offset
-            self.current_file_offset += self.word_size
+        word_index = self.current_file_offset // self.word_size
+        if word_index >= len(self.current_words):  # End of file reached
+            self.close_current_stack_dmp_file()
+            return None
 
-            if len(word) < self.word_size:  # End of file reached
-                self.current_file.close()
-                self.current_file = None
-                self.current_file_offset = 0
-                return None
+        address = self.stack_info[self.current_file_index]['base_address'] + self.current_file_offset
+        word = bytes(self.current_mmap[self.current_file_offset:self.current_file_offset + self.word_size])
+        self.current_file_offset += self.word_size
 
-            return address, word
+        return address, word
+
+    def map_stack_dmp_file(self, index: int) -> np.ndarray | None:
+        """
+        Memory maps the stack dmp file at the given position of stack_info and makes it the current file
+        (files compressed in an archive are decompressed instead). The contents are exposed without copying
+        as an array of little endian WORDs (uint32 or uint64 depending on the bitness). Only the first
+        stack_size bytes of the file are part of the array and a trailing partial WORD is ignored.
 
+        Args:
+            index (int): Index of the file in the stack_info list.
+
+        Returns:
+            np.ndarray | None: The WORDs of the stack. Returns None if the file cannot be opened.
+        """
+        self.close_current_stack_dmp_file()
+        self.current_file_index = index
+        self.current_file_offset = 0
+
+        file_info = self.stack_info[index]
+        file_name = 'stacks/' + file_info['file_name']
+
+        try:
+            self.current_file = self.storage.open_member(file_name)
         except IOError:
-            print(f"Error: Could not read file {self.stack_info[self.current_file_index]['file_name']}")
+            print(f"Error: Could not open or read file {self.storage.get_display_path(file_name)}")
             return None
 
+        self.current_mmap = self.current_file.get_buffer()
+
+        word_count = min(file_info['stack_size'], len(self.current_mmap)) // self.word_size
+        self.current_words = np.frombuffer(self.current_mmap, dtype=self.word_dtype, count=word_count)
+        return self.current_words
+
+    def close_current_stack_dmp_file(self):
+        """
+        Releases the memory map and the handle of the currently open stack dmp file, if any.
+        """
+        self.current_words = None
+        self.current_mmap = None
+        if self.current_file is not None:
+            # if a caller still holds a view of the WORD array, the map is released with it
+            self.current_file.close()
+            self.current_file = None
+
+    def iter_stack_words(self) -> Iterator[Tuple[dict, np.ndarray]]:
+        """
+        Memory maps every stack dmp file in order and yields its WORDs, or loads them ahead in background
+        threads if prefetch_depth is set. Each array is only valid until the next one is requested.
+
+        Yields:
+            Tuple[dict, np.ndarray]: The stack_info entry of the file and its WORDs.
+        """
+        if self.prefetch_depth > 0:
+            prefetcher = StackPrefetcher(self, self.prefetch_depth, self.prefetch_memory_limit)
+            for index, member in prefetcher.iter_stack_files():
+                if member is None:
+                    print(f"Error: Could not open or read file "
+                          f"{self.storage.get_display_path('stacks/' + self.stack_info[index]['file_name'])}")
+                    continue
+                word_count = min(self.stack_info[index]['stack_size'], member.size) // self.word_size
+                yield self.stack_info[index], np.frombuffer(member.get_buffer(), dtype=self.word_dtype,
+                                                            count=word_count)
+            return
+
+        for index in range(len(self.stack_info)):
+            words = self.map_stack_dmp_file(index)
+            if words is not None:
+                yield self.stack_info[index], words
+        self.close_current_stack_dmp_file()
+
     def read_next_stack_dmp_file(self) -> bool:
         """
         Opens the next dmp file in the stack_info list for reading.
@@ -165,52 +329,91 @@ class ProcessDumpManager:
         Returns:
             bool: True if the next file is successfully opened for reading, False if there are no more files.
         """
-        self.current_file_offset = 0
-        self.current_file_index += 1
-
-        if self.current_file_index >= len(self.stack_info):
+        if self.current_file_index + 1 >= len(self.stack_info):
+            self.close_current_stack_dmp_file()
+            self.current_file_index = len(self.stack_info)
             return False
 
-        file_info = self.stack_info[self.current_file_index]
-        file_name = self.folder_name + "\\stacks\\" + file_info['file_name']
+        return self.map_stack_dmp_file(self.current_file_index + 1) is not None
 
-        try:
-            self.current_file = open(file_name, 'rb')
-            # print("File: ", self.current_file_index)
-            return True
+    def is_in_img_region(self, address: int) -> bool:
+        return self.region_index.contains(address)
+
+    def get_img_region_ids(self, words: np.ndarray) -> np.ndarray:
+        """
+        Finds the IMG region pointed by each WORD of an array at once.
+
+        Args:
+            words (np.ndarray): Array of WORDs, e.g. the result of map_stack_dmp_file.
+
+        Returns:
+            np.ndarray: The position in dmp_info of the region containing each WORD, -1 where there is none.
+        """
+        return self.region_index.lookup_many(words)
+
+    def get_img_dump_file_name(self, region_id: int) -> str:
+        return self.storage.get_display_path(self.dmp_info[region_id]["Filename"])
+
+    def open_img_dump_file(self, region_id: int) -> StorageMember:
+        return self.storage.open_member(self.dmp_info[region_id]["Filename"])
+
+    def read_img_dump_file(self, address: int, size: int) -> memoryview | None:
+        """
+        Returns a zero-copy view of size bytes at the specified address, read from the memory mapped IMG
+        dump file of the region that contains it. The view is shorter if the region ends before.
 
+        Args:
+            address (int): The address to be accessed in the IMG dump file.
+            size (int): Number of bytes to read.
+
+        Returns:
+            memoryview | None: The bytes at the address, or None if the address is not in any IMG region
+            or its file cannot be opened.
+        """
+        region_id = self.region_index.lookup(address)
+        if region_id < 0:
+            return None
+
+        try:
+            return self.img_cache.read(region_id, address - self.dmp_info[region_id]["Memory region"][0], size)
         except IOError:
-            print(f"Error: Could not open or read file {file_name}")
-            return False
+            print(f"Error: Could not open or read file {self.get_img_dump_file_name(region_id)}")
+            return None
 
-    def is_in_img_region(self, address: int) -> bool:
-        for region in self.dmp_info:
-            low, high = region["Memory region"]
-            if low <= address <= high:
-                return True
-        return False
+    def get_img_region_array(self, region_id: int) -> np.ndarray:
+        """
+        Returns the whole contents of the IMG dump file of a region as a zero-copy uint8 array.
+
+        Args:
+            region_id (int): Position of the region in dmp_info.
+
+        Returns:
+            np.ndarray: The bytes of the region. Empty if its file cannot be opened.
+        """
+        try:
+            return self.img_cache.get_array(region_id)
+        except IOError:
+            print(f"Error: Could not open or read file {self.get_img_dump_file_name(region_id)}")
+            return np.zeros(0, dtype=np.uint8)
 
     def access_img_dump_file(self, address: int) -> bytes | None:
         """
-        Opens the IMG dump file corresponding to the memory region containing the specified address and
-        returns the WORD at that address.
+        Returns the WORD at the specified address, read from the IMG dump file of the memory region that
+        contains it. The files are kept open in img_cache between calls.
 
         Param:
             int address: The address to be accessed in the IMG dump file.
         Returns:
             The WORD at the specified address in the IMG dump file.
         """
+        # big endian so the opcode is in the most significant bytes, like in a debugger's view
+        word = self.read_img_dump_file(address, self.word_size)
+        return None if word is None else word.tobytes()
 
-        for region in self.dmp_info:
-            low, high = region["Memory region"]
-            if low <= address <= high:
-                file_name = self.folder_name + "\\" + region["Filename"]
-                with open(file_name, 'rb') as file:
-                    #print(f"Accessing address {hex(address)} in file {file_name}")
-                    file.seek(address - low)
-                    word = file.read(self.word_size)
-                    #print(f"WORD at address {hex(address)}: {hex(int.from_bytes(word, byteorder='big'))}")
-                    # big endian so the opcode is in the most significant bytes, like in a debugger's view
-                    return word
-
-        return None
+    def close(self):
+        """
+        Releases the open stack dmp file and every cached IMG dump file.
+        """
+        self.close_current_stack_dmp_file()
+        self.img_cache.close()
+        self.storage.close()
@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+import numpy as np
+
+
+class RegionIndex:
+    def __init__(self, regions: List[Tuple[int, int]]):
+        """
+        Builds a sorted interval index over the memory regions of the IMG dump files.
+
+        Two views of the regions are kept:
+            - The regions sorted by their lowest address, used to find the id of the region that contains
+              an address. The id of a region is its position in the list given to the constructor.
+            - The merged regions, where overlapping and contiguous regions are coalesced, used when only
+              membership matters.
+
+        Args:
+            regions (List[Tuple[int, int]]): (lowest address, highest address) of each region, both inclusive.
+        """
+        order = sorted(range(len(regions)), key=lambda region_id: regions[region_id])
+
+        self.starts = []  # lowest address of each region, sorted
+        self.ends = []  # highest address of each region
+        self.ids = []  # id of each region
+        for region_id in order:
+            low, high = regions[region_id]
+            if self.ends and low <= self.ends[-1]:
+                # overlapping regions: the lowest one owns the addresses they share
+                if high <= self.ends[-1]:
+                    continue
+                low = self.ends[-1] + 1
+            self.starts.append(low)
+            self.ends.append(high)
+            self.ids.append(region_id)
+
+        self.merged_starts = []
+        self.merged_ends = []
+        for low, high in zip(self.starts, self.ends):
+            if self.merged_ends and low == self.merged_ends[-1] + 1:
+                self.merged_ends[-1] = high
+            else:
+                self.merged_starts.append(low)
+                self.merged_ends.append(high)
+
+        self.starts_array = np.array(self.starts, dtype=np.uint64)
+        self.ends_array = np.array(self.ends, dtype=np.uint64)
+        self.ids_array = np.array(self.ids, dtype=np.int32)
+        self.merged_starts_array = np.array(self.merged_starts, dtype=np.uint64)
+        self.merged_ends_array = np.array(self.merged_ends, dtype=np.uint64)
+
+    def __getstate__(self) -> dict:
+        # only the arrays are pickled, the lists are rebuilt from them
+        return {name: value for name, value in self.__dict__.items() if name.endswith('_array')}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.starts = self.starts_array.tolist()
+        self.ends = self.ends_array.tolist()
+        self.ids = self.ids_array.tolist()
+        self.merged_starts = self.merged_starts_array.tolist()
+        self.merged_ends = self.merged_ends_array.tolist()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def lookup(self, address: int) -> int:
+        """
+        Returns the id of the region containing the address in O(log n).
+
+        Args:
+            address (int): The address to look up.
+
+        Returns:
+            int: The id of the region, or -1 if the address is not in any region.
+        """
+        position = bisect_right(self.starts, address) - 1
+        if position >= 0 and address <= self.ends[position]:
+            return self.ids[position]
+        return -1
+
+    def contains(self, address: int) -> bool:
+        """
+        Checks in O(log n) if the address is inside any region.
+        """
+        position = bisect_right(self.merged_starts, address) - 1
+        return position >= 0 and address <= self.merged_ends[position]
+
+    def lookup_many(self, addresses: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of lookup.
+
+        Args:
+            addresses (np.ndarray): Array of unsigned addresses, e.g. the WORDs of a stack.
+
+        Returns:
+            np.ndarray: int32 array with the id of the region containing each address, -1 where there is none.
+        """
+        addresses = np.asarray(addresses, dtype=np.uint64)
+        if not self.ids:
+            return np.full(addresses.shape, -1, dtype=np.int32)
+        positions = np.searchsorted(self.starts_array, addresses, side='right') - 1
+        valid_positions = np.maximum(positions, 0)
+        found = (positions >= 0) & (addresses <= self.ends_array[valid_positions])
+        return np.where(found, self.ids_array[valid_positions], -1).astype(np.int32)
+
+    def contains_many(self, addresses: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of contains.
+
+        Args:
+            addresses (np.ndarray): Array of unsigned addresses, e.g. the WORDs of a stack.
+
+        Returns:
+            np.ndarray: Boolean mask, True where the address is inside a region.
+        """
+        addresses = np.asarray(addresses, dtype=np.uint64)
+        if not self.merged_starts:
+            return np.zeros(addresses.shape, dtype=bool)
+        positions = np.searchsorted(self.merged_starts_array, addresses, side='right') - 1
+        return (positions >= 0) & (addresses <= self.merged_ends_array[np.maximum(positions, 0)])
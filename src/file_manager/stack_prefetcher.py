@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Tuple
+
+import numpy as np
+from dump_storage import StorageMember
+
+PREFETCH_MEMORY_LIMIT = 256 << 20  # bytes of stack files loaded ahead at most
+MIN_REGION_HITS = 4  # sampled WORDs of a stack pointing to an IMG region for the region to be prefaulted
+REGION_SAMPLE_STRIDE = 16  # one WORD out of REGION_SAMPLE_STRIDE is looked up to find the regions to prefault
+
+
+class StackPrefetcher:
+    def __init__(self, fm, queue_depth: int = 2, memory_limit: int = PREFETCH_MEMORY_LIMIT,
+                 min_region_hits: int = MIN_REGION_HITS):
+        """
+        Loads the next stack dmp files in background threads while the current one is scanned, so the scan
+        does not wait for slow storage (e.g. network mounted evidence stores). Every stack is read into
+        memory with one large read (see StorageMember.load) and the IMG regions its WORDs point to most are
+        prefaulted, as they are about to be read by the CALL filter and the gadget validation.
+
+        Args:
+            fm (ProcessDumpManager): The FileManager instance of the dump folder.
+            queue_depth (int): Maximum number of stack files loaded ahead, also the number of threads.
+            memory_limit (int): Maximum bytes of the stack files loaded ahead and being scanned. One file is
+                always loaded, even if it is larger.
+            min_region_hits (int): Sampled WORDs of a stack (one out of REGION_SAMPLE_STRIDE) that must point
+                to an IMG region to prefault it. Only a sample is looked up, the scan does the full lookup.
+        """
+        self.fm = fm
+        self.queue_depth = max(1, queue_depth)
+        self.memory_limit = memory_limit
+        self.min_region_hits = min_region_hits
+        self.prefaulted_regions = set()  # region ids already prefaulted
+        self.lock = threading.Lock()
+        self.regions_prefaulted = 0
+
+    def load_stack_file(self, index: int) -> StorageMember | None:
+        """
+        Opens and loads one stack dmp file and prefaults its most pointed IMG regions, in a background thread.
+
+        Returns:
+            StorageMember | None: The loaded file, or None if it cannot be opened.
+        """
+        try:
+            member = self.fm.storage.open_member('stacks/' + self.fm.stack_info[index]['file_name'])
+        except IOError:
+            return None
+        if not member.load():
+            return member
+
+        word_count = min(self.fm.stack_info[index]['stack_size'], member.size) // self.fm.word_size
+        words = np.frombuffer(member.get_buffer(), dtype=self.fm.word_dtype, count=word_count)
+        region_ids = self.fm.region_index.lookup_many(words[::REGION_SAMPLE_STRIDE])
+        region_hits = np.bincount(region_ids[region_ids >= 0], minlength=len(self.fm.dmp_info))
+        for region_id in np.flatnonzero(region_hits >= self.min_region_hits).tolist():
+            with self.lock:
+                if region_id in self.prefaulted_regions:
+                    continue
+                self.prefaulted_regions.add(region_id)
+                self.regions_prefaulted += 1
+            try:
+                region_member = self.fm.open_img_dump_file(region_id)
+            except IOError:
+                continue
+            # the pages stay in the page cache for the map of the region in img_cache
+            region_member.prefault()
+            region_member.close()
+        return member
+
+    def iter_stack_files(self) -> Iterator[Tuple[int, StorageMember | None]]:
+        """
+        Yields the loaded stack dmp files in stack_info order. Each file is closed when the next one is
+        requested.
+
+        Yields:
+            Tuple[int, StorageMember | None]: Position of the file in stack_info and the loaded file, None if
+            it cannot be opened.
+        """
+        sizes = [stack['stack_size'] for stack in self.fm.stack_info]
+        pending = deque()  # (index, future) of the files being loaded, in order
+        pending_bytes = 0  # bytes of the files being loaded and of the file being scanned
+        next_index = 0
+        with ThreadPoolExecutor(max_workers=self.queue_depth) as executor:
+            try:
+                while pending or next_index < len(sizes):
+                    while (next_index < len(sizes) and len(pending) < self.queue_depth
+                           and (not pending or pending_bytes + sizes[next_index] <= self.memory_limit)):
+                        if next_index == 0:
+                            # loaded here, so archives are opened before the threads use them
+                            future = Future()
+                            future.set_result(self.load_stack_file(next_index))
+                        else:
+                            future = executor.submit(self.load_stack_file, next_index)
+                        pending.append((next_index, future))
+                        pending_bytes += sizes[next_index]
+                        next_index += 1
+
+                    index, future = pending.popleft()
+                    member = future.result()
+                    try:
+                        yield index, member
+                    finally:
+                        if member is not None:
+                            member.close()
+                        pending_bytes -= sizes[index]
+            finally:
+                for _, future in pending:
+                    future.cancel()
+                for _, future in pending:
+                    if not future.cancelled():
+                        member = future.result()
+                        if member is not None:
+                            member.close()
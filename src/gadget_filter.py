@@ -0,0 +1,145 @@
+import argparse
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from call_filter import are_prev_instructions_call
+from gadget_validator import GadgetValidator
+from return_site_cache import ReturnSiteCache
+from benign_index import BenignIndex, load_benign_index
+from run_stats import NO_STATS, RunStats
+
+
+class GadgetFilter:
+    def __init__(self, call_filter: bool = False, return_site_cache: ReturnSiteCache | None = None,
+                 validator: GadgetValidator | None = None, benign_index: BenignIndex | None = None):
+        """
+        Decides which WORDs of a stack are gadget hits. A WORD is a hit if it points to an IMG region and
+        passes the enabled checks.
+
+        Args:
+            call_filter (bool): Discard the addresses preceded by a CALL instruction (ordinary return addresses).
+            return_site_cache (ReturnSiteCache | None): Precomputed return site bitmaps used by the CALL filter
+                instead of decoding the bytes before every address.
+            validator (GadgetValidator | None): Keep only the addresses from which a ret, jmp reg or call reg
+                instruction is reachable.
+            benign_index (BenignIndex | None): Discard the known-benign return sites, before the other checks.
+        """
+        self.call_filter = call_filter
+        self.return_site_cache = return_site_cache
+        self.validator = validator
+        self.benign_index = benign_index
+
+    def get_signature(self) -> dict:
+        """
+        Returns the configuration that decides which WORDs are gadget hits, for results that depend on it.
+        The return site cache gives the same results as the CALL filter, so it is not part of it.
+        """
+        return {
+            "call_filter": self.call_filter,
+            "validate_gadgets": self.validator.max_instructions if self.validator else None,
+            "benign_index": self.benign_index.get_signature() if self.benign_index else None,
+        }
+
+    def are_prev_instructions_call(self, fm: ProcessDumpManager, addresses: np.ndarray) -> np.ndarray:
+        if self.return_site_cache is not None:
+            return self.return_site_cache.are_return_sites(fm, addresses)
+        return are_prev_instructions_call(fm, addresses)
+
+    def find_hits(self, fm: ProcessDumpManager, words: np.ndarray, stats: RunStats = NO_STATS) -> np.ndarray:
+        """
+        Finds the WORDs of a stack that are possible gadget addresses.
+
+        Args:
+            fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+            words (np.ndarray): The WORDs of the stack.
+            stats (RunStats): Records the time of every check and the number of rejected addresses.
+
+        Returns:
+            np.ndarray: Sorted positions of the hits in words.
+        """
+        with stats.timer("region_lookup"):
+            is_gadget = fm.region_index.contains_many(words)
+        if stats.enabled:
+            stats.count("words_scanned", len(words))
+            stats.count("region_hits", int(is_gadget.sum()))
+        if self.benign_index is not None:
+            with stats.timer("benign_filter"):
+                is_benign = self.benign_index.are_benign(fm, words[is_gadget])
+                is_gadget[is_gadget] = ~is_benign
+            stats.count("benign_rejections", int(is_benign.sum()))
+        if self.call_filter:
+            with stats.timer("call_filter"):
+                is_call_preceded = self.are_prev_instructions_call(fm, words[is_gadget])
+                is_gadget[is_gadget] = ~is_call_preceded
+            stats.count("call_filter_rejections", int(is_call_preceded.sum()))
+        if self.validator is not None:
+            with stats.timer("validation"):
+                is_valid = self.validator.are_valid_gadgets(fm, words[is_gadget])
+                is_gadget[is_gadget] = is_valid
+            stats.count("validation_rejections", len(is_valid) - int(is_valid.sum()))
+        hit_indices = np.flatnonzero(is_gadget)
+        stats.count("gadget_hits", len(hit_indices))
+        return hit_indices
+
+    def get_cache_counters(self, fm: ProcessDumpManager) -> dict:
+        """
+        Returns the cumulative counters of the caches used by the checks, to be added to the RunStats report.
+        """
+        counters = {
+            "img_cache_hits": fm.img_cache.hits,
+            "img_cache_misses": fm.img_cache.misses,
+            "img_cache_evictions": fm.img_cache.evictions,
+            "img_bytes_read": fm.img_cache.bytes_read,
+        }
+        counters.update(fm.storage.get_block_cache_stats())
+        if self.return_site_cache is not None:
+            counters["return_site_bitmaps_built"] = self.return_site_cache.built
+            counters["return_site_bitmaps_loaded"] = self.return_site_cache.loaded
+        if self.validator is not None:
+            counters["validation_cache_hits"] = self.validator.hits
+            counters["validation_cache_misses"] = self.validator.misses
+        return counters
+
+
+def add_gadget_filter_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the command line arguments that configure the GadgetFilter.
+    """
+    parser.add_argument(
+        "--call-filter",
+        action="store_true",
+        help="Discard addresses preceded by a CALL instruction (ordinary return addresses)"
+    )
+    parser.add_argument(
+        "--return-site-cache",
+        metavar="DIR",
+        help="Directory of the precomputed return site bitmaps, shared by all dumps. Enables the CALL filter"
+    )
+    parser.add_argument(
+        "--benign-index",
+        metavar="FILE",
+        help="Index of known-benign return sites built from clean dumps with benign_index.py. They are "
+             "discarded before the other checks"
+    )
+    parser.add_argument(
+        "--validate-gadgets",
+        type=int,
+        metavar="N",
+        help="Keep only addresses that reach a ret, jmp reg or call reg within N instructions"
+    )
+    parser.add_argument(
+        "--validation-cache-size",
+        type=int,
+        default=1 << 16,
+        help="Maximum number of gadget validation results kept in memory"
+    )
+
+
+def build_gadget_filter(args: argparse.Namespace) -> GadgetFilter:
+    """
+    Builds the GadgetFilter configured by the arguments of add_gadget_filter_arguments.
+    """
+    return_site_cache = ReturnSiteCache(args.return_site_cache) if args.return_site_cache else None
+    validator = GadgetValidator(args.validate_gadgets, args.validation_cache_size) if args.validate_gadgets else None
+    benign_index = load_benign_index(args.benign_index) if args.benign_index else None
+    return GadgetFilter(args.call_filter or return_site_cache is not None, return_site_cache, validator, benign_index)
@@ -0,0 +1,391 @@
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+
+MAX_INSTRUCTION_LENGTH = 15  # longest valid x86 instruction
+
+LEGACY_PREFIXES = {0x26, 0x2E, 0x36, 0x3E, 0x64, 0x65, 0x66, 0x67, 0xF0, 0xF2, 0xF3}
+OPERAND_SIZE_OVERRIDE_PREFIX = 0x66
+ADDRESS_SIZE_OVERRIDE_PREFIX = 0x67
+VEX_PREFIX_LENGTHS = {0xC5: 2, 0xC4: 3, 0x62: 4}  # 2-byte VEX, 3-byte VEX and EVEX, with their payload bytes
+VEX_INVALID_PREFIXES = {0x66, 0xF0, 0xF2, 0xF3}  # a VEX or EVEX instruction with one of them is invalid
+
+# Immediate operand kinds
+NONE, IMM8, IMM16, IMMZ, IMMV, MOFFS, IMM16_IMM8, PTR = range(8)  # z: 16/32 bits, v: 16/32/64 bits
+
+# Kinds of instruction for the validation
+NORMAL, TERMINATOR, BRANCH, JUMP, STOP = range(5)
+
+
+def build_one_byte_opcode_table(bitness: int) -> dict:
+    """
+    Builds the table of the one-byte opcodes: opcode -> (has ModRM byte, immediate kind, kind). Opcodes that
+    are missing are prefixes, escapes or invalid in the given bitness.
+    """
+    table = {}
+    for base in range(0x00, 0x40, 0x08):
+        for low in range(4):
+            table[base + low] = (True, NONE, NORMAL)
+        table[base + 4] = (False, IMM8, NORMAL)
+        table[base + 5] = (False, IMMZ, NORMAL)
+    for opcode in range(0x50, 0x60):
+        table[opcode] = (False, NONE, NORMAL)  # push/pop reg
+    table.update({
+        0x63: (True, NONE, NORMAL), 0x68: (False, IMMZ, NORMAL), 0x69: (True, IMMZ, NORMAL),
+        0x6A: (False, IMM8, NORMAL), 0x6B: (True, IMM8, NORMAL),
+        0x80: (True, IMM8, NORMAL), 0x81: (True, IMMZ, NORMAL), 0x83: (True, IMM8, NORMAL),
+        0xA0: (False, MOFFS, NORMAL), 0xA1: (False, MOFFS, NORMAL), 0xA2: (False, MOFFS, NORMAL),
+        0xA3: (False, MOFFS, NORMAL), 0xA8: (False, IMM8, NORMAL), 0xA9: (False, IMMZ, NORMAL),
+        0xC0: (True, IMM8, NORMAL), 0xC1: (True, IMM8, NORMAL), 0xC2: (False, IMM16, TERMINATOR),
+        0xC3: (False, NONE, TERMINATOR), 0xC6: (True, IMM8, NORMAL), 0xC7: (True, IMMZ, NORMAL),
+        0xC8: (False, IMM16_IMM8, NORMAL), 0xC9: (False, NONE, NORMAL), 0xCA: (False, IMM16, TERMINATOR),
+        0xCB: (False, NONE, TERMINATOR), 0xCC: (False, NONE, STOP), 0xCD: (False, IMM8, STOP),
+        0xCF: (False, NONE, STOP), 0xD7: (False, NONE, NORMAL),
+        0xE0: (False, IMM8, BRANCH), 0xE1: (False, IMM8, BRANCH), 0xE2: (False, IMM8, BRANCH),
+        0xE3: (False, IMM8, BRANCH), 0xE8: (False, IMMZ, STOP), 0xE9: (False, IMMZ, JUMP),
+        0xEB: (False, IMM8, JUMP), 0xF1: (False, NONE, STOP), 0xF4: (False, NONE, STOP),
+        0xF6: (True, NONE, NORMAL), 0xF7: (True, NONE, NORMAL), 0xFE: (True, NONE, NORMAL),
+        0xFF: (True, NONE, NORMAL),
+    })
+    for opcode in range(0x6C, 0x70):
+        table[opcode] = (False, NONE, NORMAL)  # ins/outs
+    for opcode in range(0x70, 0x80):
+        table[opcode] = (False, IMM8, BRANCH)  # jcc rel8
+    for opcode in range(0x84, 0x90):
+        table[opcode] = (True, NONE, NORMAL)
+    for opcode in range(0x90, 0xA0):
+        table[opcode] = (False, NONE, NORMAL)  # xchg, cbw, cwd, wait, pushf, popf, sahf, lahf
+    for opcode in list(range(0xA4, 0xA8)) + list(range(0xAA, 0xB0)):
+        table[opcode] = (False, NONE, NORMAL)  # string instructions
+    for opcode in range(0xB0, 0xB8):
+        table[opcode] = (False, IMM8, NORMAL)
+    for opcode in range(0xB8, 0xC0):
+        table[opcode] = (False, IMMV, NORMAL)
+    for opcode in range(0xD0, 0xD4):
+        table[opcode] = (True, NONE, NORMAL)  # shifts
+    for opcode in range(0xD8, 0xE0):
+        table[opcode] = (True, NONE, NORMAL)  # x87
+    for opcode in range(0xE4, 0xE8):
+        table[opcode] = (False, IMM8, NORMAL)  # in/out imm8
+    for opcode in list(range(0xEC, 0xF0)) + [0xF5] + list(range(0xF8, 0xFE)):
+        table[opcode] = (False, NONE, NORMAL)
+
+    if bitness == 32:
+        for opcode in (0x06, 0x07, 0x0E, 0x16, 0x17, 0x1E, 0x1F, 0x27, 0x2F, 0x37, 0x3F, 0x60, 0x61, 0xCE):
+            table[opcode] = (False, NONE, NORMAL)
+        for opcode in range(0x40, 0x50):
+            table[opcode] = (False, NONE, NORMAL)  # inc/dec reg (REX prefixes in 64-bit mode)
+        table.update({
+            0x62: (True, NONE, NORMAL), 0x82: (True, IMM8, NORMAL), 0x9A: (False, PTR, STOP),
+            0xC4: (True, NONE, NORMAL), 0xC5: (True, NONE, NORMAL), 0xD4: (False, IMM8, NORMAL),
+            0xD5: (False, IMM8, NORMAL), 0xEA: (False, PTR, STOP),
+        })
+    else:
+        for opcode in (0x06, 0x07, 0x0E, 0x16, 0x17, 0x1E, 0x1F, 0x27, 0x2F, 0x37, 0x3F):
+            table.pop(opcode, None)
+    return table
+
+
+def build_two_byte_opcode_table() -> dict:
+    """
+    Builds the table of the 0x0F opcodes: opcode -> (has ModRM byte, immediate kind, kind). Opcodes that are
+    missing are invalid or unlikely in user mode code.
+    """
+    table = {opcode: (True, NONE, NORMAL) for opcode in range(0x100)}
+    for opcode in (0x04, 0x0A, 0x0C, 0x0E, 0x24, 0x25, 0x26, 0x27, 0x36, 0x39, 0x3B, 0x3C, 0x3D, 0x3E, 0x3F,
+                   0x7A, 0x7B, 0xFF):
+        del table[opcode]
+    for opcode in (0x05, 0x06, 0x07, 0x08, 0x09, 0x30, 0x31, 0x32, 0x33, 0x34, 0x35, 0x37, 0x77, 0xA0, 0xA1,
+                   0xA2, 0xA8, 0xA9, 0xAA):
+        table[opcode] = (False, NONE, NORMAL)
+    table[0x0B] = (False, NONE, STOP)  # ud2
+    table[0xB9] = (True, NONE, STOP)  # ud1
+    for opcode in (0x0F, 0x70, 0x71, 0x72, 0x73, 0xA4, 0xAC, 0xBA, 0xC2, 0xC4, 0xC5, 0xC6):
+        table[opcode] = (True, IMM8, NORMAL)
+    for opcode in range(0x80, 0x90):
+        table[opcode] = (False, IMMZ, BRANCH)  # jcc rel32
+    for opcode in range(0xC8, 0xD0):
+        table[opcode] = (False, NONE, NORMAL)  # bswap
+    return table
+
+
+def build_vex_opcode_tables() -> dict:
+    """
+    Builds the tables of the opcode maps reachable with a VEX or EVEX prefix: map number -> opcode -> (has
+    ModRM byte, immediate kind, kind). Only the length matters, so every opcode of a map is accepted: map 1
+    (0x0F) has ModRM except vzeroupper/vzeroall and a few opcodes with imm8, map 2 (0x0F 0x38) has ModRM
+    and map 3 (0x0F 0x3A) has ModRM and imm8. Maps 5 and 6 (AVX512-FP16) are only reachable with EVEX.
+    """
+    tables = {
+        1: {opcode: (True, NONE, NORMAL) for opcode in range(0x100)},
+        2: {opcode: (True, NONE, NORMAL) for opcode in range(0x100)},
+        3: {opcode: (True, IMM8, NORMAL) for opcode in range(0x100)},
+        5: {opcode: (True, NONE, NORMAL) for opcode in range(0x100)},
+        6: {opcode: (True, NONE, NORMAL) for opcode in range(0x100)},
+    }
+    tables[1][0x77] = (False, NONE, NORMAL)  # vzeroupper, vzeroall
+    for opcode in (0x70, 0x71, 0x72, 0x73, 0xC2, 0xC4, 0xC5, 0xC6):
+        tables[1][opcode] = (True, IMM8, NORMAL)
+    return tables
+
+
+ONE_BYTE_OPCODES = {32: build_one_byte_opcode_table(32), 64: build_one_byte_opcode_table(64)}
+TWO_BYTE_OPCODES = build_two_byte_opcode_table()
+VEX_OPCODES = build_vex_opcode_tables()
+
+
+def get_modrm_length(code, position: int, address_size: int) -> int:
+    """
+    Returns the number of bytes of the ModRM byte at position and of the SIB byte and displacement that
+    follow it, or -1 if code ends before.
+    """
+    if position >= len(code):
+        return -1
+    modrm = code[position]
+    mod, rm = modrm >> 6, modrm & 0b111
+    if mod == 3:
+        return 1
+    if address_size == 16:
+        if mod == 0:
+            return 3 if rm == 0b110 else 1
+        return 2 if mod == 1 else 3
+
+    length = 1
+    if rm == 0b100:
+        if position + 1 >= len(code):
+            return -1
+        length += 1
+        if mod == 0 and (code[position + 1] & 0b111) == 0b101:
+            length += 4
+    elif mod == 0 and rm == 0b101:
+        length += 4
+    if mod == 1:
+        length += 1
+    elif mod == 2:
+        length += 4
+    return length
+
+
+def decode_instruction(code, position: int, bitness: int) -> Tuple[int, int, int]:
+    """
+    Decodes the length of the x86 instruction that starts at position.
+
+    Args:
+        code: Bytes of code (bytes, memoryview...).
+        position (int): Position of the first byte of the instruction in code.
+        bitness (int): Bitness of the process.
+
+    Returns:
+        Tuple[int, int, int]: Length of the instruction, kind (NORMAL, TERMINATOR, BRANCH, JUMP or STOP) and
+        relative displacement of a JUMP. The length is -1 if the instruction is invalid or code ends before it.
+    """
+    start = position
+    operand_size = 32
+    address_size = bitness
+    rex_w = False
+    vex_invalid = False  # a prefix that cannot precede VEX or EVEX was found
+
+    while position < len(code) and code[position] in LEGACY_PREFIXES and position - start < MAX_INSTRUCTION_LENGTH:
+        if code[position] == OPERAND_SIZE_OVERRIDE_PREFIX:
+            operand_size = 16
+        elif code[position] == ADDRESS_SIZE_OVERRIDE_PREFIX:
+            address_size = 16 if bitness == 32 else 32
+        vex_invalid = vex_invalid or code[position] in VEX_INVALID_PREFIXES
+        position += 1
+
+    # in 32-bit mode 0xC4, 0xC5 and 0x62 are LES, LDS and BOUND unless the next byte looks like a register ModRM
+    if (position + 1 < len(code) and code[position] in VEX_PREFIX_LENGTHS
+            and (bitness == 64 or code[position + 1] >> 6 == 0b11)):
+        prefix = code[position]
+        prefix_length = VEX_PREFIX_LENGTHS[prefix]
+        if vex_invalid or position + prefix_length >= len(code):
+            return -1, STOP, 0
+        if prefix == 0xC5:
+            map_number = 1
+        elif prefix == 0xC4:
+            map_number = code[position + 1] & 0b11111
+        else:
+            map_number = code[position + 1] & 0b111
+            if not code[position + 2] & 0b100:  # fixed bit of the second EVEX payload byte
+                return -1, STOP, 0
+        entry = VEX_OPCODES.get(map_number) if prefix == 0x62 or map_number <= 3 else None
+        if entry is None:
+            return -1, STOP, 0
+        position += prefix_length
+        opcode = code[position]
+        position += 1
+        return finish_instruction(code, start, position, opcode, entry[opcode], False, operand_size, address_size,
+                                  rex_w)
+
+    if bitness == 64 and position < len(code) and 0x40 <= code[position] <= 0x4F:
+        rex_w = bool(code[position] & 0b1000)
+        position += 1
+    if position >= len(code):
+        return -1, STOP, 0
+
+    opcode = code[position]
+    position += 1
+    if opcode == 0x0F:
+        if position >= len(code):
+            return -1, STOP, 0
+        opcode = code[position]
+        position += 1
+        if opcode in (0x38, 0x3A):  # three-byte opcodes, always with ModRM
+            position += 1
+            entry = (True, IMM8 if opcode == 0x3A else NONE, NORMAL)
+        else:
+            entry = TWO_BYTE_OPCODES.get(opcode)
+        two_byte = True
+    else:
+        entry = ONE_BYTE_OPCODES[bitness].get(opcode)
+        two_byte = False
+    return finish_instruction(code, start, position, opcode, entry, not two_byte, operand_size, address_size, rex_w)
+
+
+def finish_instruction(code, start: int, position: int, opcode: int, entry: tuple | None, one_byte: bool,
+                       operand_size: int, address_size: int, rex_w: bool) -> Tuple[int, int, int]:
+    """
+    Decodes the ModRM, SIB, displacement and immediate of the instruction whose opcode ends before position.
+    See decode_instruction.
+
+    Args:
+        entry (tuple | None): The opcode table entry, None if the opcode is invalid.
+        one_byte (bool): The opcode is in the one-byte map, whose ModRM reg field can change the instruction.
+    """
+    if entry is None:
+        return -1, STOP, 0
+
+    has_modrm, immediate, kind = entry
+    modrm = None
+    if has_modrm:
+        modrm_length = get_modrm_length(code, position, address_size)
+        if modrm_length < 0:
+            return -1, STOP, 0
+        modrm = code[position]
+        position += modrm_length
+
+    if one_byte and modrm is not None:
+        reg, mod = (modrm >> 3) & 0b111, modrm >> 6
+        if opcode in (0xF6, 0xF7) and reg in (0, 1):  # test r/m, imm
+            immediate = IMM8 if opcode == 0xF6 else IMMZ
+        elif opcode == 0xFF:
+            if reg in (2, 4) and mod == 3:  # call reg, jmp reg
+                kind = TERMINATOR
+            elif reg in (2, 3, 4, 5):  # call/jmp through memory
+                kind = STOP
+            elif reg == 7:
+                return -1, STOP, 0
+        elif opcode == 0xFE and reg > 1:
+            return -1, STOP, 0
+
+    z_size = 2 if operand_size == 16 else 4
+    immediate_size = {
+        NONE: 0, IMM8: 1, IMM16: 2, IMMZ: z_size, IMMV: 8 if rex_w else z_size, MOFFS: address_size // 8,
+        IMM16_IMM8: 3, PTR: z_size + 2,
+    }[immediate]
+
+    displacement = 0
+    if kind == JUMP and position + immediate_size <= len(code):
+        displacement = int.from_bytes(code[position:position + immediate_size], byteorder='little', signed=True)
+    position += immediate_size
+
+    length = position - start
+    if position > len(code) or length > MAX_INSTRUCTION_LENGTH:
+        return -1, STOP, 0
+    return length, kind, displacement
+
+
+class GadgetValidator:
+    def __init__(self, max_instructions: int = 5, max_cache_entries: int = 1 << 16):
+        """
+        Validates candidate gadget addresses by decoding forward from them in the IMG dump files: a gadget
+        must reach a ret, jmp reg or call reg instruction within max_instructions instructions. Conditional
+        branches are followed through their fall-through path and unconditional relative jumps to their
+        target. Direct calls, memory indirect jumps and invalid or privileged instructions end the decoding.
+
+        Results are memoized in an LRU cache keyed by (SHA-256 of the region file, offset in the file), so
+        the same gadget is decoded once across threads and across dumps of the same modules.
+
+        Args:
+            max_instructions (int): Maximum number of instructions decoded from each candidate.
+            max_cache_entries (int): Maximum number of memoized results.
+        """
+        self.max_instructions = max_instructions
+        self.max_cache_entries = max_cache_entries
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_cache_key(self, fm: ProcessDumpManager, address: int) -> Tuple[str, int, int] | None:
+        region_id = fm.region_index.lookup(address)
+        if region_id < 0:
+            return None
+        region = fm.dmp_info[region_id]
+        return region["SHA-256"], fm.bitness, address - region["Memory region"][0]
+
+    def decode_reaches_terminator(self, fm: ProcessDumpManager, address: int) -> bool:
+        """
+        Decodes up to max_instructions instructions from address, without using the memo cache.
+        """
+        remaining = self.max_instructions
+        while remaining > 0:
+            code = fm.read_img_dump_file(address, remaining * MAX_INSTRUCTION_LENGTH)
+            if code is None:
+                return False
+            position = 0
+            while remaining > 0:
+                length, kind, displacement = decode_instruction(code, position, fm.bitness)
+                if length < 0 or kind == STOP:
+                    return False
+                remaining -= 1
+                if kind == TERMINATOR:
+                    return True
+                position += length
+                if kind == JUMP:
+                    address = address + position + displacement
+                    break
+            else:
+                return False
+        return False
+
+    def is_valid_gadget(self, fm: ProcessDumpManager, address: int) -> bool:
+        key = self.get_cache_key(fm, address)
+        if key is None:
+            return False
+
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return result
+
+        self.misses += 1
+        result = self.decode_reaches_terminator(fm, address)
+        self.cache[key] = result
+        if len(self.cache) > self.max_cache_entries:
+            self.cache.popitem(last=False)
+        return result
+
+    def are_valid_gadgets(self, fm: ProcessDumpManager, addresses: np.ndarray) -> np.ndarray:
+        """
+        Batch version of is_valid_gadget. Every distinct address is only checked once.
+
+        Returns:
+            np.ndarray: Boolean mask, True where the address is a valid gadget.
+        """
+        unique_addresses, inverse = np.unique(addresses, return_inverse=True)
+        unique_valid = np.array([self.is_valid_gadget(fm, address) for address in unique_addresses.tolist()],
+                                dtype=bool)
+        return unique_valid[inverse.ravel()]
+
+    def get_stats(self) -> dict:
+        accesses = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / accesses if accesses else 0.0,
+            "entries": len(self.cache),
+            "max_cache_entries": self.max_cache_entries,
+        }
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from region_index import RegionIndex
+from call_filter import MAX_CALL_INSTRUCTION_SIZE
+from gadget_filter import GadgetFilter
+from rop_chains import StackHits
+from run_stats import NO_STATS, RunStats
+
+SNAPSHOT_STATE_VERSION = 1  # increase when the format of the state file changes
+SNAPSHOT_PAGE_SIZE = 0x1000  # bytes of stack covered by one fingerprint
+MAX_ADDRESS = (1 << 64) - 1
+
+
+class StackSnapshot:
+    def __init__(self, sha256: str | None, stack_size: int, word_count: int, fingerprints: np.ndarray,
+                 hit_indices: np.ndarray, hit_values: np.ndarray):
+        """
+        What is kept of one stack between two snapshots of the same process.
+
+        Args:
+            sha256 (str | None): SHA-256 of the stack dmp file recorded in stacks/results.txt.
+            stack_size (int): Size of the stack recorded in its file name.
+            word_count (int): Number of WORDs scanned.
+            fingerprints (np.ndarray): uint64 fingerprint of every page of the stack (see get_page_fingerprints).
+            hit_indices (np.ndarray): Sorted positions (in WORDs) of the gadget hits.
+            hit_values (np.ndarray): The WORD found at each hit.
+        """
+        self.sha256 = sha256
+        self.stack_size = stack_size
+        self.word_count = word_count
+        self.fingerprints = fingerprints
+        self.hit_indices = hit_indices
+        self.hit_values = hit_values
+
+
+class SnapshotState:
+    def __init__(self, filter_signature: dict, regions: List[list], page_size: int = SNAPSHOT_PAGE_SIZE):
+        """
+        Page fingerprints and gadget hits of the stacks of one snapshot of a process, used to scan only what
+        changed in the next snapshot (see scan_stacks_incremental). Stacks are identified by their thread id
+        and base address.
+
+        Args:
+            filter_signature (dict): Configuration of the GadgetFilter the hits were found with
+                (see get_filter_signature). Hits are only reused with the same configuration.
+            regions (List[list]): [lowest address, highest address, SHA-256] of every region of results.txt.
+            page_size (int): Bytes of stack covered by one fingerprint.
+        """
+        self.filter_signature = filter_signature
+        self.regions = regions
+        self.page_size = page_size
+        self.stacks = {}  # (tid, base address) -> StackSnapshot
+
+    def is_compatible(self, other: 'SnapshotState') -> bool:
+        return self.filter_signature == other.filter_signature and self.page_size == other.page_size
+
+    def save(self, file_path: str):
+        """
+        Saves the state to an .npz file. The file is replaced atomically, so an interrupted run leaves the
+        previous state usable.
+        """
+        stacks = list(self.stacks.items())
+        metadata = {
+            "version": SNAPSHOT_STATE_VERSION,
+            "filter_signature": self.filter_signature,
+            "regions": self.regions,
+            "page_size": self.page_size,
+            "stacks": [[tid, base_address, snapshot.sha256, snapshot.stack_size, snapshot.word_count]
+                       for (tid, base_address), snapshot in stacks],
+        }
+
+        def concatenate(name: str, dtype: np.dtype) -> np.ndarray:
+            return np.concatenate([np.zeros(0, dtype=dtype)] +
+                                  [getattr(snapshot, name).astype(dtype) for _, snapshot in stacks])
+
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path + ".tmp", 'wb') as state_file:
+            np.savez(
+                state_file,
+                metadata=np.array(json.dumps(metadata)),
+                fingerprint_counts=np.array([len(snapshot.fingerprints) for _, snapshot in stacks], dtype=np.int64),
+                fingerprints=concatenate("fingerprints", np.uint64),
+                hit_counts=np.array([len(snapshot.hit_indices) for _, snapshot in stacks], dtype=np.int64),
+                hit_indices=concatenate("hit_indices", np.int64),
+                hit_values=concatenate("hit_values", np.uint64),
+            )
+        os.replace(file_path + ".tmp", file_path)
+
+
+def load_snapshot_state(file_path: str) -> SnapshotState | None:
+    """
+    Loads the state saved by SnapshotState.save.
+
+    Returns:
+        SnapshotState | None: The state, or None if the file does not exist, cannot be read or has another
+        version.
+    """
+    try:
+        with np.load(file_path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata.get("version") != SNAPSHOT_STATE_VERSION:
+                return None
+            fingerprint_counts = data["fingerprint_counts"]
+            fingerprints = data["fingerprints"]
+            hit_counts = data["hit_counts"]
+            hit_indices = data["hit_indices"]
+            hit_values = data["hit_values"]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    state = SnapshotState(metadata["filter_signature"], metadata["regions"], metadata["page_size"])
+    stack_fingerprints = np.split(fingerprints, np.cumsum(fingerprint_counts)[:-1])
+    stack_hit_indices = np.split(hit_indices, np.cumsum(hit_counts)[:-1])
+    stack_hit_values = np.split(hit_values, np.cumsum(hit_counts)[:-1])
+    for stack_number, (tid, base_address, sha256, stack_size, word_count) in enumerate(metadata["stacks"]):
+        state.stacks[(tid, base_address)] = StackSnapshot(sha256, stack_size, word_count,
+                                                          stack_fingerprints[stack_number],
+                                                          stack_hit_indices[stack_number],
+                                                          stack_hit_values[stack_number])
+    return state
+
+
+def get_filter_signature(fm: ProcessDumpManager, gadget_filter: GadgetFilter) -> dict:
+    """
+    Returns the configuration that decides which WORDs of the dump are gadget hits (see
+    GadgetFilter.get_signature).
+    """
+    return {"bitness": fm.bitness, **gadget_filter.get_signature()}
+
+
+def build_snapshot_state(fm: ProcessDumpManager, gadget_filter: GadgetFilter,
+                         page_size: int = SNAPSHOT_PAGE_SIZE) -> SnapshotState:
+    """
+    Returns an empty SnapshotState for the regions of the dump, filled by scan_stacks_incremental.
+    """
+    regions = [[*region["Memory region"], region["SHA-256"]] for region in fm.dmp_info]
+    return SnapshotState(get_filter_signature(fm, gadget_filter), regions, page_size)
+
+
+def get_page_fingerprints(words: np.ndarray, page_words: int) -> np.ndarray:
+    """
+    Returns a 64-bit BLAKE2b fingerprint of every page of page_words WORDs of a stack. The last page may be
+    shorter.
+    """
+    stack_bytes = words.view(np.uint8)
+    page_size = page_words * words.itemsize
+    digests = b''.join(hashlib.blake2b(stack_bytes[start:start + page_size], digest_size=8).digest()
+                       for start in range(0, len(stack_bytes), page_size))
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+def get_changed_ranges(previous_regions: List[list], regions: List[list]) -> List[Tuple[int, int]]:
+    """
+    Returns the address ranges where a WORD can be a gadget hit in one snapshot and not in the other: the
+    regions that are not in both snapshots with the same addresses and SHA-256, and those without SHA-256.
+    The results of the checks of an address are assumed to depend only on the region that contains it, as
+    the validation cache does, but each range is extended by the size of a CALL instruction because the
+    CALL filter reads the bytes before an address, which can be at the end of the previous region.
+
+    Args:
+        previous_regions (List[list]): [lowest address, highest address, SHA-256] of the previous snapshot.
+        regions (List[list]): The same for the current snapshot.
+
+    Returns:
+        List[Tuple[int, int]]: (lowest address, highest address) of every changed range, both inclusive.
+    """
+    previous = {tuple(region) for region in previous_regions}
+    current = {tuple(region) for region in regions}
+    changed = (previous ^ current) | {region for region in previous | current if not region[2]}
+    return [(low, min(high + MAX_CALL_INSTRUCTION_SIZE, MAX_ADDRESS)) for low, high, _ in sorted(changed)]
+
+
+def scan_stacks_incremental(fm: ProcessDumpManager, gadget_filter: GadgetFilter, previous_state: SnapshotState | None,
+                            state: SnapshotState, stats: RunStats = NO_STATS) -> Iterator[StackHits]:
+    """
+    Same hits as scan_stacks, reusing those of the previous snapshot of the same process. Every stack is
+    fingerprinted in pages and only the WORDs that can have a different result are checked again: those
+    of the pages whose fingerprint changed and those pointing to a region that changed (see
+    get_changed_ranges). The hits of the other WORDs are taken from the previous snapshot. A stack whose
+    SHA-256 did not change is not even read if no region changed.
+
+    Whether a WORD is a hit does not depend on its neighbours, so the ROPchains are segmented from the
+    merged hits exactly as from a full scan, whatever the gap limit: no neighbourhood of the changed pages
+    has to be scanned again, and segmenting the hits of the whole stack is cheap compared to finding them.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        gadget_filter (GadgetFilter): Decides which WORDs are gadget hits.
+        previous_state (SnapshotState | None): State of the previous snapshot. Every page is scanned if it is
+            None or was built with another gadget filter configuration or page size.
+        state (SnapshotState): State of this snapshot (see build_snapshot_state), filled with every stack
+            scanned, to be saved for the next one.
+        stats (RunStats): Records the time and counters of the scan.
+
+    Yields:
+        StackHits: The hits of every stack, in stack_info order.
+    """
+    if previous_state is not None and not previous_state.is_compatible(state):
+        previous_state = None
+    changed_region_index = None
+    if previous_state is None:
+        stats.count("snapshot_full_scans")
+    else:
+        changed_ranges = get_changed_ranges(previous_state.regions, state.regions)
+        stats.count("snapshot_changed_regions", len(changed_ranges))
+        if changed_ranges:
+            changed_region_index = RegionIndex(changed_ranges)
+    page_words = max(1, state.page_size // fm.word_size)
+
+    # the counters of fm are cumulative, only what this scan adds is counted
+    initial_cache_counters = gadget_filter.get_cache_counters(fm) if stats.enabled else {}
+    for index, stack in enumerate(fm.stack_info):
+        key = (stack["tid"], stack["base_address"])
+        previous = previous_state.stacks.get(key) if previous_state is not None else None
+        if (previous is not None and changed_region_index is None and stack["SHA-256"]
+                and stack["SHA-256"] == previous.sha256 and stack["stack_size"] == previous.stack_size):
+            state.stacks[key] = previous
+            stats.count("snapshot_stacks_reused")
+            yield StackHits(stack, previous.word_count, previous.hit_indices, previous.hit_values)
+            continue
+
+        with stats.timer("stack_mapping"):
+            words = fm.map_stack_dmp_file(index)
+        if words is None:
+            continue
+        stats.count("stack_bytes_read", words.nbytes)
+        with stats.timer("fingerprinting"):
+            fingerprints = get_page_fingerprints(words, page_words)
+        stats.count("snapshot_pages", len(fingerprints))
+
+        if previous is None:
+            stats.count("snapshot_pages_changed", len(fingerprints))
+            hit_indices = gadget_filter.find_hits(fm, words, stats)
+        else:
+            page_count = min(len(fingerprints), len(previous.fingerprints))
+            is_page_changed = np.ones(len(fingerprints), dtype=bool)
+            is_page_changed[:page_count] = fingerprints[:page_count] != previous.fingerprints[:page_count]
+            stats.count("snapshot_pages_changed", int(is_page_changed.sum()))
+            is_word_changed = np.repeat(is_page_changed, page_words)[:len(words)]
+            if changed_region_index is not None:
+                with stats.timer("region_lookup"):
+                    is_word_changed |= changed_region_index.contains_many(words)
+
+            previous_hit_indices = previous.hit_indices[previous.hit_indices < len(words)]
+            reused_hit_indices = previous_hit_indices[~is_word_changed[previous_hit_indices]]
+            if is_word_changed.all():
+                hit_indices = gadget_filter.find_hits(fm, words, stats)
+            else:
+                changed_indices = np.flatnonzero(is_word_changed)
+                changed_hit_indices = changed_indices[gadget_filter.find_hits(fm, words[changed_indices], stats)]
+                hit_indices = np.sort(np.concatenate([reused_hit_indices, changed_hit_indices]))
+            stats.count("snapshot_hits_reused", len(reused_hit_indices))
+
+        hit_values = words[hit_indices]
+        state.stacks[key] = StackSnapshot(stack["SHA-256"], stack["stack_size"], len(words), fingerprints,
+                                          hit_indices, hit_values)
+        yield StackHits(stack, len(words), hit_indices, hit_values)
+    fm.close_current_stack_dmp_file()
+
+    if stats.enabled:
+        for name, value in gadget_filter.get_cache_counters(fm).items():
+            stats.count(name, value - initial_cache_counters.get(name, 0))
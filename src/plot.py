@@ -1,6 +1,7 @@
 import os
 import re
 import matplotlib.pyplot as plt
+from rop_chain_results import load_rop_chain_results
 
 
 # -----------------------------
@@ -23,10 +24,14 @@ def parse_ropchain_files(result_file_paths):
         variable_x = int(regex_match.group(1))
         variable_y = int(regex_match.group(2))
 
-        # Contar cuántas veces aparece "ROPchain "
-        with open(file_path, "r") as f:
-            content = f.read()
-            sequence_count = content.count("ROPchain ")
+        # Leer el conteo del fichero .npz si existe; si no, contar cuántas veces aparece "ROPchain "
+        arrays_file_path = os.path.splitext(file_path)[0] + ".npz"
+        if os.path.exists(arrays_file_path):
+            sequence_count = load_rop_chain_results(arrays_file_path).chain_count
+        else:
+            with open(file_path, "r") as f:
+                content = f.read()
+                sequence_count = content.count("ROPchain ")
 
         # Sumamos el conteo a la clave "y" correspondiente
         chain_counts[variable_y] = chain_counts.get(variable_y, 0) + sequence_count
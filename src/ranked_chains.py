@@ -0,0 +1,94 @@
+import heapq
+import math
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+
+
+class TopChains:
+    def __init__(self, max_chains: int):
+        """
+        The max_chains best scored ROPchains of one combination of parameters, kept in a min-heap so memory
+        does not grow with the number of ROPchains found. On equal scores the ROPchain found first is kept.
+
+        Args:
+            max_chains (int): Number of ROPchains kept.
+        """
+        self.max_chains = max_chains
+        self.heap = []  # (score, -order, matches, source), the worst ROPchain first
+        self.order = 0  # ROPchains pushed so far
+
+    def get_min_score(self) -> float:
+        """
+        Returns the score a ROPchain must exceed to be kept.
+        """
+        return self.heap[0][0] if len(self.heap) >= self.max_chains else -math.inf
+
+    def push(self, score: float, matches: List[Tuple[int, int]], source: str | None = None):
+        entry = (score, -self.order, matches, source)
+        self.order += 1
+        if len(self.heap) < self.max_chains:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def get_chains(self) -> Iterator[Tuple[float, List[Tuple[int, int]], str | None]]:
+        """
+        Yields the score, the (stack address, gadget address) pairs and the source of the ROPchains kept,
+        best first.
+        """
+        for score, _, matches, source in sorted(self.heap, key=lambda entry: (-entry[0], -entry[1])):
+            yield score, matches, source
+
+
+def add_stack_chains(top_chains: TopChains, fm: ProcessDumpManager, gadget_filter: GadgetFilter, stack_hits,
+                     starts: np.ndarray, lengths: np.ndarray, source: str | None = None):
+    """
+    Scores the ROPchains of one stack (see segment_rop_chains) and offers them to top_chains. The score is
+    the product of:
+        - length: the number of hits of the ROPchain.
+        - density: hits per WORD between its first and its last hit.
+        - distinct share: distinct gadget addresses per hit, low for a repeated pointer.
+        - checks: share of its hits not preceded by a CALL instruction, 1 if the CALL filter already
+          discarded them. Validation, if enabled, already discarded the hits that are not gadgets.
+    The last two factors are at most 1, so they are only computed for the ROPchains whose length times
+    density can beat the worst ROPchain kept, and only those are converted to (address, gadget) pairs.
+
+    Args:
+        top_chains (TopChains): The ROPchains kept for the combination of parameters.
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        gadget_filter (GadgetFilter): The checks the hits passed.
+        stack_hits (StackHits): The hits of the stack.
+        starts (np.ndarray): Position in the hits of the first hit of every ROPchain.
+        lengths (np.ndarray): Length of every ROPchain.
+        source (str | None): The dump file of the ROPchains, written with them.
+    """
+    if not len(starts):
+        return
+    hit_indices = stack_hits.hit_indices
+    hit_values = stack_hits.hit_values
+    spans = hit_indices[starts + lengths - 1] - hit_indices[starts] + 1
+    upper_scores = lengths * (lengths / spans)
+    candidates = np.flatnonzero(upper_scores > top_chains.get_min_score())
+    if not len(candidates):
+        return
+
+    candidate_starts = starts[candidates]
+    candidate_lengths = lengths[candidates]
+    distinct_shares = np.array([len(np.unique(hit_values[start:start + length])) / length for start, length in
+                                zip(candidate_starts.tolist(), candidate_lengths.tolist())])
+    if gadget_filter.call_filter:
+        checks = np.ones(len(candidates))
+    else:
+        positions = np.concatenate([np.arange(start, start + length) for start, length in
+                                    zip(candidate_starts.tolist(), candidate_lengths.tolist())])
+        is_call_preceded = gadget_filter.are_prev_instructions_call(fm, hit_values[positions])
+        offsets = np.concatenate(([0], np.cumsum(candidate_lengths)[:-1]))
+        checks = 1 - np.add.reduceat(is_call_preceded.astype(np.int64), offsets) / candidate_lengths
+    scores = upper_scores[candidates] * distinct_shares * checks
+
+    for start, length, score in zip(candidate_starts.tolist(), candidate_lengths.tolist(), scores.tolist()):
+        if score > top_chains.get_min_score():
+            top_chains.push(score, stack_hits.get_chain(start, length, fm.word_size), source)
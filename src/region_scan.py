@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from rop_chains import StackHits
+from run_stats import NO_STATS, RunStats
+
+WRITABLE_PROTECTIONS = ("PAGE_READWRITE", "PAGE_WRITECOPY", "PAGE_EXECUTE_READWRITE", "PAGE_EXECUTE_WRITECOPY")
+REGION_CHUNK_SIZE = 64 << 20  # bytes of a region scanned by one task
+
+
+def is_writable_protection(memory_protection: str) -> bool:
+    # the protection may carry modifiers, e.g. PAGE_READWRITE | PAGE_GUARD
+    return any(protection in memory_protection.split() for protection in WRITABLE_PROTECTIONS)
+
+
+def get_writable_regions(fm: ProcessDumpManager) -> List[dict]:
+    """
+    Returns the dumped regions that are writable, where a pivoted stack can be placed: the writable IMG
+    regions of dmp_info (data of the modules) and the writable regions of data_info (e.g. the heap), which
+    are scanned but are not gadget targets.
+    """
+    return [region for region in fm.dmp_info + fm.data_info if is_writable_protection(region["Memory protection"])]
+
+
+def split_region_chunks(fm: ProcessDumpManager, regions: List[dict],
+                        chunk_size: int = REGION_CHUNK_SIZE) -> List[Tuple[int, int, int]]:
+    """
+    Splits the regions into chunks of at most chunk_size bytes, aligned to WORDs.
+
+    Returns:
+        List[Tuple[int, int, int]]: (position in regions, first WORD, end WORD) of every chunk, in region order.
+    """
+    chunk_words = max(1, chunk_size // fm.word_size)
+    chunks = []
+    for region_number, region in enumerate(regions):
+        low, high = region["Memory region"]
+        word_count = (high - low + 1) // fm.word_size
+        for word_start in range(0, word_count, chunk_words):
+            chunks.append((region_number, word_start, min(word_start + chunk_words, word_count)))
+    return chunks
+
+
+def scan_region_chunk(fm: ProcessDumpManager, gadget_filter: GadgetFilter, region: dict, word_start: int,
+                      word_end: int, stats: RunStats = NO_STATS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the gadget hits of one chunk of a region. Only the bytes of the chunk are read from its file.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Positions (in WORDs, from the start of the region) and values of the hits.
+    """
+    empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=fm.word_dtype)
+    with stats.timer("region_mapping"):
+        try:
+            member = fm.storage.open_member(region["Filename"])
+        except IOError:
+            print(f"Error: Could not open or read file {fm.storage.get_display_path(region['Filename'])}")
+            return empty
+    try:
+        # the file may be shorter than the region recorded in its name
+        word_end = min(word_end, member.size // fm.word_size)
+        if word_end <= word_start:
+            return empty
+        with stats.timer("region_mapping"):
+            chunk_bytes = member.read(word_start * fm.word_size, (word_end - word_start) * fm.word_size)
+        words = np.frombuffer(chunk_bytes, dtype=fm.word_dtype)
+        stats.count("region_bytes_read", words.nbytes)
+        hit_indices = gadget_filter.find_hits(fm, words, stats)
+        return hit_indices + word_start, words[hit_indices].copy()
+    finally:
+        member.close()
+
+
+def scan_writable_regions(fm: ProcessDumpManager, gadget_filter: GadgetFilter, jobs: int = 1,
+                          chunk_size: int = REGION_CHUNK_SIZE, stats: RunStats = NO_STATS) -> Iterator[StackHits]:
+    """
+    Scans every writable region of the dump for gadget hits, as scan_stacks does with the stacks, to find
+    ROPchains of stacks pivoted to the heap or to the data of a module. Regions can be very large, so they
+    are split into chunks of chunk_size bytes that are scanned in parallel with jobs worker processes.
+
+    The hits of a WORD do not depend on its neighbours, so the chunks need no overlap: the hits of all the
+    chunks of a region are joined in order before being yielded, and a ROPchain crossing a chunk edge is
+    segmented exactly as if the region had been scanned at once.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        gadget_filter (GadgetFilter): Decides which WORDs are gadget hits.
+        jobs (int): Number of worker processes.
+        chunk_size (int): Bytes of a region scanned by one task.
+        stats (RunStats): Records the time and counters of the scan.
+
+    Yields:
+        StackHits: The hits of every writable region (see get_writable_regions). Its stack is the dmp_info
+        or data_info entry of the region with its base_address, so every ROPchain is attributed to its
+        region file.
+    """
+    regions = get_writable_regions(fm)
+    chunks = split_region_chunks(fm, regions, chunk_size)
+    stats.count("writable_regions", len(regions))
+    stats.count("region_chunks", len(chunks))
+
+    if jobs > 1 and len(chunks) > 1:
+        worker_cache_counters = {}  # worker pid -> its last cumulative cache counters
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_region_scan_worker,
+                                       initargs=(fm, gadget_filter, regions, stats.enabled))
+        results = executor.map(scan_region_chunk_in_worker, chunks)
+    else:
+        executor = None
+        # the counters of fm are cumulative, only what this scan adds is counted
+        initial_cache_counters = gadget_filter.get_cache_counters(fm) if stats.enabled else {}
+        results = (scan_region_chunk(fm, gadget_filter, regions[region_number], word_start, word_end, stats)
+                   for region_number, word_start, word_end in chunks)
+
+    try:
+        region_hits = []  # hits of the chunks of the current region
+        for chunk_number, (chunk, result) in enumerate(zip(chunks, results)):
+            if executor is not None:
+                result, pid, stats_state, cache_counters = result
+                stats.merge(stats_state)
+                worker_cache_counters[pid] = cache_counters
+            region_hits.append(result)
+
+            region_number = chunk[0]
+            if chunk_number + 1 < len(chunks) and chunks[chunk_number + 1][0] == region_number:
+                continue
+            region = regions[region_number]
+            word_count = (region["Memory region"][1] - region["Memory region"][0] + 1) // fm.word_size
+            yield StackHits(dict(region, base_address=region["Memory region"][0]), word_count,
+                            np.concatenate([hit_indices for hit_indices, _ in region_hits]),
+                            np.concatenate([hit_values for _, hit_values in region_hits]))
+            region_hits = []
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if executor is not None:
+        for cache_counters in worker_cache_counters.values():
+            for name, value in cache_counters.items():
+                stats.count(name, value)
+    elif stats.enabled:
+        for name, value in gadget_filter.get_cache_counters(fm).items():
+            stats.count(name, value - initial_cache_counters.get(name, 0))
+
+
+# State of each worker process of scan_writable_regions
+worker_dump_manager = None
+worker_gadget_filter = None
+worker_regions = None
+worker_stats_enabled = False
+
+
+def init_region_scan_worker(fm: ProcessDumpManager, gadget_filter: GadgetFilter, regions: List[dict],
+                            stats_enabled: bool):
+    global worker_dump_manager, worker_gadget_filter, worker_regions, worker_stats_enabled
+    worker_dump_manager = fm
+    worker_gadget_filter = gadget_filter
+    worker_regions = regions
+    worker_stats_enabled = stats_enabled
+
+
+def scan_region_chunk_in_worker(chunk: Tuple[int, int, int]) -> tuple:
+    """
+    Scans one chunk of a region in a worker process.
+
+    Returns:
+        tuple: The result of scan_region_chunk, the pid of the worker, the state of its RunStats and its
+        cumulative cache counters.
+    """
+    stats = RunStats() if worker_stats_enabled else NO_STATS
+    region_number, word_start, word_end = chunk
+    result = scan_region_chunk(worker_dump_manager, worker_gadget_filter, worker_regions[region_number], word_start,
+                               word_end, stats)
+    cache_counters = worker_gadget_filter.get_cache_counters(worker_dump_manager) if stats.enabled else {}
+    return result, os.getpid(), stats.get_state(), cache_counters
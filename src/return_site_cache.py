@@ -0,0 +1,137 @@
+import os
+import tempfile
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from call_filter import CALL_DECODER_VERSION, MAX_CALL_INSTRUCTION_SIZE, decode_call_instructions
+
+BITMAP_CHUNK_SIZE = 1 << 20  # offsets decoded at once when building a bitmap, bounds the memory used
+
+
+def build_return_site_bitmap(region_bytes: np.ndarray, bitness: int) -> np.ndarray:
+    """
+    Marks every offset of an IMG region file that directly follows a valid CALL encoding, i.e. every
+    possible return site. Only the bytes of the file itself are decoded, so a CALL that starts in the
+    previous region is not seen.
+
+    Args:
+        region_bytes (np.ndarray): uint8 array with the contents of the region file.
+        bitness (int): Bitness of the process.
+
+    Returns:
+        np.ndarray: The bitset packed with np.packbits, bit i is set if offset i is a return site.
+    """
+    padded_bytes = np.concatenate([np.zeros(MAX_CALL_INSTRUCTION_SIZE, dtype=np.uint8), region_bytes])
+    # row i holds the MAX_CALL_INSTRUCTION_SIZE bytes before offset i
+    windows = np.lib.stride_tricks.sliding_window_view(padded_bytes, MAX_CALL_INSTRUCTION_SIZE)[:len(region_bytes)]
+    window_offsets = np.arange(MAX_CALL_INSTRUCTION_SIZE, 0, -1)
+
+    is_return_site = np.zeros(len(region_bytes), dtype=bool)
+    for chunk_start in range(0, len(region_bytes), BITMAP_CHUNK_SIZE):
+        chunk_end = min(chunk_start + BITMAP_CHUNK_SIZE, len(region_bytes))
+        available = np.arange(chunk_start, chunk_end)[:, None] >= window_offsets[None, :]
+        is_return_site[chunk_start:chunk_end] = decode_call_instructions(windows[chunk_start:chunk_end], available,
+                                                                         bitness)
+    return np.packbits(is_return_site)
+
+
+class ReturnSiteCache:
+    def __init__(self, cache_dir: str):
+        """
+        On-disk cache of return site bitmaps (see build_return_site_bitmap), shared between dumps. Bitmaps are
+        keyed by the SHA-256 of the region file recorded in results.txt, by the bitness and by
+        CALL_DECODER_VERSION, so each module is decoded only once no matter how many processes it is mapped
+        into, and bitmaps of an older decoder are not reused.
+
+        Args:
+            cache_dir (str): Directory of the cache. Created if it doesn't exist.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.bitmaps = {}  # (SHA-256, bitness) -> loaded bitmap
+        self.built = 0
+        self.loaded = 0
+
+    def __getstate__(self) -> dict:
+        # bitmaps are loaded again from disk by worker processes
+        return dict(self.__dict__, bitmaps={})
+
+    def get_bitmap_path(self, sha256: str, bitness: int) -> str:
+        return os.path.join(self.cache_dir, f"{sha256.lower()}_{bitness}_v{CALL_DECODER_VERSION}.npy")
+
+    def get_bitmap(self, fm: ProcessDumpManager, region_id: int) -> np.ndarray:
+        """
+        Returns the packed return site bitmap of an IMG region, loading it from the cache or building and
+        storing it if it is not there. If the region file is missing or shorter than the region, the bitmap
+        of the bytes available is returned but not cached, since it does not describe the module of the
+        SHA-256.
+        """
+        sha256 = fm.dmp_info[region_id]["SHA-256"]
+        key = (sha256, fm.bitness)
+        bitmap = self.bitmaps.get(key)
+        if bitmap is not None:
+            return bitmap
+
+        bitmap_path = self.get_bitmap_path(sha256, fm.bitness)
+        try:
+            bitmap = np.load(bitmap_path)
+            self.loaded += 1
+        except (IOError, ValueError):
+            low, high = fm.dmp_info[region_id]["Memory region"]
+            region_bytes = fm.get_img_region_array(region_id)
+            bitmap = build_return_site_bitmap(region_bytes, fm.bitness)
+            self.built += 1
+            if len(region_bytes) < high - low + 1:
+                return bitmap
+            self.save_bitmap(bitmap_path, bitmap)
+
+        self.bitmaps[key] = bitmap
+        return bitmap
+
+    def save_bitmap(self, bitmap_path: str, bitmap: np.ndarray):
+        """
+        Stores a bitmap atomically. Every writer uses its own temporary file, so processes building the
+        bitmap of the same module at the same time (batch runs, --jobs) do not write into the same file.
+        Errors are ignored (e.g. read-only cache), the bitmap is then built again by the next run.
+        """
+        try:
+            bitmap_file = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False)
+        except OSError:
+            return
+        try:
+            with bitmap_file:
+                np.save(bitmap_file, bitmap)
+            os.replace(bitmap_file.name, bitmap_path)
+        except OSError:
+            try:
+                os.remove(bitmap_file.name)
+            except OSError:
+                pass
+
+    def are_return_sites(self, fm: ProcessDumpManager, addresses: np.ndarray) -> np.ndarray:
+        """
+        Same check as call_filter.are_prev_instructions_call, as one bit lookup per address.
+
+        Args:
+            fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+            addresses (np.ndarray): Array of candidate return addresses.
+
+        Returns:
+            np.ndarray: Boolean mask, True where the previous instruction is a CALL instruction.
+        """
+        addresses = np.asarray(addresses, dtype=np.uint64)
+        region_ids = fm.region_index.lookup_many(addresses)
+        is_return_site = np.zeros(len(addresses), dtype=bool)
+
+        for region_id in np.unique(region_ids[region_ids >= 0]).tolist():
+            selected = region_ids == region_id
+            bitmap = self.get_bitmap(fm, region_id)
+            if not len(bitmap):
+                continue
+            offsets = addresses[selected] - np.uint64(fm.dmp_info[region_id]["Memory region"][0])
+            in_bitmap = offsets < len(bitmap) * 8
+            offsets = np.where(in_bitmap, offsets, np.uint64(0))
+            bits = (bitmap[offsets >> np.uint64(3)] >> (np.uint64(7) - (offsets & np.uint64(7))).astype(np.uint8)) & 1
+            is_return_site[selected] = in_bitmap & (bits == 1)
+
+        return is_return_site
@@ -0,0 +1,198 @@
+import json
+import os
+import tempfile
+from array import array
+from typing import List, Tuple
+
+import numpy as np
+
+COLUMN_BUFFER_SIZE = 1 << 16  # values of a column kept in memory before they are appended to its file
+
+
+def get_results_arrays_file_path(results_dir: str, distance_between_gadgets: int, min_chain_length: int) -> str:
+    return os.path.join(results_dir, "ROPchains_" + str(distance_between_gadgets) + "_" + str(min_chain_length) + ".npz")
+
+
+class ColumnFile:
+    def __init__(self, typecode: str, dtype: type, directory: str):
+        """
+        One column of the results, appended to an unnamed temporary file in blocks of COLUMN_BUFFER_SIZE
+        values, so only the last block is kept in memory.
+
+        Args:
+            typecode (str): array typecode of the values.
+            dtype (type): numpy dtype of the same values.
+            directory (str): Directory of the temporary file, that of the results so no other disk is used.
+        """
+        self.values = array(typecode)  # values not written yet
+        self.dtype = dtype
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.count = 0
+
+    def append(self, value):
+        self.values.append(value)
+        self.count += 1
+        if len(self.values) >= COLUMN_BUFFER_SIZE:
+            self.flush()
+
+    def extend(self, values):
+        self.values.extend(values)
+        self.count += len(values)
+        if len(self.values) >= COLUMN_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.values.tobytes())
+        del self.values[:]
+
+    def get_array(self) -> np.ndarray:
+        """
+        Returns the whole column mapped from its temporary file, read from disk as it is used.
+        """
+        self.flush()
+        self.file.flush()
+        if not self.count:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.file, dtype=self.dtype, mode='r', shape=(self.count,))
+
+    def close(self):
+        self.file.close()
+
+
+class RopChainArrayWriter:
+    def __init__(self, file_path: str, metadata: dict):
+        """
+        Collects the ROPchains of one combination of parameters in compact columnar arrays and saves them
+        as an .npz file on close:
+            - chain_starts: position in pairs of the first pair of every ROPchain.
+            - chain_lengths: number of pairs of every ROPchain.
+            - pairs: (stack address, gadget address) of every hit of every ROPchain, shape (n, 2).
+            - metadata: JSON string with the run parameters and the number of ROPchains.
+            - chain_sources: only if some ROPchain was written with a source, position in metadata["sources"]
+              of the dump file of every ROPchain (-1 if it has no source).
+            - chain_scores: only if the ROPchains were written with a score (see ranked_chains), the score of
+              every ROPchain.
+        The columns are streamed to temporary files next to the .npz as the ROPchains are written, so memory
+        does not grow with the number of ROPchains.
+
+        Args:
+            file_path (str): Path of the .npz file.
+            metadata (dict): Run parameters (x, y, folder...) stored in the file.
+        """
+        self.file_path = file_path
+        self.metadata = metadata
+        directory = os.path.dirname(os.path.abspath(file_path))
+        self.chain_starts = ColumnFile('Q', np.uint64, directory)
+        self.chain_lengths = ColumnFile('Q', np.uint64, directory)
+        self.pairs = ColumnFile('Q', np.uint64, directory)  # flattened (stack address, gadget address) pairs
+        self.chain_sources = ColumnFile('i', np.int32, directory)
+        self.chain_scores = ColumnFile('d', np.float64, directory)
+        self.sources = {}  # source -> position in metadata["sources"]
+        self.chain_count = 0
+
+    def write_chain(self, matches: List[Tuple[int, int]], source: str | None = None, score: float | None = None):
+        self.chain_count += 1
+        if score is not None:
+            self.chain_scores.append(score)
+        self.chain_sources.append(-1 if source is None else self.sources.setdefault(source, len(self.sources)))
+        self.chain_starts.append(self.pairs.count // 2)
+        self.chain_lengths.append(len(matches))
+        for match in matches:
+            self.pairs.extend(match)
+
+    def close(self):
+        metadata = dict(self.metadata, chain_count=self.chain_count)
+        arrays = {}
+        try:
+            if self.sources:
+                metadata["sources"] = list(self.sources)
+                arrays["chain_sources"] = self.chain_sources.get_array()
+            if self.chain_scores.count:
+                arrays["chain_scores"] = self.chain_scores.get_array()
+            # np.savez copies the mapped columns into the archive in chunks
+            np.savez(
+                self.file_path,
+                chain_starts=self.chain_starts.get_array(),
+                chain_lengths=self.chain_lengths.get_array(),
+                pairs=self.pairs.get_array().reshape(-1, 2),
+                metadata=np.array(json.dumps(metadata)),
+                **arrays
+            )
+        finally:
+            arrays.clear()
+            for column in (self.chain_starts, self.chain_lengths, self.pairs, self.chain_sources, self.chain_scores):
+                column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RopChainResults:
+    def __init__(self, file_path: str):
+        """
+        Reads an .npz results file written by RopChainArrayWriter. The arrays are only loaded when they
+        are accessed, so getting the metadata or the number of ROPchains does not read the pairs.
+
+        Args:
+            file_path (str): Path of the .npz file.
+        """
+        self.file_path = file_path
+        with np.load(file_path) as data:
+            self.metadata = json.loads(str(data["metadata"]))
+        self.arrays = {}
+
+    def get_array(self, name: str) -> np.ndarray:
+        if name not in self.arrays:
+            with np.load(self.file_path) as data:
+                self.arrays[name] = data[name]
+        return self.arrays[name]
+
+    @property
+    def chain_starts(self) -> np.ndarray:
+        return self.get_array("chain_starts")
+
+    @property
+    def chain_lengths(self) -> np.ndarray:
+        return self.get_array("chain_lengths")
+
+    @property
+    def pairs(self) -> np.ndarray:
+        return self.get_array("pairs")
+
+    @property
+    def chain_count(self) -> int:
+        return self.metadata["chain_count"]
+
+    def __len__(self) -> int:
+        return self.chain_count
+
+    def get_chain_source(self, chain_index: int) -> str | None:
+        """
+        Returns the dump file where a ROPchain was found, or None if it was not recorded.
+        """
+        if "sources" not in self.metadata:
+            return None
+        source_index = int(self.get_array("chain_sources")[chain_index])
+        return self.metadata["sources"][source_index] if source_index >= 0 else None
+
+    def get_chain_score(self, chain_index: int) -> float | None:
+        """
+        Returns the score of a ROPchain, or None if the results were not ranked.
+        """
+        if "top_chains" not in self.metadata:
+            return None
+        return float(self.get_array("chain_scores")[chain_index])
+
+    def get_chain(self, chain_index: int) -> np.ndarray:
+        """
+        Returns the (stack address, gadget address) pairs of a ROPchain as an array of shape (length, 2).
+        """
+        start = int(self.chain_starts[chain_index])
+        return self.pairs[start:start + int(self.chain_lengths[chain_index])]
+
+
+def load_rop_chain_results(file_path: str) -> RopChainResults:
+    return RopChainResults(file_path)
@@ -0,0 +1,294 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from rop_chain_results import RopChainArrayWriter, get_results_arrays_file_path
+from ranked_chains import TopChains, add_stack_chains
+from run_stats import NO_STATS, RunStats
+
+
+class StackHits:
+    def __init__(self, stack: dict, word_count: int, hit_indices: np.ndarray, hit_values: np.ndarray):
+        """
+        Gadget hits found in one stack dmp file.
+
+        Args:
+            stack (dict): The stack_info entry of the file.
+            word_count (int): Number of WORDs in the stack.
+            hit_indices (np.ndarray): Sorted positions (in WORDs) of the hits in the stack.
+            hit_values (np.ndarray): The WORD found at each hit, i.e. the gadget address.
+        """
+        self.stack = stack
+        self.word_count = word_count
+        self.hit_indices = hit_indices
+        self.hit_values = hit_values
+
+    def get_chain(self, start: int, length: int, word_size: int) -> List[Tuple[int, int]]:
+        """
+        Returns the (stack address, gadget address) pairs of the hits[start:start + length] ROPchain.
+        """
+        base_address = self.stack['base_address']
+        return [(base_address + index * word_size, value) for index, value in
+                zip(self.hit_indices[start:start + length].tolist(), self.hit_values[start:start + length].tolist())]
+
+
+def scan_stacks(fm: ProcessDumpManager, gadget_filter: GadgetFilter, jobs: int = 1,
+                stats: RunStats = NO_STATS) -> Iterator[StackHits]:
+    """
+    Scans every stack dmp file once and keeps only its gadget hits.
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        gadget_filter (GadgetFilter): Decides which WORDs are gadget hits.
+        jobs (int): Number of worker processes. The stack files are independent, so with more than one job
+            they are spread over a process pool. Results are always yielded in stack_info order.
+        stats (RunStats): Records the time and counters of the scan. With several jobs, every worker records
+            its own and they are merged here.
+
+    Yields:
+        StackHits: The hits of every stack, in stack_info order.
+    """
+    if jobs > 1 and len(fm.stack_info) > 1:
+        worker_cache_counters = {}  # worker pid -> its last cumulative cache counters
+        # fm is pickled once per worker, without open files (see ProcessDumpManager.__getstate__)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_scan_worker,
+                                 initargs=(fm, gadget_filter, stats.enabled)) as executor:
+            results = executor.map(scan_stack_file, range(len(fm.stack_info)))
+            for index, result in enumerate(results):
+                if result is None:
+                    continue
+                if stats.enabled:
+                    result, pid, stats_state, cache_counters = result
+                    stats.merge(stats_state)
+                    worker_cache_counters[pid] = cache_counters
+                yield StackHits(fm.stack_info[index], *result)
+        for cache_counters in worker_cache_counters.values():
+            for name, value in cache_counters.items():
+                stats.count(name, value)
+        return
+
+    # the counters of fm are cumulative, only what this scan adds is counted
+    initial_cache_counters = gadget_filter.get_cache_counters(fm) if stats.enabled else {}
+    stack_files = fm.iter_stack_words()
+    while True:
+        with stats.timer("stack_mapping"):
+            stack, words = next(stack_files, (None, None))
+        if stack is None:
+            break
+        stats.count("stack_bytes_read", words.nbytes)
+        hit_indices = gadget_filter.find_hits(fm, words, stats)
+        yield StackHits(stack, len(words), hit_indices, words[hit_indices])
+    if stats.enabled:
+        for name, value in gadget_filter.get_cache_counters(fm).items():
+            stats.count(name, value - initial_cache_counters.get(name, 0))
+
+
+# State of each worker process of scan_stacks
+worker_dump_manager = None
+worker_gadget_filter = None
+worker_stats_enabled = False
+
+
+def init_scan_worker(fm: ProcessDumpManager, gadget_filter: GadgetFilter, stats_enabled: bool = False):
+    global worker_dump_manager, worker_gadget_filter, worker_stats_enabled
+    worker_dump_manager = fm
+    worker_gadget_filter = gadget_filter
+    worker_stats_enabled = stats_enabled
+
+
+def scan_stack_file(index: int) -> tuple | None:
+    """
+    Scans one stack dmp file in a worker process.
+
+    Returns:
+        tuple | None: Number of WORDs, hit positions and hit values of the stack, or None if the file cannot be
+        opened. If stats are enabled, the tuple is wrapped together with the pid of the worker, the state of
+        its RunStats and its cumulative cache counters.
+    """
+    stats = RunStats() if worker_stats_enabled else NO_STATS
+    with stats.timer("stack_mapping"):
+        words = worker_dump_manager.map_stack_dmp_file(index)
+    if words is None:
+        return None
+    stats.count("stack_bytes_read", words.nbytes)
+    hit_indices = worker_gadget_filter.find_hits(worker_dump_manager, words, stats)
+    result = len(words), hit_indices, words[hit_indices].copy()
+    worker_dump_manager.close_current_stack_dmp_file()
+    if stats.enabled:
+        return (result, os.getpid(), stats.get_state(),
+                worker_gadget_filter.get_cache_counters(worker_dump_manager))
+    return result
+
+
+def segment_rop_chains(hit_indices: np.ndarray, distance_between_gadgets: int,
+                       min_chain_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the boundaries of all the ROPchains of one stack at once. A new ROPchain starts at every hit
+    separated from the previous one by more than distance_between_gadgets WORDs that are not hits, and
+    ROPchains shorter than min_chain_length are discarded. The end of the stack follows the same rule as a
+    gap: the last ROPchain is kept if it has at least min_chain_length hits, also when its last hit is the
+    last WORD of the stack (the legacy loop required more than min_chain_length hits in that case).
+
+    For example, hits at WORDs 0, 1, 3, 9, 10 and 20 with x = 1 form the runs [0, 1, 3], [9, 10] and [20],
+    so with y = 2 the result is starts [0, 3] and lengths [3, 2].
+
+    Args:
+        hit_indices (np.ndarray): Sorted positions of the hits in the stack.
+        distance_between_gadgets (int): Maximum DWORD separation (x).
+        min_chain_length (int): Minimum ROPchain length (y).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Position in hit_indices of the first hit of every ROPchain and its length.
+    """
+    hit_indices = np.asarray(hit_indices, dtype=np.int64)
+    if not len(hit_indices):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    gaps = np.diff(hit_indices) - 1  # WORDs that are not hits between consecutive hits
+    starts = np.concatenate(([0], np.flatnonzero(gaps > distance_between_gadgets) + 1))
+    lengths = np.diff(np.append(starts, len(hit_indices)))
+    kept = lengths >= min_chain_length
+    return starts[kept], lengths[kept]
+
+
+def get_results_file_path(results_dir: str, distance_between_gadgets: int, min_chain_length: int) -> str:
+    return os.path.join(results_dir, "ROPchains_" + str(distance_between_gadgets) + "_" + str(min_chain_length) + ".txt")
+
+
+class RopChainWriter:
+    def __init__(self, file_path: str, distance_between_gadgets: int, min_chain_length: int):
+        """
+        Writes the ROPchains of one combination of parameters to a text file as they are found.
+
+        Args:
+            file_path (str): Path of the results file.
+            distance_between_gadgets (int): Maximum DWORD separation (x).
+            min_chain_length (int): Minimum ROPchain length (y).
+        """
+        self.file = open(file_path, "w")
+        self.chain_count = 0
+        self.file.write(f"Matches for x={distance_between_gadgets} and y={min_chain_length}:\n")
+
+    def write_chain(self, matches: List[Tuple[int, int]], source: str | None = None, score: float | None = None):
+        """
+        Appends one ROPchain, given as its (stack address, gadget address) pairs, to the file. The dump file
+        where it was found and its score (see ranked_chains) are added to its header if given.
+        """
+        self.chain_count += 1
+        header = f"length: {len(matches)}"
+        if source is not None:
+            header += f", region: {source}"
+        if score is not None:
+            header += f", score: {score:.4f}"
+        self.file.write(f"ROPchain {self.chain_count} ({header}):\n")
+        for match in matches:
+            self.file.write(
+                f"{hex(match[0])}:    {hex(match[1])}\n"  # The address and the value
+            )
+        self.file.write("\n")  # Add a blank line between sequences for readability
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run_sweep(fm: ProcessDumpManager, distances_between_gadgets: List[int], min_chain_lengths: List[int],
+              results_dir: str, gadget_filter: GadgetFilter | None = None, jobs: int = 1,
+              stats: RunStats = NO_STATS, stack_hits_source: Iterable[StackHits] | None = None,
+              top_chains: int | None = None) -> dict:
+    """
+    Scans the stacks once and writes the ROPchains_x_y.txt file of every (x, y) combination from the
+    same hits. The ROPchains are written as soon as they are found, or, with top_chains, only the best
+    scored ones are kept and written at the end, best first. The same ROPchains are also saved in
+    columnar form to ROPchains_x_y.npz (see rop_chain_results).
+
+    Args:
+        fm (ProcessDumpManager): The FileManager instance to access the memory dump files.
+        distances_between_gadgets (List[int]): Values of x.
+        min_chain_lengths (List[int]): Values of y.
+        results_dir (str): Directory where the results files are written. Created if it doesn't exist.
+        gadget_filter (GadgetFilter | None): Decides which WORDs are gadget hits. By default every WORD that
+            points to an IMG region.
+        jobs (int): Number of worker processes used to scan the stacks.
+        stats (RunStats): Records the time of every stage, the number of ROPchains written (chains_emitted)
+            and, with top_chains, the number of ROPchains scored (chains_ranked).
+        stack_hits_source (Iterable[StackHits] | None): Hits to segment instead of the hits of the stacks,
+            e.g. scan_writable_regions. The ROPchains of StackHits whose stack is a dmp_info or data_info
+            entry are attributed to its region file.
+        top_chains (int | None): Number of ROPchains kept for every (x, y) combination, scored by
+            ranked_chains.add_stack_chains. All of them are written if None.
+
+    Returns:
+        dict: Number of ROPchains written for every (x, y) combination.
+    """
+    if gadget_filter is None:
+        gadget_filter = GadgetFilter()
+    os.makedirs(results_dir, exist_ok=True)
+    writers = {}
+    try:
+        for distance_between_gadgets in distances_between_gadgets:
+            for min_chain_length in min_chain_lengths:
+                file_path = get_results_file_path(results_dir, distance_between_gadgets, min_chain_length)
+                metadata = {
+                    "folder_name": fm.folder_name,
+                    "bitness": fm.bitness,
+                    "distance_between_gadgets": distance_between_gadgets,
+                    "min_chain_length": min_chain_length,
+                    "call_filter": gadget_filter.call_filter,
+                    "validate_gadgets": gadget_filter.validator.max_instructions if gadget_filter.validator else None,
+                }
+                if top_chains is not None:
+                    metadata["top_chains"] = top_chains
+                writers[(distance_between_gadgets, min_chain_length)] = (
+                    RopChainWriter(file_path, distance_between_gadgets, min_chain_length),
+                    RopChainArrayWriter(
+                        get_results_arrays_file_path(results_dir, distance_between_gadgets, min_chain_length),
+                        metadata
+                    )
+                )
+        ranked = {parameters: TopChains(top_chains) for parameters in writers} if top_chains is not None else None
+
+        # every stack is fed to all the combinations and dropped, so memory does not grow with the dump
+        if stack_hits_source is None:
+            stack_hits_source = scan_stacks(fm, gadget_filter, jobs, stats)
+        for stack_hits in stack_hits_source:
+            source = stack_hits.stack.get("Filename")  # only dmp_info entries have it, stacks use file_name
+            for (distance_between_gadgets, min_chain_length), parameter_writers in writers.items():
+                with stats.timer("segmentation"):
+                    starts, lengths = segment_rop_chains(stack_hits.hit_indices, distance_between_gadgets,
+                                                         min_chain_length)
+                if ranked is not None:
+                    with stats.timer("ranking"):
+                        add_stack_chains(ranked[(distance_between_gadgets, min_chain_length)], fm, gadget_filter,
+                                         stack_hits, starts, lengths, source)
+                    stats.count("chains_ranked", len(starts))
+                else:
+                    with stats.timer("writer"):
+                        for start, length in zip(starts.tolist(), lengths.tolist()):
+                            matches = stack_hits.get_chain(start, length, fm.word_size)
+                            for writer in parameter_writers:
+                                writer.write_chain(matches, source)
+                    stats.count("chains_emitted", len(starts))
+
+        if ranked is not None:
+            with stats.timer("writer"):
+                for parameters, parameter_writers in writers.items():
+                    for score, matches, source in ranked[parameters].get_chains():
+                        for writer in parameter_writers:
+                            writer.write_chain(matches, source, score)
+                        stats.count("chains_emitted")
+    finally:
+        with stats.timer("writer"):
+            for parameter_writers in writers.values():
+                for writer in parameter_writers:
+                    writer.close()
+
+    return {parameters: parameter_writers[0].chain_count for parameters, parameter_writers in writers.items()}
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+RUN_STATS_VERSION = 1  # increase when the format of the report changes
+
+
+class StageTimer:
+    def __init__(self, timers: dict, name: str):
+        self.timers = timers
+        self.name = name
+        self.start_time = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timers[self.name] += time.perf_counter() - self.start_time
+
+
+class RunStats:
+    enabled = True
+
+    def __init__(self):
+        """
+        Timers and counters of one run. Stages are timed with the timer context manager and events are
+        counted with count. Both are called once per stack or per batch of addresses, never per WORD.
+        """
+        self.timers = defaultdict(float)  # stage -> seconds
+        self.counters = defaultdict(int)  # counter -> value
+        self.start_time = time.perf_counter()
+
+    def timer(self, name: str) -> StageTimer:
+        return StageTimer(self.timers, name)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def get_state(self) -> dict:
+        """
+        Returns the timers and counters as a picklable dict, to be merged into the stats of the parent process.
+        """
+        return {"timers": dict(self.timers), "counters": dict(self.counters)}
+
+    def merge(self, state: dict):
+        for name, seconds in state["timers"].items():
+            self.timers[name] += seconds
+        for name, value in state["counters"].items():
+            self.counters[name] += value
+
+    def get_cache_hit_rates(self) -> dict:
+        """
+        Returns the hit rate of every cache with <cache>_hits and <cache>_misses counters.
+        """
+        hit_rates = {}
+        for name, hits in self.counters.items():
+            if name.endswith("_hits") and name[:-len("_hits")] + "_misses" in self.counters:
+                accesses = hits + self.counters[name[:-len("_hits")] + "_misses"]
+                hit_rates[name[:-len("_hits")]] = hits / accesses if accesses else 0.0
+        return hit_rates
+
+    def get_report(self, **extra) -> dict:
+        """
+        Returns the report of the run: elapsed time, WORDs per second, stage times, counters and the extra
+        information given (e.g. cache statistics).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        words_scanned = self.counters.get("words_scanned", 0)
+        report = {
+            "version": RUN_STATS_VERSION,
+            "timestamp": time.time(),
+            "elapsed_seconds": elapsed,
+            "words_per_second": words_scanned / elapsed if elapsed else 0.0,
+            "stage_seconds": dict(self.timers),
+            "counters": dict(self.counters),
+            "cache_hit_rates": self.get_cache_hit_rates(),
+        }
+        report.update(extra)
+        return report
+
+    def save_report(self, file_path: str, **extra):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path, 'w') as report_file:
+            json.dump(self.get_report(**extra), report_file, indent=2)
+
+
+class DisabledRunStats(RunStats):
+    """
+    RunStats that records nothing, used when --stats is not given.
+    """
+    enabled = False
+    null_timer = nullcontext()
+
+    def timer(self, name: str) -> nullcontext:
+        return self.null_timer
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def merge(self, state: dict):
+        pass
+
+
+NO_STATS = DisabledRunStats()
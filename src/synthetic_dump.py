@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from minidump import MEM_IMAGE, MEM_PRIVATE, PAGE_PROTECTIONS
+
+REGION_ALIGNMENT = 0x10000  # allocation granularity of Windows
+BASE_ADDRESSES = {32: 0x10000000, 64: 0x7FF800000000}  # first IMG region
+STACK_BASE_ADDRESSES = {32: 0x00100000, 64: 0x000000A000000000}  # first stack
+
+CALL_REL32_SIZE = 5
+GADGET_ENCODINGS = [bytes.fromhex(gadget) for gadget in ("58c3", "59c3", "5ac3", "5dc3", "ffe0", "ffd0", "c3")]
+
+
+def write_results_file(file_path: str, lines: list):
+    with open(file_path, 'w') as results_file:
+        results_file.write("\n".join(lines) + "\n")
+
+
+def generate_region_bytes(rng: np.random.Generator, region_size: int, call_sites: int, gadgets: int) -> tuple:
+    """
+    Generates the contents of an IMG region: random bytes with CALL rel32 instructions and short gadgets
+    planted at random offsets.
+
+    Returns:
+        tuple: The bytes of the region, the offsets that follow a CALL (return sites) and the offsets of the
+        gadgets.
+    """
+    region_bytes = rng.integers(0, 256, region_size, dtype=np.uint8)
+    # the gadgets are planted after the CALLs so they are never overwritten
+    call_offsets = np.sort(rng.choice(region_size // 16, call_sites, replace=False)) * 16
+    for offset in call_offsets.tolist():
+        region_bytes[offset] = 0xE8
+    gadget_offsets = np.sort(rng.choice(region_size // 16, gadgets, replace=False)) * 16 + 8
+    for offset in gadget_offsets.tolist():
+        encoding = GADGET_ENCODINGS[offset % len(GADGET_ENCODINGS)]
+        region_bytes[offset:offset + len(encoding)] = np.frombuffer(encoding, dtype=np.uint8)
+    return region_bytes, call_offsets + CALL_REL32_SIZE, gadget_offsets
+
+
+def generate_dump_folder(folder_name: str, bitness: int = 64, stack_count: int = 8, stack_size: int = 0x40000,
+                         region_count: int = 64, region_size: int = 0x40000, return_address_density: float = 0.05,
+                         pointer_density: float = 0.02, chain_density: float = 0.0005, chain_length: int = 8,
+                         writable_region_count: int = 0, seed: int = 0) -> dict:
+    """
+    Writes a synthetic dump folder with the layout expected by ProcessDumpManager:
+        - results.txt with the bitness of the process and a line per IMG region file.
+        - A <lowest address>_<size>.dmp file per IMG region.
+        - stacks/results.txt with a line per stack file.
+        - A stacks/<tid>_<address>_<size>.dmp file per stack.
+        - Optionally, PAGE_READWRITE regions (heap-like data with ROPchains of pivoted stacks) in
+          data/<lowest address>_<size>.dmp files listed in data/results.txt, not in the IMG regions.
+
+    The stacks contain random data, return addresses (WORDs that follow a CALL planted in a region), other
+    pointers into the regions and planted ROPchains of gadget addresses.
+
+    Args:
+        folder_name (str): The folder to create.
+        bitness (int): Bitness of the process, 32 or 64.
+        stack_count (int): Number of stack files.
+        stack_size (int): Size in bytes of every stack file.
+        region_count (int): Number of IMG regions.
+        region_size (int): Size in bytes of every IMG region.
+        return_address_density (float): Fraction of stack WORDs that are return addresses.
+        pointer_density (float): Fraction of stack WORDs that point to a random address of a region.
+        chain_density (float): Planted ROPchains per stack WORD.
+        chain_length (int): Number of gadget addresses of every planted ROPchain.
+        writable_region_count (int): Number of writable regions, of stack_size bytes each.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: Description of the generated folder, with the planted ROPchains as (stack address, length).
+        The ROPchains of the writable regions are included.
+    """
+    rng = np.random.default_rng(seed)
+    word_size = bitness // 8
+    word_dtype = np.dtype('<u4') if word_size == 4 else np.dtype('<u8')
+    os.makedirs(os.path.join(folder_name, "stacks"), exist_ok=True)
+
+    region_stride = -(-region_size // REGION_ALIGNMENT) * REGION_ALIGNMENT + REGION_ALIGNMENT
+    return_addresses = []
+    gadget_addresses = []
+    results_lines = [f"Bitness of the process: {bitness}"]
+    for region_number in range(region_count):
+        low = BASE_ADDRESSES[bitness] + region_number * region_stride
+        region_bytes, return_sites, gadget_offsets = generate_region_bytes(
+            rng, region_size, max(1, region_size // 256), max(1, region_size // 1024)
+        )
+        file_name = f"{low:x}_{region_size:x}.dmp"
+        with open(os.path.join(folder_name, file_name), 'wb') as region_file:
+            region_file.write(region_bytes.tobytes())
+        results_lines.append(f"Filename: {file_name}, SHA-256: {hashlib.sha256(region_bytes).hexdigest()}, "
+                             f"Memory protection: PAGE_EXECUTE_READ")
+        return_addresses.append(low + return_sites)
+        gadget_addresses.append(low + gadget_offsets)
+    write_results_file(os.path.join(folder_name, "results.txt"), results_lines)
+
+    return_addresses = np.concatenate(return_addresses).astype(np.uint64)
+    gadget_addresses = np.concatenate(gadget_addresses).astype(np.uint64)
+    region_lows = BASE_ADDRESSES[bitness] + np.arange(region_count, dtype=np.uint64) * region_stride
+
+    def generate_words(address: int) -> np.ndarray:
+        word_count = stack_size // word_size
+        # small integers and random values that do not point to any region
+        words = np.where(rng.random(word_count) < 0.5, rng.integers(0, 0x10000, word_count),
+                         rng.integers(0, 0x7FFF0000, word_count)).astype(word_dtype)
+
+        is_return_address = rng.random(word_count) < return_address_density
+        words[is_return_address] = rng.choice(return_addresses, is_return_address.sum())
+        is_pointer = rng.random(word_count) < pointer_density
+        words[is_pointer] = (rng.choice(region_lows, is_pointer.sum()) +
+                             rng.integers(0, region_size, is_pointer.sum()).astype(np.uint64))
+
+        for _ in range(rng.poisson(chain_density * word_count)):
+            # gadget addresses, sometimes followed by one argument WORD
+            start = int(rng.integers(0, max(1, word_count - 2 * chain_length)))
+            position = start
+            for _ in range(chain_length):
+                words[position] = rng.choice(gadget_addresses)
+                position += 1 + int(rng.random() < 0.3)
+            planted_chains.append((address + start * word_size, chain_length))
+        return words
+
+    planted_chains = []
+    stacks_lines = []
+    stack_stride = 0x100000 * (-(-stack_size // 0x100000))
+    for stack_number in range(stack_count):
+        stack_address = STACK_BASE_ADDRESSES[bitness] + stack_number * stack_stride
+        stack_bytes = generate_words(stack_address).tobytes()
+        tid = 0x1000 + stack_number * 4
+        file_name = f"{tid:x}_{stack_address:x}_{len(stack_bytes):x}.dmp"
+        with open(os.path.join(folder_name, "stacks", file_name), 'wb') as stack_file:
+            stack_file.write(stack_bytes)
+        stacks_lines.append(f"Filename: {file_name}, SHA-256: {hashlib.sha256(stack_bytes).hexdigest()}")
+    write_results_file(os.path.join(folder_name, "stacks", "results.txt"), stacks_lines)
+
+    # writable regions go after the stacks, far from the IMG regions
+    data_lines = []
+    for region_number in range(writable_region_count):
+        low = STACK_BASE_ADDRESSES[bitness] + (stack_count + region_number) * stack_stride
+        region_bytes = generate_words(low).tobytes()
+        file_name = f"{low:x}_{len(region_bytes):x}.dmp"
+        os.makedirs(os.path.join(folder_name, "data"), exist_ok=True)
+        with open(os.path.join(folder_name, "data", file_name), 'wb') as region_file:
+            region_file.write(region_bytes)
+        data_lines.append(f"Filename: {file_name}, SHA-256: {hashlib.sha256(region_bytes).hexdigest()}, "
+                          f"Memory protection: PAGE_READWRITE")
+    if writable_region_count:
+        write_results_file(os.path.join(folder_name, "data", "results.txt"), data_lines)
+
+    return {
+        "folder_name": folder_name,
+        "bitness": bitness,
+        "stack_count": stack_count,
+        "stack_size": stack_size,
+        "region_count": region_count,
+        "region_size": region_size,
+        "writable_region_count": writable_region_count,
+        "planted_chains": planted_chains,
+    }
+
+
+def write_minidump(folder_name: str, file_path: str):
+    """
+    Converts a dump folder into a full memory Windows minidump with the SystemInfo, ThreadList, ModuleList,
+    MemoryInfoList and Memory64List streams. Every region of results.txt becomes a MEM_IMAGE region with
+    its protection and a module, every region of data/results.txt a private region with its protection and
+    every stack a PAGE_READWRITE private region, so the minidump gives the same ROPchains as the folder.
+    Half of the threads have no Rva for their stack, like in many full memory dumps, so it has to be found
+    in the memory ranges.
+    """
+    fm = ProcessDumpManager(folder_name, use_metadata_index=False)
+    protections = {name: value for value, name in PAGE_PROTECTIONS.items()}
+    ranges = []  # (address, file name inside the folder, protection, memory type)
+    for region in fm.dmp_info:
+        ranges.append((region["Memory region"][0], region["Filename"], protections[region["Memory protection"]],
+                       MEM_IMAGE))
+    for region in fm.data_info:
+        ranges.append((region["Memory region"][0], region["Filename"], protections[region["Memory protection"]],
+                       MEM_PRIVATE))
+    for stack in fm.stack_info:
+        ranges.append((stack["base_address"], os.path.join("stacks", stack["file_name"]), 0x04, MEM_PRIVATE))
+    ranges.sort()
+    contents = []
+    for _, file_name, _, _ in ranges:
+        with open(os.path.join(folder_name, file_name), 'rb') as dump_file:
+            contents.append(dump_file.read())
+    fm.close()
+
+    stream_count = 5
+    system_info = struct.pack("<H54x", 9 if fm.bitness == 64 else 0)
+    module_names = [f"module{region_number}.dll".encode('utf-16-le') for region_number in range(len(fm.dmp_info))]
+    memory_info = struct.pack("<IIQ", 16, 48, len(ranges)) + b''.join(
+        struct.pack("<QQI4xQIII4x", address, address, protection, len(content), 0x1000, protection, memory_type)
+        for (address, _, protection, memory_type), content in zip(ranges, contents)
+    )
+    memory64_header_size = 16 + 16 * len(ranges)
+
+    offset = 32 + 12 * stream_count
+    system_info_rva = offset
+    thread_list_rva = system_info_rva + len(system_info)
+    module_list_rva = thread_list_rva + 4 + 48 * len(fm.stack_info)
+    module_names_rva = module_list_rva + 4 + 108 * len(fm.dmp_info)
+    memory_info_rva = module_names_rva + sum(4 + len(name) for name in module_names)
+    memory64_rva = memory_info_rva + len(memory_info)
+    data_rva = memory64_rva + memory64_header_size
+
+    data_offsets = {}
+    data_offset = data_rva
+    for (address, _, _, _), content in zip(ranges, contents):
+        data_offsets[address] = data_offset
+        data_offset += len(content)
+
+    thread_list = struct.pack("<I", len(fm.stack_info)) + b''.join(
+        struct.pack("<IIIIQQII8x", stack["tid"], 0, 0, 0, 0, stack["base_address"], stack["stack_size"],
+                    data_offsets[stack["base_address"]] if stack_number % 2 == 0 else 0)
+        for stack_number, stack in enumerate(fm.stack_info)
+    )
+    module_list = struct.pack("<I", len(fm.dmp_info))
+    name_rva = module_names_rva
+    for region, name in zip(fm.dmp_info, module_names):
+        low, high = region["Memory region"]
+        module_list += struct.pack("<QIIII84x", low, high - low + 1, 0, 0, name_rva)
+        name_rva += 4 + len(name)
+    memory64_list = struct.pack("<QQ", len(ranges), data_rva) + b''.join(
+        struct.pack("<QQ", address, len(content)) for (address, _, _, _), content in zip(ranges, contents)
+    )
+
+    streams = [(7, system_info, system_info_rva), (3, thread_list, thread_list_rva),
+               (4, module_list, module_list_rva), (16, memory_info, memory_info_rva),
+               (9, memory64_list, memory64_rva)]
+    with open(file_path, 'wb') as minidump_file:
+        minidump_file.write(b'MDMP' + struct.pack("<IIIIIQ", 0xA793, stream_count, 32, 0, 0, 0x802))
+        for stream_type, stream, rva in streams:
+            minidump_file.write(struct.pack("<III", stream_type, len(stream), rva))
+        minidump_file.write(system_info + thread_list + module_list)
+        for name in module_names:
+            minidump_file.write(struct.pack("<I", len(name)) + name)
+        minidump_file.write(memory_info + memory64_list)
+        for content in contents:
+            minidump_file.write(content)
+
+
+def add_synthetic_dump_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the command line arguments of generate_dump_folder.
+    """
+    parser.add_argument("--bitness", type=int, choices=(32, 64), default=64, help="Bitness of the process")
+    parser.add_argument("--stacks", type=int, default=8, help="Number of stack files")
+    parser.add_argument("--stack-size", type=lambda value: int(value, 0), default=0x40000,
+                        help="Size in bytes of every stack file")
+    parser.add_argument("--regions", type=int, default=64, help="Number of IMG regions")
+    parser.add_argument("--region-size", type=lambda value: int(value, 0), default=0x40000,
+                        help="Size in bytes of every IMG region")
+    parser.add_argument("--chain-density", type=float, default=0.0005, help="Planted ROPchains per stack WORD")
+    parser.add_argument("--chain-length", type=int, default=8, help="Gadgets of every planted ROPchain")
+    parser.add_argument("--writable-regions", type=int, default=0,
+                        help="Number of writable regions with ROPchains of pivoted stacks")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+
+
+def generate_dump_folder_from_arguments(folder_name: str, args: argparse.Namespace) -> dict:
+    return generate_dump_folder(folder_name, bitness=args.bitness, stack_count=args.stacks,
+                                stack_size=args.stack_size, region_count=args.regions, region_size=args.region_size,
+                                chain_density=args.chain_density, chain_length=args.chain_length,
+                                writable_region_count=args.writable_regions, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic dump folder.")
+    parser.add_argument("folder_name", help="Folder to create")
+    parser.add_argument("--minidump", metavar="FILE", help="Also write the folder as a Windows minidump to FILE")
+    add_synthetic_dump_arguments(parser)
+    args = parser.parse_args()
+
+    description = generate_dump_folder_from_arguments(args.folder_name, args)
+    if args.minidump:
+        write_minidump(args.folder_name, args.minidump)
+    print(json.dumps(dict(description, planted_chains=len(description["planted_chains"])), indent=2))
@@ -1,6 +1,5 @@
 import subprocess
 import argparse
-from tqdm import tqdm
 
 # Argument ranges
 # variable_x_values = [8, 6, 4, 2]
@@ -9,7 +8,7 @@ from tqdm import tqdm
 # Base command components
 python_executable = r"C:\Users\AlonsoDRDLV\AppData\Local\Programs\Python\Python310\python.exe"
 script_path = r"C:\Users\AlonsoDRDLV\Documents\GitHub\static-rop-chains-detector\src\__main__.py"
-qinput_path = r"..\dmp_examples\2264_26-11-2024_12-46-30_UTC"
+input_path = r"..\dmp_examples\2264_26-11-2024_12-46-30_UTC"
 
 parser = argparse.ArgumentParser(description="Argumentos para x e y.")
 
@@ -37,27 +36,19 @@ args = parser.parse_args()
 variable_x_values = args.x
 variable_y_values = args.y
 
-# Iterate through combinations and execute the command
+# Run every combination in a single sweep: the dump is parsed and the stacks are scanned only once
+command = [
+    python_executable,
+    script_path,
+    input_path,
+    "--x", *map(str, variable_x_values),
+    "--y", *map(str, variable_y_values)
+]
+
 total_iterations = len(variable_x_values) * len(variable_y_values)
+print(f"Executing {total_iterations} combinations")
 
-# Create a progress bar
-with tqdm(total=total_iterations, desc="Executing") as progress_bar:
-    for second_arg in variable_x_values:
-        for third_arg in variable_y_values:
-            # Build the command
-            command = [
-                python_executable,
-                script_path,
-                input_path,
-                str(second_arg),
-                str(third_arg)
-            ]
-
-            # Run the command
-            try:
-                subprocess.run(command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Command failed with error: {e}")
-
-            # Update the progress bar
-            progress_bar.update(1)
\ No newline at end of file
+try:
+    subprocess.run(command, check=True)
+except subprocess.CalledProcessError as e:
+    print(f"Command failed with error: {e}")
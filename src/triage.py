@@ -0,0 +1,219 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple
+
+import numpy as np
+from process_dump_manager import ProcessDumpManager
+from batch import list_dump_folders
+from gadget_filter import GadgetFilter, add_gadget_filter_arguments, build_gadget_filter
+
+TRIAGE_WINDOW_SIZE = 0x1000  # bytes of stack read by one sample
+TRIAGE_BYTE_BUDGET = 1 << 20  # bytes of stack sampled per dump
+TRIAGE_TIME_BUDGET = 1.0  # seconds per dump, metadata loading included
+CONFIDENCE_Z = 1.96  # normal quantile of the 95% confidence bounds
+
+
+def get_sample_windows(fm: ProcessDumpManager, window_words: int, byte_budget: int,
+                       stride_words: int | None = None) -> List[Tuple[int, int]]:
+    """
+    Places sample windows of window_words WORDs at a fixed stride in every stack. By default the stride is
+    chosen so the windows add up to byte_budget bytes, spread over all the stacks. The stride is at least
+    window_words, so the windows never overlap. Every stack gets at least one window: triage_dump_folder
+    reads them in a random order until the byte budget is spent.
+
+    Returns:
+        List[Tuple[int, int]]: (position in stack_info, first WORD) of every window.
+    """
+    stack_words = [stack["stack_size"] // fm.word_size for stack in fm.stack_info]
+    if stride_words is None:
+        window_count = max(1, byte_budget // (window_words * fm.word_size))
+        stride_words = math.ceil(sum(stack_words) / window_count)
+    stride_words = max(window_words, stride_words)
+    return [(index, word_start) for index, word_count in enumerate(stack_words)
+            for word_start in range(0, word_count, stride_words)]
+
+
+def estimate_density(window_hits: np.ndarray, window_words: np.ndarray, population_windows: int) -> Tuple[float, float, float]:
+    """
+    Ratio estimate of the gadget hits per WORD from a random sample of windows, with its normal confidence
+    bounds. The windows are the sampling units, so hits clustered in a few windows widen the bounds, and
+    the finite population correction shrinks them to zero when the whole stacks are sampled.
+
+    Args:
+        window_hits (np.ndarray): Gadget hits of every sampled window.
+        window_words (np.ndarray): WORDs of every sampled window.
+        population_windows (int): Number of distinct, non-overlapping windows that tile the stacks. The
+            sampled windows must be distinct windows of this tiling.
+
+    Returns:
+        Tuple[float, float, float]: The density and its lower and upper bounds, clipped to [0, 1].
+    """
+    sample_size = len(window_words)
+    if sample_size == 0 or window_words.sum() == 0:
+        return 0.0, 0.0, 1.0
+    density = window_hits.sum() / window_words.sum()
+    if sample_size < 2:
+        return float(density), 0.0, 1.0
+    residuals = window_hits - density * window_words
+    variance = (residuals ** 2).sum() / (sample_size - 1) / sample_size / window_words.mean() ** 2
+    variance *= max(0.0, 1 - sample_size / population_windows)
+    margin = CONFIDENCE_Z * math.sqrt(variance)
+    return float(density), float(max(0.0, density - margin)), float(min(1.0, density + margin))
+
+
+def triage_dump_folder(folder_name: str, gadget_filter: GadgetFilter | None = None,
+                       window_size: int = TRIAGE_WINDOW_SIZE, byte_budget: int = TRIAGE_BYTE_BUDGET,
+                       time_budget: float = TRIAGE_TIME_BUDGET, stride: int | None = None, seed: int = 0) -> dict:
+    """
+    Estimates how suspicious a dump is without scanning it completely: the density of gadget hits in its
+    stacks, measured on windows sampled at a fixed stride (see get_sample_windows). The windows are visited
+    in a random order and sampling stops when the byte or the time budget is spent, so the windows read are
+    always a uniform sample of the stacks and the confidence bounds stay valid.
+
+    Args:
+        folder_name (str): The dump folder.
+        gadget_filter (GadgetFilter | None): Decides which WORDs are gadget hits. By default every WORD that
+            points to an IMG region. With the CALL filter, ordinary return addresses do not count.
+        window_size (int): Bytes of stack read by one sample.
+        byte_budget (int): Maximum bytes of stack sampled. Windows are shrunk to it if they are larger.
+        time_budget (float): Seconds after which sampling stops.
+        stride (int | None): Bytes between the start of two windows of a stack, at least window_size.
+        seed (int): Seed of the order of the windows.
+
+    Returns:
+        dict: The folder, its suspicion score (gadget hits per WORD) with its confidence bounds, the highest
+        density of a window, the windows sampled out of the windows placed, the bytes sampled and the time spent.
+    """
+    start_time = time.perf_counter()
+    if gadget_filter is None:
+        gadget_filter = GadgetFilter()
+    fm = ProcessDumpManager(folder_name)
+    stack_files = {}  # position in stack_info -> StorageMember of the stacks opened, None if it cannot be opened
+    try:
+        window_words = max(1, min(window_size, byte_budget) // fm.word_size)
+        windows = get_sample_windows(fm, window_words, byte_budget,
+                                     None if stride is None else max(1, stride // fm.word_size))
+        order = np.random.default_rng(seed).permutation(len(windows))
+        # the estimate is for the whole stacks, i.e. all the windows that would tile them
+        population_windows = sum(-(-(stack["stack_size"] // fm.word_size) // window_words) for stack in fm.stack_info)
+
+        window_hits = []
+        window_word_counts = []
+        bytes_sampled = 0
+        for window_number in order.tolist():
+            if bytes_sampled + window_words * fm.word_size > byte_budget:
+                break
+            if window_hits and time.perf_counter() - start_time >= time_budget:
+                break
+            index, word_start = windows[window_number]
+            if index not in stack_files:
+                try:
+                    stack_files[index] = fm.storage.open_member('stacks/' + fm.stack_info[index]['file_name'])
+                except IOError:
+                    stack_files[index] = None
+            member = stack_files[index]
+            word_count = 0
+            if member is not None:
+                # only the blocks of the window are decompressed from archives
+                stack_size = min(fm.stack_info[index]['stack_size'], member.size)
+                window = member.read(word_start * fm.word_size, window_words * fm.word_size)
+                word_count = max(0, min(len(window), stack_size - word_start * fm.word_size)) // fm.word_size
+            bytes_sampled += word_count * fm.word_size
+            window_word_counts.append(word_count)
+            window_hits.append(len(gadget_filter.find_hits(fm, np.frombuffer(window, dtype=fm.word_dtype,
+                                                                             count=word_count)))
+                               if word_count else 0)
+    finally:
+        for member in stack_files.values():
+            if member is not None:
+                member.close()
+        fm.close()
+
+    window_hits = np.array(window_hits, dtype=np.float64)
+    window_word_counts = np.array(window_word_counts, dtype=np.float64)
+    score, score_low, score_high = estimate_density(window_hits, window_word_counts, population_windows)
+    sampled = window_word_counts > 0
+    return {
+        "folder": folder_name,
+        "score": score,
+        "score_low": score_low,
+        "score_high": score_high,
+        "max_window_density": float((window_hits[sampled] / window_word_counts[sampled]).max()) if sampled.any() else 0.0,
+        "windows_sampled": len(window_hits),
+        "windows_placed": len(windows),
+        "bytes_sampled": bytes_sampled,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def run_triage(folder_names: List[str], gadget_filter: GadgetFilter | None = None, jobs: int = 1,
+               **triage_arguments) -> List[dict]:
+    """
+    Triages many dump folders with a pool of worker processes (see triage_dump_folder).
+
+    Returns:
+        List[dict]: The result of every folder, most suspicious first. Folders that could not be triaged
+        are last, with their error.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(triage_dump_folder, folder_name, gadget_filter, **triage_arguments): folder_name
+                   for folder_name in folder_names}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"folder": futures[future], "error": str(e)})
+    results.sort(key=lambda result: ("error" in result, -result.get("score", 0.0), -result.get("score_low", 0.0)))
+    return results
+
+
+def print_ranking(results: List[dict]):
+    print(f"{'rank':>4}  {'score':>8}  {'95% bounds':>19}  {'windows':>11}  folder")
+    for rank, result in enumerate(results, 1):
+        if "error" in result:
+            print(f"{rank:>4}  {'error':>8}  {'':>19}  {'':>11}  {result['folder']}: {result['error']}")
+            continue
+        bounds = f"[{result['score_low']:.5f}, {result['score_high']:.5f}]"
+        windows = f"{result['windows_sampled']}/{result['windows_placed']}"
+        print(f"{rank:>4}  {result['score']:>8.5f}  {bounds:>19}  {windows:>11}  {result['folder']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ranks dump folders by the density of gadget hits in samples of "
+                                                 "their stacks, to choose which ones to analyze completely.")
+    parser.add_argument("source", help="Directory of dump folders or manifest file with one folder per line")
+    add_gadget_filter_arguments(parser)
+    parser.add_argument("--window-size", type=lambda value: int(value, 0), default=TRIAGE_WINDOW_SIZE,
+                        help="Bytes of stack read by one sample")
+    parser.add_argument("--byte-budget", type=lambda value: int(value, 0), default=TRIAGE_BYTE_BUDGET,
+                        help="Bytes of stack sampled per dump")
+    parser.add_argument("--time-budget", type=float, default=TRIAGE_TIME_BUDGET,
+                        help="Seconds per dump after which sampling stops")
+    parser.add_argument("--stride", type=lambda value: int(value, 0),
+                        help="Bytes between two samples of a stack (default: from the byte budget)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the order of the samples")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of folders triaged in parallel")
+    parser.add_argument("--json", metavar="FILE", help="Also write the ranking as JSON to FILE")
+    parser.add_argument("--top", type=int, metavar="N",
+                        help="Write the N most suspicious folders to --top-manifest, to be analyzed with batch.py")
+    parser.add_argument("--top-manifest", metavar="FILE", default="triage_top.txt",
+                        help="Manifest file of the most suspicious folders")
+    args = parser.parse_args()
+
+    results = run_triage(list_dump_folders(args.source), build_gadget_filter(args), args.jobs,
+                         window_size=args.window_size, byte_budget=args.byte_budget, time_budget=args.time_budget,
+                         stride=args.stride, seed=args.seed)
+    print_ranking(results)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    if args.top:
+        with open(args.top_manifest, 'w') as manifest:
+            for result in results[:args.top]:
+                if "error" not in result:
+                    manifest.write(result["folder"] + "\n")
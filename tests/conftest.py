@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# the modules import each other by name, as when they are run from src
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path[:0] = [SRC_DIR, os.path.join(SRC_DIR, "file_manager")]
+
+from synthetic_dump import generate_dump_folder  # noqa: E402
+
+# small enough to generate in a fraction of a second, large enough to contain every kind of hit
+SYNTHETIC_DUMP_ARGUMENTS = {"stack_count": 6, "stack_size": 0x4000, "region_count": 6, "region_size": 0x10000,
+                            "chain_density": 0.002, "writable_region_count": 2}
+
+
+@pytest.fixture(scope="session", params=[32, 64])
+def dump_folder(request, tmp_path_factory) -> str:
+    """
+    A synthetic dump folder of every bitness, shared by the tests that only read it.
+    """
+    folder_name = str(tmp_path_factory.mktemp(f"dump{request.param}") / "dump")
+    generate_dump_folder(folder_name, bitness=request.param, **SYNTHETIC_DUMP_ARGUMENTS)
+    return folder_name
+
+
+@pytest.fixture
+def make_dump_folder(tmp_path):
+    """
+    Returns a function that writes a synthetic dump folder under tmp_path and returns its path.
+    """
+    def make(name: str = "dump", **arguments) -> str:
+        folder_name = str(tmp_path / name)
+        generate_dump_folder(folder_name, **{**SYNTHETIC_DUMP_ARGUMENTS, **arguments})
+        return folder_name
+    return make
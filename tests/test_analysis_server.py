@@ -0,0 +1,142 @@
+import filecmp
+import os
+import stat
+import threading
+
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from analysis_server import AnalysisServer, get_request_arguments, send_request, serve
+from gadget_filter import GadgetFilter
+from rop_chain_results import get_results_arrays_file_path, load_rop_chain_results
+from rop_chains import get_results_file_path, run_sweep
+
+
+def run_plain_sweep(folder_name: str, results_dir: str) -> dict:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return run_sweep(fm, [3, 5], [2], results_dir, GadgetFilter(call_filter=True))
+    finally:
+        fm.close()
+
+
+def get_request(folder_name: str, **request) -> dict:
+    return dict({"arguments": {"folder_name": folder_name, "x": [3, 5], "y": [2], "call_filter": True}}, **request)
+
+
+def test_json_output_matches_sweep(dump_folder, tmp_path):
+    chain_counts = run_plain_sweep(dump_folder, str(tmp_path))
+    server = AnalysisServer(output_roots=[str(tmp_path)])
+    try:
+        response = server.handle_request(get_request(dump_folder, output_format="json"))
+    finally:
+        server.close()
+    assert response["status"] == "ok", response
+    for (x, y), count in chain_counts.items():
+        results = load_rop_chain_results(get_results_arrays_file_path(str(tmp_path), x, y))
+        assert response["chain_counts"][f"{x}_{y}"] == count
+        assert [chain["pairs"] for chain in response["chains"][f"{x}_{y}"]] == [
+            results.get_chain(chain_index).tolist() for chain_index in range(len(results))
+        ]
+
+
+def test_files_output_matches_sweep_and_stays_warm(dump_folder, tmp_path):
+    run_plain_sweep(dump_folder, str(tmp_path / "sweep"))
+    server = AnalysisServer(output_roots=[str(tmp_path)])
+    try:
+        for warm in (False, True):
+            response = server.handle_request(get_request(dump_folder, results_dir=str(tmp_path / "server")))
+            assert response["status"] == "ok", response
+            assert response["warm"] == warm
+    finally:
+        server.close()
+    for x in (3, 5):
+        assert filecmp.cmp(get_results_file_path(str(tmp_path / "sweep"), x, 2),
+                           get_results_file_path(str(tmp_path / "server"), x, 2), shallow=False)
+
+
+def test_reload_when_data_regions_change(make_dump_folder, tmp_path):
+    folder_name = make_dump_folder()
+    server = AnalysisServer(output_roots=[str(tmp_path)])
+    try:
+        fm, warm = server.get_dump_manager(folder_name)
+        assert not warm and len(fm.data_info) == 2
+        data_results_path = os.path.join(folder_name, "data", "results.txt")
+        with open(data_results_path, 'r') as data_results:
+            first_line = data_results.readline()
+        with open(data_results_path, 'w') as data_results:
+            data_results.write(first_line)
+        fm, warm = server.get_dump_manager(folder_name)
+        assert not warm and len(fm.data_info) == 1
+        fm, warm = server.get_dump_manager(folder_name)
+        assert warm
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("request_paths", [
+    {"results_dir": "outside"},
+    {"results_dir": "inside/../outside"},
+    {"results_dir": "inside/link/results"},
+    {"stats": "outside/stats.json"},
+    {"snapshot_state": "outside/state.npz"},
+    {"return_site_cache": "outside/cache"},
+])
+def test_output_paths_outside_roots(dump_folder, tmp_path, request_paths):
+    os.makedirs(tmp_path / "inside")
+    os.makedirs(tmp_path / "outside")
+    os.symlink(tmp_path / "outside", tmp_path / "inside" / "link")
+    request = get_request(dump_folder, results_dir=str(tmp_path / "inside" / "results"))
+    for name, path in request_paths.items():
+        if name == "results_dir":
+            request["results_dir"] = os.path.join(str(tmp_path), path)
+        else:
+            request["arguments"][name] = os.path.join(str(tmp_path), path)
+    server = AnalysisServer(output_roots=[str(tmp_path / "inside")])
+    try:
+        response = server.handle_request(request)
+    finally:
+        server.close()
+    assert response["status"] == "error"
+    assert "PermissionError" in response["error"]
+    assert os.listdir(tmp_path / "outside") == []
+
+
+def test_output_paths_inside_roots(dump_folder, tmp_path):
+    request = get_request(dump_folder, results_dir=str(tmp_path / "results"))
+    request["arguments"]["stats"] = str(tmp_path / "stats.json")
+    server = AnalysisServer(output_roots=[str(tmp_path)])
+    try:
+        response = server.handle_request(request)
+    finally:
+        server.close()
+    assert response["status"] == "ok", response
+    assert os.path.exists(tmp_path / "stats.json")
+
+
+@pytest.mark.parametrize("arguments", [{"top_chains": 0}, {"x": 3}, {"x": ["a"]}, {"jobs": 1.5},
+                                       {"call_filter": "yes"}, {"unknown": 1}, {"x": None}])
+def test_invalid_request_arguments(dump_folder, arguments):
+    with pytest.raises(ValueError):
+        get_request_arguments(get_request(dump_folder, arguments=dict(get_request(dump_folder)["arguments"],
+                                                                      **arguments)))
+
+
+def test_unix_socket(dump_folder, tmp_path):
+    socket_path = str(tmp_path / "server.sock")
+    server = AnalysisServer(output_roots=[str(tmp_path)])
+    thread = threading.Thread(target=serve, args=(server, socket_path))
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            thread.join(0.05)
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        response = send_request(get_request(dump_folder, output_format="json"), socket_path)
+        assert response["status"] == "ok", response
+        assert send_request({"command": "status"}, socket_path)["requests_served"] == 1
+    finally:
+        send_request({"command": "shutdown"}, socket_path)
+        thread.join()
+    assert not os.path.exists(socket_path)
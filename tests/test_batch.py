@@ -0,0 +1,59 @@
+import filecmp
+import os
+
+from process_dump_manager import ProcessDumpManager
+from batch import get_folder_results_dir, run_batch
+from gadget_filter import GadgetFilter
+from rop_chains import get_results_file_path, run_sweep
+
+
+def get_sweep_counts(folder_name: str, distances_between_gadgets: list, results_dir: str,
+                     gadget_filter: GadgetFilter | None = None) -> dict:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        chain_counts = run_sweep(fm, distances_between_gadgets, [2], results_dir, gadget_filter)
+    finally:
+        fm.close()
+    return {f"{x}_{y}": count for (x, y), count in chain_counts.items()}
+
+
+def test_batch_matches_sweep(dump_folder, tmp_path):
+    gadget_filter = GadgetFilter(call_filter=True)
+    summary = run_batch([dump_folder], [3, 5], [2], str(tmp_path / "batch"), gadget_filter)
+    expected = get_sweep_counts(dump_folder, [3, 5], str(tmp_path / "sweep"), gadget_filter)
+    assert summary["folders"][0]["chain_counts"] == expected
+    folder_results_dir = get_folder_results_dir(str(tmp_path / "batch"), dump_folder)
+    for x in (3, 5):
+        assert filecmp.cmp(get_results_file_path(folder_results_dir, x, 2),
+                           get_results_file_path(str(tmp_path / "sweep"), x, 2), shallow=False)
+
+
+def test_resume_skips_only_same_parameters(dump_folder, tmp_path, capsys):
+    results_dir = str(tmp_path / "batch")
+    run_batch([dump_folder], [3], [2], results_dir)
+    run_batch([dump_folder], [3], [2], results_dir)
+    assert "1 folders already analyzed, 0 pending" in capsys.readouterr().out
+
+    # other x values or another gadget filter give other results, so the folder is analyzed again
+    summary = run_batch([dump_folder], [5], [2], results_dir)
+    assert "0 folders already analyzed, 1 pending" in capsys.readouterr().out
+    assert summary["folders"][0]["chain_counts"] == get_sweep_counts(dump_folder, [5], str(tmp_path / "sweep"))
+
+    gadget_filter = GadgetFilter(call_filter=True)
+    summary = run_batch([dump_folder], [5], [2], results_dir, gadget_filter)
+    assert "0 folders already analyzed, 1 pending" in capsys.readouterr().out
+    assert summary["folders"][0]["chain_counts"] == get_sweep_counts(dump_folder, [5], str(tmp_path / "sweep"),
+                                                                     gadget_filter)
+
+
+def test_folders_with_the_same_name(make_dump_folder, tmp_path):
+    folder_names = [make_dump_folder(os.path.join("a", "dump"), seed=1),
+                    make_dump_folder(os.path.join("b", "dump"), seed=2)]
+    results_dir = str(tmp_path / "batch")
+    assert get_folder_results_dir(results_dir, folder_names[0]) != get_folder_results_dir(results_dir, folder_names[1])
+
+    summary = run_batch(folder_names, [3], [2], results_dir)
+    assert [folder["chain_counts"] for folder in summary["folders"]] == [
+        get_sweep_counts(folder_name, [3], str(tmp_path / f"sweep{number}"))
+        for number, folder_name in enumerate(folder_names)
+    ]
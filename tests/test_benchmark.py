@@ -0,0 +1,64 @@
+import json
+import os
+
+import numpy as np
+
+from process_dump_manager import ProcessDumpManager
+from benchmark import run_benchmark
+from gadget_filter import GadgetFilter
+from rop_chain_results import get_results_arrays_file_path, load_rop_chain_results
+from rop_chains import run_sweep
+from synthetic_dump import generate_dump_folder
+from conftest import SYNTHETIC_DUMP_ARGUMENTS
+
+
+def read_results_files(folder_name: str) -> list:
+    contents = []
+    for directory in ("", "stacks", "data"):
+        with open(os.path.join(folder_name, directory, "results.txt"), 'r') as results_file:
+            contents.append(results_file.read())
+    return contents
+
+
+def test_generator_is_deterministic(tmp_path):
+    descriptions = [generate_dump_folder(str(tmp_path / name), seed=seed, **SYNTHETIC_DUMP_ARGUMENTS)
+                    for name, seed in (("a", 1), ("b", 1), ("c", 2))]
+    assert descriptions[0]["planted_chains"] == descriptions[1]["planted_chains"]
+    assert read_results_files(str(tmp_path / "a")) == read_results_files(str(tmp_path / "b"))
+    assert read_results_files(str(tmp_path / "a"))[1] != read_results_files(str(tmp_path / "c"))[1]
+
+
+def test_planted_chains_are_found(tmp_path):
+    # planted gadget addresses are at most one argument WORD apart
+    description = generate_dump_folder(str(tmp_path / "dump"), **SYNTHETIC_DUMP_ARGUMENTS)
+    fm = ProcessDumpManager(description["folder_name"])
+    try:
+        run_sweep(fm, [1], [2], str(tmp_path / "results"))
+        stack_ranges = [(stack["base_address"], stack["base_address"] + stack["stack_size"])
+                        for stack in fm.stack_info]
+    finally:
+        fm.close()
+    results = load_rop_chain_results(get_results_arrays_file_path(str(tmp_path / "results"), 1, 2))
+    chain_addresses = set(results.pairs[:, 0].tolist())
+    planted_addresses = [address for address, _ in description["planted_chains"]
+                         if any(low <= address < high for low, high in stack_ranges)]
+    assert len(planted_addresses) > 0
+    assert all(address in chain_addresses for address in planted_addresses)
+
+
+def test_benchmark_matches_sweep(dump_folder, tmp_path):
+    gadget_filter = GadgetFilter(call_filter=True)
+    report = run_benchmark(dump_folder, [3, 5], [2], gadget_filter, str(tmp_path / "benchmark"))
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        chain_counts = run_sweep(fm, [3, 5], [2], str(tmp_path / "sweep"), gadget_filter)
+        word_count = sum(stack["stack_size"] // fm.word_size for stack in fm.stack_info)
+    finally:
+        fm.close()
+    assert report["chain_counts"] == {f"{x}_{y}": count for (x, y), count in chain_counts.items()}
+    assert report["counters"]["words_scanned"] == word_count
+    assert report["counters"]["chains_emitted"] == sum(chain_counts.values())
+    assert {"metadata_load", "stack_mapping", "region_lookup", "call_filter", "segmentation",
+            "writer"} <= set(report["stage_seconds"])
+    assert json.loads(json.dumps(report)) == report
+    assert np.isfinite(report["words_per_second"])
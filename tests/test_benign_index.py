@@ -0,0 +1,128 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from benign_index import BenignIndex, build_benign_index, get_return_site_keys, load_benign_index
+from gadget_filter import GadgetFilter
+from rop_chains import scan_stacks
+
+
+def get_hits(folder_name: str, gadget_filter: GadgetFilter) -> list:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return [(stack_hits.hit_indices, stack_hits.hit_values) for stack_hits in scan_stacks(fm, gadget_filter)]
+    finally:
+        fm.close()
+
+
+def test_index_of_the_same_dump_removes_every_hit(dump_folder):
+    index = build_benign_index([dump_folder])
+    assert len(index.keys) > 0
+    assert sum(len(hit_indices) for hit_indices, _ in get_hits(dump_folder, GadgetFilter(benign_index=index))) == 0
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+def test_hits_of_another_dump(make_dump_folder, call_filter):
+    # the dumps share the first stacks, the others differ
+    clean_folder = make_dump_folder("clean", bitness=64, seed=1, stack_count=3)
+    folder_name = make_dump_folder("dump", bitness=64, seed=1)
+    index = build_benign_index([clean_folder], GadgetFilter(call_filter))
+    plain_hits = get_hits(folder_name, GadgetFilter(call_filter))
+    hits = get_hits(folder_name, GadgetFilter(call_filter, benign_index=index))
+
+    fm = ProcessDumpManager(folder_name)
+    try:
+        for (plain_indices, plain_values), (hit_indices, hit_values) in zip(plain_hits, hits):
+            keys, is_valid = get_return_site_keys(fm, plain_values)
+            # compared with the sorted keys alone, without the Bloom filter
+            is_benign = is_valid & np.isin(keys, index.keys)
+            assert hit_indices.tolist() == plain_indices[~is_benign].tolist()
+            assert hit_values.tolist() == plain_values[~is_benign].tolist()
+    finally:
+        fm.close()
+    assert sum(len(hit_indices) for hit_indices, _ in hits[:3]) == 0
+    assert all(len(hit_indices) > 0 for hit_indices, _ in hits[3:])
+
+
+def relocate_dump_folder(folder_name: str, delta: int):
+    """
+    Moves every IMG region of a dump folder by delta bytes, as ASLR would in another run of the process.
+    """
+    results_path = os.path.join(folder_name, "results.txt")
+    fm = ProcessDumpManager(folder_name, use_metadata_index=False)
+    regions = [(region["Filename"], region["Memory region"]) for region in fm.dmp_info]
+    fm.close()
+    with open(results_path, 'r') as results_file:
+        results = results_file.read()
+    for file_name, (low, high) in regions:
+        new_file_name = f"{low + delta:x}_{high - low + 1:x}.dmp"
+        os.rename(os.path.join(folder_name, file_name), os.path.join(folder_name, new_file_name))
+        results = results.replace(f"Filename: {file_name},", f"Filename: {new_file_name},")
+    with open(results_path, 'w') as results_file:
+        results_file.write(results)
+
+
+def test_keys_do_not_depend_on_the_load_address(make_dump_folder):
+    delta = 0x100000000
+    folder_name = make_dump_folder("dump", bitness=64)
+    relocated_folder = make_dump_folder("relocated", bitness=64)
+    relocate_dump_folder(relocated_folder, delta)
+    fm = ProcessDumpManager(folder_name)
+    relocated_fm = ProcessDumpManager(relocated_folder)
+    try:
+        assert [region["Memory region"][0] + delta for region in fm.dmp_info] == [
+            region["Memory region"][0] for region in relocated_fm.dmp_info]
+        hit_values = np.concatenate([stack_hits.hit_values for stack_hits in scan_stacks(fm, GadgetFilter())])
+        keys, is_valid = get_return_site_keys(fm, hit_values)
+        relocated_keys, relocated_is_valid = get_return_site_keys(relocated_fm, hit_values + np.uint64(delta))
+        assert is_valid.all() and relocated_is_valid.all()
+        assert keys.tolist() == relocated_keys.tolist()
+
+        index = build_benign_index([folder_name])
+        assert index.are_benign(relocated_fm, hit_values + np.uint64(delta)).all()
+        assert not index.are_benign(relocated_fm, hit_values).any()
+    finally:
+        fm.close()
+        relocated_fm.close()
+
+
+def test_min_dumps(make_dump_folder):
+    folder_names = [make_dump_folder("dump1", seed=1, stack_count=4), make_dump_folder("dump2", seed=1)]
+    indexes = [build_benign_index([folder_name]) for folder_name in folder_names]
+    assert build_benign_index(folder_names, min_dumps=2).keys.tolist() == np.intersect1d(
+        indexes[0].keys, indexes[1].keys).tolist()
+    assert build_benign_index(folder_names).keys.tolist() == np.union1d(indexes[0].keys, indexes[1].keys).tolist()
+
+
+@pytest.mark.parametrize("key_count", [0, 1, 1000])
+def test_bloom_filter_has_no_false_negatives(key_count):
+    rng = np.random.default_rng(key_count)
+    index = BenignIndex(rng.integers(0, 1 << 63, key_count, dtype=np.uint64))
+    assert index.contains_keys(index.keys).all()
+    other_keys = rng.integers(0, 1 << 63, 10000, dtype=np.uint64)
+    assert index.contains_keys(other_keys).tolist() == np.isin(other_keys, index.keys).tolist()
+
+
+def test_save_and_load(dump_folder, tmp_path):
+    index = build_benign_index([dump_folder])
+    index.save(str(tmp_path / "index.npz"))
+    loaded = load_benign_index(str(tmp_path / "index.npz"))
+    assert loaded.keys.tolist() == index.keys.tolist()
+    assert loaded.bloom.tolist() == index.bloom.tolist()
+    assert loaded.get_signature() == index.get_signature()
+    assert not [file_name for file_name in os.listdir(tmp_path) if file_name.endswith(".tmp")]
+
+    # worker processes get the index without the keys of the regions of the last dump
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        loaded.are_benign(fm, np.zeros(1, dtype=np.uint64))
+    finally:
+        fm.close()
+    assert pickle.loads(pickle.dumps(loaded)).region_keys is None
+
+    np.savez(str(tmp_path / "old.npz"), keys=index.keys, metadata=np.array('{"version": 0}'))
+    with pytest.raises(ValueError):
+        load_benign_index(str(tmp_path / "old.npz"))
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from call_filter import (MAX_CALL_INSTRUCTION_SIZE, are_prev_instructions_call, decode_call_instructions,
+                         is_prev_instruction_call)
+
+
+def decode(code: str, bitness: int) -> bool:
+    """
+    Checks if the hex encoded bytes end with a CALL instruction, the bytes before them being unknown.
+    """
+    code = bytes.fromhex(code)[-MAX_CALL_INSTRUCTION_SIZE:]
+    row = np.zeros((1, MAX_CALL_INSTRUCTION_SIZE), dtype=np.uint8)
+    available = np.zeros((1, MAX_CALL_INSTRUCTION_SIZE), dtype=bool)
+    row[0, MAX_CALL_INSTRUCTION_SIZE - len(code):] = np.frombuffer(code, dtype=np.uint8)
+    available[0, MAX_CALL_INSTRUCTION_SIZE - len(code):] = True
+    return bool(decode_call_instructions(row, available, bitness)[0])
+
+
+@pytest.mark.parametrize("code, bitness, is_call", [
+    ("e8 00 10 00 00", 64, True),  # call rel32
+    ("66 e8 00 10", 32, True),  # call rel16
+    ("66 e8 00 10", 64, False),
+    ("9a 00 10 00 00 08 00", 32, True),  # call ptr16:32
+    ("9a 00 10 00 00 08 00", 64, False),
+    ("ff d0", 64, True),  # call rax
+    ("ff 15 00 10 00 00", 64, True),  # call [rip+disp32]
+    ("ff 54 24 08", 64, True),  # call [rsp+8]
+    ("ff 14 25 00 10 00 00", 64, True),  # call [disp32] through a SIB without base
+    ("ff 1d 00 10 00 00", 32, True),  # call far [disp32]
+    ("ff d8", 32, False),  # call far with a register operand does not exist
+    ("ff e0", 64, False),  # jmp rax
+    ("ff 54 24", 64, False),  # truncated
+    ("c3", 64, False),
+])
+def test_call_encodings(code, bitness, is_call):
+    assert decode(code, bitness) == is_call
+
+
+def get_ff_length(modrm: int, sib: int | None) -> int | None:
+    mod, rm = modrm >> 6, modrm & 0b111
+    if mod == 3:
+        return 2
+    if rm == 0b100:
+        if sib is None:
+            return None
+        displacement = {0: 4 if sib & 0b111 == 0b101 else 0, 1: 1, 2: 4}[mod]
+        return 3 + displacement
+    return 2 + {0: 4 if rm == 0b101 else 0, 1: 1, 2: 4}[mod]
+
+
+def is_call_before(code: bytes, bitness: int) -> bool:
+    """
+    Reference check, one encoding at a time: code holds the bytes before the return address.
+    """
+    def byte_before(size: int) -> int | None:
+        return code[-size] if size <= len(code) else None
+
+    if byte_before(5) == 0xE8:
+        return True
+    if bitness == 32 and (byte_before(3), byte_before(4)) == (0xE8, 0x66):
+        return True
+    if bitness == 32 and (byte_before(7) == 0x9A or (byte_before(5), byte_before(6)) == (0x9A, 0x66)):
+        return True
+    for size in range(2, MAX_CALL_INSTRUCTION_SIZE + 1):
+        if byte_before(size) != 0xFF:
+            continue
+        modrm = byte_before(size - 1)
+        reg = (modrm >> 3) & 0b111
+        if get_ff_length(modrm, byte_before(size - 2) if size > 2 else None) == size and (
+                reg == 2 or (reg == 3 and modrm >> 6 != 3)):
+            return True
+    return False
+
+
+def test_batch_matches_reference_and_scalar_check(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        words = np.concatenate([words.copy() for _, words in fm.iter_stack_words()])
+        addresses = words[fm.region_index.contains_many(words)]
+        is_call = are_prev_instructions_call(fm, addresses)
+        expected = []
+        for address in addresses.tolist():
+            region_id = fm.region_index.lookup(address)
+            offset = address - fm.dmp_info[region_id]["Memory region"][0]
+            region_bytes = fm.get_img_region_array(region_id)
+            expected.append(is_call_before(bytes(region_bytes[max(0, offset - MAX_CALL_INSTRUCTION_SIZE):offset]),
+                                           fm.bitness))
+        # the rel32 CALLs, the only ones planted in the synthetic regions, are found by the scalar check too
+        is_rel32_call_scalar = np.array([is_prev_instruction_call(fm, address)
+                                         and fm.access_img_dump_file(address - 5)[0] == 0xE8
+                                         for address in addresses.tolist()])
+    finally:
+        fm.close()
+    assert is_call.any()
+    assert is_call.tolist() == expected
+    assert not (is_rel32_call_scalar & ~is_call).any()
+
+
+def test_addresses_outside_regions(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        low = fm.dmp_info[0]["Memory region"][0]
+        assert not are_prev_instructions_call(fm, np.array([0, 1, low, low + 1], dtype=np.uint64)).any()
+        assert len(are_prev_instructions_call(fm, np.zeros(0, dtype=np.uint64))) == 0
+    finally:
+        fm.close()
@@ -0,0 +1,50 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from process_dump_manager import ProcessDumpManager
+from dump_metadata_cache import get_metadata_index_path, load_dump_metadata, save_dump_metadata
+
+
+def get_metadata(fm: ProcessDumpManager) -> dict:
+    return {"stack_info": fm.stack_info, "bitness": fm.bitness, "dmp_info": fm.dmp_info, "data_info": fm.data_info}
+
+
+def test_index_matches_parsed_metadata(make_dump_folder):
+    folder_name = make_dump_folder()
+    fm = ProcessDumpManager(folder_name)
+    fm.close()
+    assert os.path.exists(get_metadata_index_path(folder_name))
+    indexed = ProcessDumpManager(folder_name)
+    indexed.close()
+    parsed = ProcessDumpManager(folder_name, use_metadata_index=False)
+    parsed.close()
+    assert load_dump_metadata(folder_name, parsed.get_metadata_source_paths()) is not None
+    assert get_metadata(indexed) == get_metadata(parsed)
+
+
+def test_index_is_invalidated_by_changed_sources(make_dump_folder):
+    folder_name = make_dump_folder()
+    fm = ProcessDumpManager(folder_name)
+    fm.close()
+    with open(os.path.join(folder_name, "data", "results.txt"), 'a') as data_results:
+        data_results.write("\n")
+    assert load_dump_metadata(folder_name, fm.get_metadata_source_paths()) is None
+
+
+def test_concurrent_saves(make_dump_folder):
+    folder_name = make_dump_folder()
+    fm = ProcessDumpManager(folder_name, use_metadata_index=False)
+    fm.close()
+    source_paths = fm.get_metadata_source_paths()
+    index_path = get_metadata_index_path(folder_name)
+    # another writer's temporary file, e.g. a process that was killed while saving
+    os.makedirs(index_path + ".tmp")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in executor.map(lambda _: save_dump_metadata(folder_name, source_paths, get_metadata(fm)), range(32)):
+            pass
+    with open(index_path, 'r') as index_file:
+        assert json.load(index_file)["metadata"]["bitness"] == fm.bitness
+    directory = os.path.dirname(index_path)
+    assert [name for name in os.listdir(directory) if name.endswith(".tmp")] == [os.path.basename(index_path) + ".tmp"]
@@ -0,0 +1,149 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+import dump_storage
+from process_dump_manager import ProcessDumpManager
+from dump_storage import BlockCache, DumpStorage, StorageMember, open_dump_storage
+from gadget_filter import GadgetFilter
+from region_scan import scan_writable_regions
+from rop_chains import scan_stacks
+
+zstandard = pytest.importorskip("zstandard")
+
+ARCHIVE_KINDS = ["tar", "stored.zip", "deflated.zip", "single.tar.zst", "multi.tar.zst"]
+ZSTD_FRAME_SIZE = 0x10000  # bytes of the tar stream compressed in every frame of the multi frame archive
+
+
+def write_tar(folder_name: str) -> bytes:
+    tar_data = io.BytesIO()
+    with tarfile.open(fileobj=tar_data, mode='w') as tar_file:
+        # the dump folder is the only top-level directory of the archive
+        tar_file.add(folder_name, arcname=os.path.basename(folder_name))
+    return tar_data.getvalue()
+
+
+def write_archive(folder_name: str, kind: str, file_path: str):
+    if kind.endswith(".zip"):
+        compression = zipfile.ZIP_STORED if kind == "stored.zip" else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(file_path, 'w', compression) as zip_file:
+            for root, _, file_names in os.walk(folder_name):
+                for file_name in file_names:
+                    path = os.path.join(root, file_name)
+                    zip_file.write(path, os.path.relpath(path, folder_name))  # the dump folder is the root
+        return
+    tar_data = write_tar(folder_name)
+    if kind == "single.tar.zst":
+        tar_data = zstandard.ZstdCompressor().compress(tar_data)
+    elif kind == "multi.tar.zst":
+        compressor = zstandard.ZstdCompressor()
+        tar_data = b''.join(compressor.compress(tar_data[offset:offset + ZSTD_FRAME_SIZE])
+                            for offset in range(0, len(tar_data), ZSTD_FRAME_SIZE))
+    with open(file_path, 'wb') as archive_file:
+        archive_file.write(tar_data)
+
+
+@pytest.fixture(scope="module")
+def archives(dump_folder, tmp_path_factory) -> dict:
+    directory = tmp_path_factory.mktemp("archives")
+    archives = {}
+    for kind in ARCHIVE_KINDS:
+        archives[kind] = str(directory / f"dump.{kind}")
+        write_archive(dump_folder, kind, archives[kind])
+    return archives
+
+
+def get_hits(folder_name: str, scan, jobs: int = 1) -> list:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return [(stack_hits.stack["base_address"], stack_hits.word_count, stack_hits.hit_indices.tolist(),
+                 stack_hits.hit_values.tolist()) for stack_hits in scan(fm, GadgetFilter(call_filter=True), jobs)]
+    finally:
+        fm.close()
+
+
+@pytest.mark.parametrize("kind", ARCHIVE_KINDS)
+def test_archive_scan_matches_folder(dump_folder, archives, kind):
+    expected = get_hits(dump_folder, scan_stacks)
+    assert get_hits(archives[kind], scan_stacks) == expected
+    # the second time the metadata, and the index of zstd archives, come from the metadata index
+    assert get_hits(archives[kind], scan_stacks) == expected
+    assert get_hits(archives[kind], scan_writable_regions) == get_hits(dump_folder, scan_writable_regions)
+
+
+def test_archive_scan_with_jobs(dump_folder, archives):
+    assert get_hits(archives["multi.tar.zst"], scan_stacks, 2) == get_hits(dump_folder, scan_stacks)
+
+
+@pytest.mark.parametrize("kind", ARCHIVE_KINDS)
+@pytest.mark.parametrize("max_cached_frame_size", [dump_storage.MAX_CACHED_FRAME_SIZE, 0x1000])
+def test_random_reads_match_folder(dump_folder, archives, kind, max_cached_frame_size, monkeypatch):
+    # with small frames cached, every frame of the archives is streamed
+    monkeypatch.setattr(dump_storage, "MAX_CACHED_FRAME_SIZE", max_cached_frame_size)
+    folder_storage = open_dump_storage(dump_folder)
+    storage = open_dump_storage(archives[kind])
+    rng = np.random.default_rng(0)
+    try:
+        fm = ProcessDumpManager(dump_folder)
+        names = ["results.txt"] + [f"stacks/{stack['file_name']}" for stack in fm.stack_info]
+        names += [region["Filename"] for region in fm.dmp_info] + [region["Filename"] for region in fm.data_info]
+        fm.close()
+        for name in names:
+            expected_member = folder_storage.open_member(name)
+            member = storage.open_member(name)
+            expected = bytes(expected_member.get_buffer())
+            assert member.size == len(expected)
+            for _ in range(8):
+                offset = int(rng.integers(0, len(expected) + 16))
+                size = int(rng.integers(0, 0x3000))
+                assert bytes(member.read(offset, size)) == expected[offset:offset + size]
+            assert bytes(member.get_buffer()) == expected
+            member.close()
+            expected_member.close()
+    finally:
+        storage.close()
+        folder_storage.close()
+
+
+def test_zstd_caches_are_bounded(archives, monkeypatch):
+    monkeypatch.setattr(dump_storage, "MAX_CACHED_FRAME_SIZE", 0x1000)
+    storage = dump_storage.ZstdTarStorage(archives["single.tar.zst"], max_cached_bytes=0x40000)
+    try:
+        for name in storage.get_members():
+            member = storage.open_member(name)
+            member.get_buffer()
+            member.close()
+        assert storage.block_cache.size <= 0x40000
+        assert storage.frame_cache.size == 0  # the single frame is streamed, never cached
+    finally:
+        storage.close()
+
+
+def test_block_cache_is_bounded_by_bytes():
+    cache = BlockCache(max_bytes=10)
+    for key in range(5):
+        assert cache.get(key, lambda: b'abcd') == b'abcd'
+        assert cache.size <= 10
+    assert list(cache.blocks) == [3, 4]
+    assert cache.get("large", lambda: b'x' * 11) == b'x' * 11
+    assert "large" not in cache.blocks and cache.size == 8
+    cache.get(4, lambda: b'')
+    assert cache.hits == 1 and cache.misses == 6
+
+
+def test_missing_overrides_fail_on_instantiation():
+    class IncompleteStorage(DumpStorage):
+        pass
+
+    class IncompleteMember(StorageMember):
+        def read(self, offset: int, size: int) -> memoryview:
+            return memoryview(b'')
+
+    with pytest.raises(TypeError, match="open_member"):
+        IncompleteStorage("folder")
+    with pytest.raises(TypeError, match="get_buffer"):
+        IncompleteMember(0)
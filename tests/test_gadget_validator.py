@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from gadget_validator import BRANCH, JUMP, NORMAL, STOP, TERMINATOR, GadgetValidator, decode_instruction
+from rop_chains import scan_stacks
+
+
+@pytest.mark.parametrize("code, bitness, length, kind", [
+    ("c3", 64, 1, TERMINATOR),
+    ("c2 08 00", 32, 3, TERMINATOR),
+    ("ff e0", 64, 2, TERMINATOR),  # jmp rax
+    ("ff d0", 64, 2, TERMINATOR),  # call rax
+    ("ff 25 00 10 00 00", 64, 6, STOP),  # jmp [rip+disp32]
+    ("48 8b 45 08", 64, 4, NORMAL),  # mov rax, [rbp+8]
+    ("66 b8 01 00", 32, 4, NORMAL),  # mov ax, 1
+    ("48 b8 01 00 00 00 00 00 00 00", 64, 10, NORMAL),  # mov rax, imm64
+    ("0f 1f 44 00 00", 64, 5, NORMAL),  # nop [rax+rax]
+    ("75 02", 64, 2, BRANCH),
+    ("eb 02", 64, 2, JUMP),
+    ("e8 00 00 00 00", 64, 5, STOP),
+    ("0f 0b", 64, 2, STOP),  # ud2
+    ("06", 64, -1, STOP),  # push es is invalid in 64-bit mode
+    # VEX and EVEX
+    ("c5 f8 77", 64, 3, NORMAL),  # vzeroupper
+    ("c5 f8 77", 32, 3, NORMAL),
+    ("c5 fe 6f 00", 64, 4, NORMAL),  # vmovdqu ymm0, [rax]
+    ("c5 f9 70 c1 1b", 64, 5, NORMAL),  # vpshufd xmm0, xmm1, 0x1b
+    ("c4 e2 7d 18 c0", 64, 5, NORMAL),  # vbroadcastss ymm0, xmm0
+    ("c4 e3 fd 00 c1 4e", 64, 6, NORMAL),  # vpermq ymm0, ymm1, 0x4e
+    ("62 f1 7d 48 ef c0", 64, 6, NORMAL),  # vpxord zmm0, zmm0, zmm0
+    ("62 f1 fe 48 7f 44 24 01", 64, 8, NORMAL),  # vmovdqu64 [rsp+0x40], zmm0, compressed disp8
+    ("c4 e1 fd 00 c1", 64, 5, NORMAL),
+    ("c4 e0 7d 18 c0", 64, -1, STOP),  # map 0 does not exist
+    ("66 c5 f8 77", 64, -1, STOP),  # VEX after a 66 prefix
+    ("48 c5 f8 77", 64, -1, STOP),  # VEX after REX
+    ("62 f1 7d 40 ef", 64, -1, STOP),  # truncated
+    # LES, LDS and BOUND with a memory operand in 32-bit mode
+    ("c4 01", 32, 2, NORMAL),
+    ("c5 45 08", 32, 3, NORMAL),
+    ("62 04 24", 32, 3, NORMAL),
+])
+def test_decode_instruction(code, bitness, length, kind):
+    decoded_length, decoded_kind, _ = decode_instruction(bytes.fromhex(code), 0, bitness)
+    assert decoded_length == length
+    if length > 0:
+        assert decoded_kind == kind
+
+
+# gadgets written at the start of the first region, (offset, code, reaches a terminator in 3 instructions)
+GADGETS = [
+    (0x100, "c5 f8 77 c3", True),  # vzeroupper; ret
+    (0x120, "62 f1 7d 48 ef c0 5d c3", True),  # vpxord; pop rbp; ret
+    (0x140, "eb 02 cc cc c3", True),  # jmp +2; ret
+    (0x160, "75 02 c3 cc", True),  # jne +2; ret (fall-through)
+    (0x180, "e8 00 00 00 00 c3", False),  # direct call
+    (0x1a0, "90 90 90 c3", False),  # too far
+    (0x1c0, "06 c3", False),  # invalid in 64-bit mode
+]
+
+
+@pytest.fixture
+def gadget_folder(make_dump_folder) -> str:
+    folder_name = make_dump_folder(bitness=64)
+    fm = ProcessDumpManager(folder_name, use_metadata_index=False)
+    region_path = os.path.join(folder_name, fm.dmp_info[0]["Filename"])
+    fm.close()
+    with open(region_path, 'r+b') as region_file:
+        for offset, code, _ in GADGETS:
+            region_file.seek(offset)
+            region_file.write(bytes.fromhex(code))
+    return folder_name
+
+
+def test_validator_gadgets(gadget_folder):
+    fm = ProcessDumpManager(gadget_folder)
+    validator = GadgetValidator(max_instructions=3)
+    try:
+        base_address = fm.dmp_info[0]["Memory region"][0]
+        addresses = np.array([base_address + offset for offset, _, _ in GADGETS] * 2, dtype=np.uint64)
+        assert validator.are_valid_gadgets(fm, addresses).tolist() == [valid for _, _, valid in GADGETS] * 2
+        assert validator.misses == len(GADGETS)
+        # the second lookup of each address is answered from the cache
+        assert validator.are_valid_gadgets(fm, addresses).tolist() == [valid for _, _, valid in GADGETS] * 2
+        assert validator.hits == len(GADGETS) and validator.misses == len(GADGETS)
+        assert not validator.is_valid_gadget(fm, 0)
+    finally:
+        fm.close()
+
+
+def test_validation_keeps_a_subset_of_the_hits(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        plain = list(scan_stacks(fm, GadgetFilter()))
+        validator = GadgetValidator(max_instructions=4)
+        validated = list(scan_stacks(fm, GadgetFilter(validator=validator)))
+        for plain_hits, validated_hits in zip(plain, validated):
+            assert np.isin(validated_hits.hit_indices, plain_hits.hit_indices).all()
+            expected = validator.are_valid_gadgets(fm, plain_hits.hit_values)
+            assert validated_hits.hit_indices.tolist() == plain_hits.hit_indices[expected].tolist()
+    finally:
+        fm.close()
+    assert sum(len(stack_hits.hit_indices) for stack_hits in validated) > 0
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from incremental_scan import build_snapshot_state, load_snapshot_state, scan_stacks_incremental
+from rop_chains import scan_stacks
+from run_stats import RunStats
+
+
+def get_hits(stack_hits_source) -> list:
+    return [(stack_hits.hit_indices.tolist(), stack_hits.hit_values.tolist()) for stack_hits in stack_hits_source]
+
+
+def scan_snapshot(folder_name: str, gadget_filter: GadgetFilter, previous_state_path: str | None,
+                  state_path: str) -> tuple:
+    """
+    Scans a snapshot incrementally and in full, and returns both hits, the counters of the incremental scan
+    and the saved state reloaded.
+    """
+    fm = ProcessDumpManager(folder_name)
+    stats = RunStats()
+    try:
+        previous_state = load_snapshot_state(previous_state_path) if previous_state_path else None
+        state = build_snapshot_state(fm, gadget_filter)
+        hits = get_hits(scan_stacks_incremental(fm, gadget_filter, previous_state, state, stats))
+        state.save(state_path)
+        expected = get_hits(scan_stacks(fm, gadget_filter))
+    finally:
+        fm.close()
+    return hits, expected, stats.counters
+
+
+def rewrite_dmp_file(folder_name: str, results_file_name: str, dmp_file_name: str, offset: int, data: bytes):
+    """
+    Writes data into a dmp file of a snapshot and updates its SHA-256 in the results.txt that lists it.
+    """
+    dmp_path = os.path.join(folder_name, dmp_file_name)
+    with open(dmp_path, 'r+b') as dmp_file:
+        old_sha256 = hashlib.sha256(dmp_file.read()).hexdigest()
+        dmp_file.seek(offset)
+        dmp_file.write(data)
+        dmp_file.seek(0)
+        new_sha256 = hashlib.sha256(dmp_file.read()).hexdigest()
+    results_path = os.path.join(folder_name, results_file_name)
+    with open(results_path, 'r') as results_file:
+        results = results_file.read()
+    assert old_sha256 in results
+    with open(results_path, 'w') as results_file:
+        results_file.write(results.replace(old_sha256, new_sha256))
+
+
+@pytest.fixture
+def snapshots(make_dump_folder, tmp_path):
+    """
+    Returns a function that copies the first snapshot to a new folder, the next snapshot of the process.
+    """
+    first_folder = make_dump_folder("snapshot0", bitness=64)
+
+    def copy_snapshot(name: str) -> str:
+        folder_name = str(tmp_path / name)
+        shutil.copytree(first_folder, folder_name)
+        return folder_name
+    return first_folder, copy_snapshot
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+def test_unchanged_snapshot_reuses_every_stack(snapshots, tmp_path, call_filter):
+    first_folder, copy_snapshot = snapshots
+    state_path = str(tmp_path / "state.npz")
+    hits, expected, counters = scan_snapshot(first_folder, GadgetFilter(call_filter), None, state_path)
+    assert hits == expected and counters["snapshot_full_scans"] == 1
+
+    hits, expected, counters = scan_snapshot(copy_snapshot("snapshot1"), GadgetFilter(call_filter), state_path,
+                                             str(tmp_path / "state1.npz"))
+    assert hits == expected
+    assert counters["snapshot_stacks_reused"] == len(hits) and counters["stack_bytes_read"] == 0
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+def test_changed_stack_pages(snapshots, tmp_path, call_filter):
+    first_folder, copy_snapshot = snapshots
+    state_path = str(tmp_path / "state.npz")
+    first_hits, _, _ = scan_snapshot(first_folder, GadgetFilter(call_filter), None, state_path)
+
+    # the second snapshot loses the hits of the first page of the first stack and gains those of the last
+    # stack in its second page
+    second_folder = copy_snapshot("snapshot1")
+    fm = ProcessDumpManager(second_folder)
+    stack_file_name = os.path.join("stacks", fm.stack_info[0]["file_name"])
+    fm.close()
+    hit_indices = np.array(first_hits[0][0])
+    rewrite_dmp_file(second_folder, os.path.join("stacks", "results.txt"), stack_file_name, 0,
+                     bytes(8 * int(hit_indices[hit_indices < 0x200].max() + 1)))
+    new_hit_values = np.array(first_hits[-1][1], dtype=np.uint64)[:0x200 // 8]
+    rewrite_dmp_file(second_folder, os.path.join("stacks", "results.txt"), stack_file_name, 0x1000,
+                     new_hit_values.tobytes())
+
+    hits, expected, counters = scan_snapshot(second_folder, GadgetFilter(call_filter), state_path,
+                                             str(tmp_path / "state1.npz"))
+    assert hits == expected and hits != first_hits
+    assert counters["snapshot_stacks_reused"] == len(hits) - 1
+    assert counters["snapshot_pages_changed"] == 2
+    assert counters["snapshot_hits_reused"] > 0
+
+
+def test_changed_region(snapshots, tmp_path):
+    first_folder, copy_snapshot = snapshots
+    gadget_filter = GadgetFilter(call_filter=True)
+    state_path = str(tmp_path / "state.npz")
+    first_hits, _, _ = scan_snapshot(first_folder, gadget_filter, None, state_path)
+
+    # the CALLs of the first region are overwritten, so its return sites are no longer rejected
+    second_folder = copy_snapshot("snapshot1")
+    fm = ProcessDumpManager(second_folder)
+    region = fm.dmp_info[0]
+    fm.close()
+    low, high = region["Memory region"]
+    rewrite_dmp_file(second_folder, "results.txt", region["Filename"], 0, bytes(high - low + 1))
+
+    hits, expected, counters = scan_snapshot(second_folder, gadget_filter, state_path, str(tmp_path / "state1.npz"))
+    assert hits == expected and hits != first_hits
+    # both versions of the region are changed ranges
+    assert counters["snapshot_changed_regions"] == 2 and counters["snapshot_stacks_reused"] == 0
+
+    def count_region_hits(snapshot_hits: list) -> int:
+        return sum(low <= value <= high for _, hit_values in snapshot_hits for value in hit_values)
+    assert count_region_hits(hits) > count_region_hits(first_hits)
+
+
+def test_other_filter_scans_again(snapshots, tmp_path):
+    first_folder, copy_snapshot = snapshots
+    state_path = str(tmp_path / "state.npz")
+    scan_snapshot(first_folder, GadgetFilter(), None, state_path)
+
+    hits, expected, counters = scan_snapshot(copy_snapshot("snapshot1"), GadgetFilter(call_filter=True), state_path,
+                                             str(tmp_path / "state1.npz"))
+    assert hits == expected
+    assert counters["snapshot_full_scans"] == 1 and counters["snapshot_stacks_reused"] == 0
+
+
+def test_state_round_trip(dump_folder, tmp_path):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        state = build_snapshot_state(fm, GadgetFilter())
+        expected = get_hits(scan_stacks_incremental(fm, GadgetFilter(), None, state))
+    finally:
+        fm.close()
+    state.save(str(tmp_path / "state.npz"))
+    loaded = load_snapshot_state(str(tmp_path / "state.npz"))
+    assert loaded.is_compatible(state) and loaded.regions == state.regions
+    assert [(snapshot.hit_indices.tolist(), snapshot.hit_values.tolist()) for snapshot in loaded.stacks.values()] \
+        == expected
+    for key, snapshot in state.stacks.items():
+        assert loaded.stacks[key].fingerprints.tolist() == snapshot.fingerprints.tolist()
+    assert load_snapshot_state(str(tmp_path / "missing.npz")) is None
@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from minidump import SYSTEM_INFO_STREAM, Minidump
+from region_scan import scan_writable_regions
+from rop_chains import scan_stacks
+from synthetic_dump import write_minidump
+
+
+def get_hits(folder_name: str, scan, gadget_filter: GadgetFilter) -> list:
+    """
+    Returns the (base address, WORDs, hit positions, hit values) of every stack or region, sorted by address.
+    """
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return sorted((stack_hits.stack["base_address"], stack_hits.word_count, stack_hits.hit_indices.tolist(),
+                       stack_hits.hit_values.tolist()) for stack_hits in scan(fm, gadget_filter))
+    finally:
+        fm.close()
+
+
+def remove_system_info(file_path: str):
+    """
+    Changes the type of the SystemInfo stream of a minidump to UnusedStream.
+    """
+    with open(file_path, 'r+b') as minidump_file:
+        data = bytearray(minidump_file.read())
+        stream_count, directory_rva = struct.unpack_from("<II", data, 8)
+        for stream_number in range(stream_count):
+            if struct.unpack_from("<I", data, directory_rva + stream_number * 12)[0] == SYSTEM_INFO_STREAM:
+                struct.pack_into("<I", data, directory_rva + stream_number * 12, 0)
+        minidump_file.seek(0)
+        minidump_file.write(data)
+
+
+@pytest.fixture(scope="module")
+def minidump_path(dump_folder, tmp_path_factory) -> str:
+    file_path = str(tmp_path_factory.mktemp("minidump") / "dump.dmp")
+    write_minidump(dump_folder, file_path)
+    return file_path
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+def test_stacks_match_folder(dump_folder, minidump_path, call_filter):
+    gadget_filter = GadgetFilter(call_filter=call_filter)
+    assert get_hits(minidump_path, scan_stacks, gadget_filter) == get_hits(dump_folder, scan_stacks, gadget_filter)
+
+
+def test_writable_regions_match_folder(dump_folder, minidump_path):
+    fm = ProcessDumpManager(minidump_path)
+    folder_fm = ProcessDumpManager(dump_folder)
+    assert fm.bitness == folder_fm.bitness
+    assert [region["Filename"] for region in fm.data_info] == [region["Filename"] for region in folder_fm.data_info]
+    fm.close()
+    folder_fm.close()
+    assert (get_hits(minidump_path, scan_writable_regions, GadgetFilter())
+            == get_hits(dump_folder, scan_writable_regions, GadgetFilter()))
+
+
+def test_missing_system_info_64(make_dump_folder, tmp_path):
+    folder_name = make_dump_folder(bitness=64)
+    file_path = str(tmp_path / "dump.dmp")
+    write_minidump(folder_name, file_path)
+    remove_system_info(file_path)
+    fm = ProcessDumpManager(file_path)
+    assert fm.bitness == 64
+    fm.close()
+    assert get_hits(file_path, scan_stacks, GadgetFilter()) == get_hits(folder_name, scan_stacks, GadgetFilter())
+
+
+def test_missing_system_info_32(make_dump_folder, tmp_path):
+    folder_name = make_dump_folder(bitness=32)
+    file_path = str(tmp_path / "dump.dmp")
+    write_minidump(folder_name, file_path)
+    remove_system_info(file_path)
+    # all the addresses fit in 32 bits and the synthetic modules have no PE header
+    with pytest.raises(ValueError, match="SystemInfo"):
+        ProcessDumpManager(file_path)
+
+    # with a PE header for an i386 machine in the first module
+    fm = ProcessDumpManager(folder_name)
+    region_path = f"{folder_name}/{fm.dmp_info[0]['Filename']}"
+    fm.close()
+    with open(region_path, 'r+b') as region_file:
+        region_file.write(b'MZ' + bytes(0x3A) + struct.pack("<I", 0x40) + b'PE\0\0' + struct.pack("<H", 0x14C))
+    write_minidump(folder_name, file_path)
+    remove_system_info(file_path)
+    with open(file_path, 'rb') as minidump_file:
+        assert Minidump(minidump_file.read()).bitness == 32
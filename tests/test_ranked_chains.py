@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from ranked_chains import TopChains
+from rop_chain_results import get_results_arrays_file_path, load_rop_chain_results
+from rop_chains import run_sweep
+from run_stats import RunStats
+
+SWEEP = ([2, 5], [2, 3])  # values of x and y
+
+
+def get_reference_scores(fm: ProcessDumpManager, gadget_filter: GadgetFilter, chains: list) -> list:
+    """
+    Scores every ROPchain on its own, from its (stack address, gadget address) pairs, with the factors of
+    ranked_chains.add_stack_chains.
+    """
+    scores = []
+    for chain in chains:
+        length = len(chain)
+        span = (chain[-1][0] - chain[0][0]) // fm.word_size + 1
+        gadgets = np.array([gadget for _, gadget in chain], dtype=np.uint64)
+        if gadget_filter.call_filter:
+            checks = 1.0
+        else:
+            checks = 1 - int(gadget_filter.are_prev_instructions_call(fm, gadgets).sum()) / length
+        scores.append(length * (length / span) * (len(np.unique(gadgets)) / length) * checks)
+    return scores
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+@pytest.mark.parametrize("top_chains", [1, 7, 100000])
+def test_top_chains_are_the_best_of_all_chains(dump_folder, tmp_path, call_filter, top_chains):
+    gadget_filter = GadgetFilter(call_filter)
+    stats = RunStats()
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        chain_counts = run_sweep(fm, *SWEEP, str(tmp_path / "all"), gadget_filter)
+        ranked_counts = run_sweep(fm, *SWEEP, str(tmp_path / "ranked"), gadget_filter, stats=stats,
+                                  top_chains=top_chains)
+        for (x, y), chain_count in chain_counts.items():
+            results = load_rop_chain_results(get_results_arrays_file_path(str(tmp_path / "all"), x, y))
+            chains = [[tuple(pair) for pair in results.get_chain(chain_index).tolist()]
+                      for chain_index in range(len(results))]
+            scores = get_reference_scores(fm, gadget_filter, chains)
+            # best first, the ROPchain found first on equal scores
+            expected = sorted(range(len(chains)), key=lambda chain_index: (-scores[chain_index], chain_index))
+            expected = expected[:top_chains]
+
+            ranked = load_rop_chain_results(get_results_arrays_file_path(str(tmp_path / "ranked"), x, y))
+            assert ranked_counts[(x, y)] == len(ranked) == min(top_chains, chain_count)
+            assert [results.get_chain(chain_index).tolist() for chain_index in expected] == [
+                ranked.get_chain(chain_index).tolist() for chain_index in range(len(ranked))]
+            assert [ranked.get_chain_score(chain_index) for chain_index in range(len(ranked))] == pytest.approx(
+                [scores[chain_index] for chain_index in expected])
+    finally:
+        fm.close()
+    assert stats.counters["chains_ranked"] == sum(chain_counts.values())
+    assert stats.counters["chains_emitted"] == sum(ranked_counts.values())
+    # only the largest top_chains keeps every ROPchain
+    assert (sum(ranked_counts.values()) < sum(chain_counts.values())) == (top_chains < max(chain_counts.values()))
+
+
+def test_top_chains_keep_the_first_on_equal_scores():
+    top_chains = TopChains(2)
+    for order, score in enumerate([1.0, 2.0, 2.0, 1.0, 2.0, 3.0]):
+        top_chains.push(score, [(order, 0)])
+    assert [(score, matches) for score, matches, _ in top_chains.get_chains()] == [(3.0, [(5, 0)]), (2.0, [(1, 0)])]
+    assert top_chains.get_min_score() == 2.0
+    assert TopChains(1).get_min_score() == -np.inf
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from region_scan import get_writable_regions, is_writable_protection, scan_writable_regions
+
+
+def get_plain_region_hits(fm: ProcessDumpManager, gadget_filter: GadgetFilter) -> list:
+    """
+    The hits of every writable region, with the whole file read at once as scan_stacks reads a stack.
+    """
+    region_hits = []
+    for region in get_writable_regions(fm):
+        with open(os.path.join(fm.folder_name, region["Filename"]), 'rb') as region_file:
+            region_bytes = region_file.read()
+        words = np.frombuffer(region_bytes[:len(region_bytes) // fm.word_size * fm.word_size], dtype=fm.word_dtype)
+        hit_indices = gadget_filter.find_hits(fm, words)
+        region_hits.append((region["Filename"], hit_indices.tolist(), words[hit_indices].tolist()))
+    return region_hits
+
+
+def get_region_hits(fm: ProcessDumpManager, gadget_filter: GadgetFilter, **arguments) -> list:
+    return [(stack_hits.stack["Filename"], stack_hits.hit_indices.tolist(), stack_hits.hit_values.tolist())
+            for stack_hits in scan_writable_regions(fm, gadget_filter, **arguments)]
+
+
+@pytest.fixture
+def writable_folder(make_dump_folder) -> str:
+    """
+    A dump folder whose second IMG region is writable, as the data of a module, and whose last data region is
+    shorter than the region recorded in its file name.
+    """
+    folder_name = make_dump_folder(bitness=64)
+    results_path = os.path.join(folder_name, "results.txt")
+    with open(results_path, 'r') as results_file:
+        lines = results_file.read().splitlines()
+    lines[2] = lines[2].replace("PAGE_EXECUTE_READ", "PAGE_READWRITE | PAGE_GUARD")
+    with open(results_path, 'w') as results_file:
+        results_file.write("\n".join(lines) + "\n")
+    fm = ProcessDumpManager(folder_name)
+    data_path = os.path.join(folder_name, fm.data_info[-1]["Filename"])
+    fm.close()
+    os.truncate(data_path, os.path.getsize(data_path) // 2 + 4)
+    return folder_name
+
+
+@pytest.mark.parametrize("call_filter", [False, True])
+@pytest.mark.parametrize("jobs, chunk_size", [(1, 1 << 20), (1, 0x1000), (1, 100), (2, 0x1000)])
+def test_chunks_match_plain_scan(writable_folder, call_filter, jobs, chunk_size):
+    fm = ProcessDumpManager(writable_folder)
+    try:
+        gadget_filter = GadgetFilter(call_filter)
+        expected = get_plain_region_hits(fm, gadget_filter)
+        assert get_region_hits(fm, gadget_filter, jobs=jobs, chunk_size=chunk_size) == expected
+    finally:
+        fm.close()
+    assert [file_name for file_name, _, _ in expected] == [fm.dmp_info[1]["Filename"]] + [
+        region["Filename"] for region in fm.data_info]
+    assert sum(len(hit_indices) for _, hit_indices, _ in expected) > 0
+
+
+def test_data_regions_are_not_gadget_targets(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        region_hits = list(scan_writable_regions(fm, GadgetFilter(), chunk_size=0x1000))
+        data_file_names = [region["Filename"] for region in fm.data_info]
+        assert [stack_hits.stack["Filename"] for stack_hits in region_hits] == data_file_names
+        for stack_hits, region in zip(region_hits, fm.data_info):
+            assert all(file_name.startswith("data/") for file_name in data_file_names)
+            assert stack_hits.stack["base_address"] == region["Memory region"][0]
+            assert fm.region_index.contains_many(stack_hits.hit_values).all()
+            for data_region in fm.data_info:
+                low, high = data_region["Memory region"]
+                assert not ((stack_hits.hit_values >= low) & (stack_hits.hit_values <= high)).any()
+    finally:
+        fm.close()
+
+
+@pytest.mark.parametrize("memory_protection, writable", [
+    ("PAGE_READWRITE", True), ("PAGE_EXECUTE_WRITECOPY", True), ("PAGE_READWRITE | PAGE_GUARD", True),
+    ("PAGE_READONLY", False), ("PAGE_EXECUTE_READ", False), ("PAGE_NOACCESS", False),
+])
+def test_is_writable_protection(memory_protection, writable):
+    assert is_writable_protection(memory_protection) == writable
@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from return_site_cache import ReturnSiteCache
+from rop_chains import scan_stacks
+
+
+def get_hits(folder_name: str, gadget_filter: GadgetFilter) -> list:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return [stack_hits.hit_indices.tolist() for stack_hits in scan_stacks(fm, gadget_filter)]
+    finally:
+        fm.close()
+
+
+def test_cache_matches_call_filter(dump_folder, tmp_path):
+    expected = get_hits(dump_folder, GadgetFilter(call_filter=True))
+    cache = ReturnSiteCache(str(tmp_path / "cache"))
+    assert get_hits(dump_folder, GadgetFilter(True, cache)) == expected
+    assert cache.built > 0 and cache.loaded == 0
+
+    # a new cache, e.g. another run, loads the bitmaps saved by the first one
+    cache = ReturnSiteCache(str(tmp_path / "cache"))
+    assert get_hits(dump_folder, GadgetFilter(True, cache)) == expected
+    assert cache.built == 0 and cache.loaded > 0
+    assert not [file_name for file_name in os.listdir(tmp_path / "cache") if file_name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("truncated_size", [None, 0x8000])
+def test_incomplete_region_is_not_cached(make_dump_folder, tmp_path, truncated_size):
+    intact_folder = make_dump_folder("intact")
+    broken_folder = str(tmp_path / "broken")
+    shutil.copytree(intact_folder, broken_folder)
+    fm = ProcessDumpManager(broken_folder)
+    region_path = os.path.join(broken_folder, fm.dmp_info[0]["Filename"])
+    sha256 = fm.dmp_info[0]["SHA-256"]
+    fm.close()
+    if truncated_size is None:
+        os.remove(region_path)
+    else:
+        os.truncate(region_path, truncated_size)
+
+    cache = ReturnSiteCache(str(tmp_path / "cache"))
+    assert get_hits(broken_folder, GadgetFilter(True, cache)) == get_hits(broken_folder, GadgetFilter(True))
+    assert not os.path.exists(cache.get_bitmap_path(sha256, 64))
+
+    # the module is still complete in the other dumps that share it
+    assert get_hits(intact_folder, GadgetFilter(True, cache)) == get_hits(intact_folder, GadgetFilter(True))
+    assert os.path.exists(cache.get_bitmap_path(sha256, 64))
+    assert np.load(cache.get_bitmap_path(sha256, 64)).size * 8 >= 0x10000
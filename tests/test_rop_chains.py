@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from rop_chains import segment_rop_chains
+
+
+def legacy_rop_chains(is_hit: list, distance_between_gadgets: int, min_chain_length: int) -> list:
+    """
+    The WORD by WORD loop of the original __main__ over one stack, with the end of the stack following the
+    same rule as a gap (at least min_chain_length hits). Returns the (start, length) of every ROPchain, the
+    start being the position of its first hit among the hits of the stack.
+    """
+    chains = []
+    current_chain = []  # positions among the hits of the ongoing ROPchain
+    gap_count = 0
+    hit_count = 0
+    for word_is_hit in is_hit:
+        if word_is_hit:
+            if gap_count <= distance_between_gadgets:
+                current_chain.append(hit_count)
+            else:
+                if len(current_chain) >= min_chain_length:
+                    chains.append(current_chain)
+                current_chain = [hit_count]
+            gap_count = 0
+            hit_count += 1
+        else:
+            gap_count += 1
+            if gap_count > distance_between_gadgets and len(current_chain) >= min_chain_length:
+                chains.append(current_chain)
+                current_chain = []
+                gap_count = 0
+    if current_chain and len(current_chain) >= min_chain_length:
+        chains.append(current_chain)
+    return [(chain[0], len(chain)) for chain in chains]
+
+
+def segment(is_hit: list, distance_between_gadgets: int, min_chain_length: int) -> list:
+    starts, lengths = segment_rop_chains(np.flatnonzero(is_hit), distance_between_gadgets, min_chain_length)
+    return list(zip(starts.tolist(), lengths.tolist()))
+
+
+def test_docstring_example():
+    starts, lengths = segment_rop_chains(np.array([0, 1, 3, 9, 10, 20]), 1, 2)
+    assert starts.tolist() == [0, 3]
+    assert lengths.tolist() == [3, 2]
+
+
+def test_no_hits():
+    starts, lengths = segment_rop_chains(np.zeros(0, dtype=np.int64), 2, 1)
+    assert len(starts) == 0 and len(lengths) == 0
+
+
+@pytest.mark.parametrize("min_chain_length", [2, 3, 4])
+def test_chain_at_end_of_stack(min_chain_length):
+    # three hits ending at the last WORD of the stack: kept when y <= 3, as a chain closed by a gap would be
+    is_hit = [1, 0, 0, 0, 0, 1, 1, 1]
+    expected = [(1, 3)] if min_chain_length <= 3 else []
+    assert segment(is_hit, 1, min_chain_length) == expected
+    assert segment(is_hit + [0, 0, 0], 1, min_chain_length) == expected
+    assert legacy_rop_chains(is_hit, 1, min_chain_length) == expected
+
+
+@pytest.mark.parametrize("distance_between_gadgets", [0, 1, 2])
+def test_gap_boundary(distance_between_gadgets):
+    # exactly x non-hit WORDs continue the ROPchain, x + 1 break it
+    is_hit = [1] + [0] * distance_between_gadgets + [1] + [0] * (distance_between_gadgets + 1) + [1]
+    assert segment(is_hit, distance_between_gadgets, 1) == [(0, 2), (2, 1)]
+    assert segment(is_hit, distance_between_gadgets, 3) == []
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_legacy_loop(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(50):
+        is_hit = (rng.random(int(rng.integers(1, 200))) < rng.random()).tolist()
+        distance_between_gadgets = int(rng.integers(0, 5))
+        min_chain_length = int(rng.integers(1, 6))
+        assert (segment(is_hit, distance_between_gadgets, min_chain_length)
+                == legacy_rop_chains(is_hit, distance_between_gadgets, min_chain_length))
@@ -0,0 +1,79 @@
+import filecmp
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from conftest import SRC_DIR
+from gadget_filter import GadgetFilter
+from rop_chains import get_results_file_path, run_sweep
+from run_stats import NO_STATS, RUN_STATS_VERSION, RunStats
+
+# counters that do not depend on how the stacks are spread over worker processes
+SCAN_COUNTERS = ("words_scanned", "region_hits", "call_filter_rejections", "gadget_hits", "stack_bytes_read",
+                 "chains_emitted")
+
+
+def run_stats_sweep(folder_name: str, results_dir: str, stats: RunStats, jobs: int = 1) -> dict:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        return run_sweep(fm, [3, 5], [2], results_dir, GadgetFilter(call_filter=True), jobs, stats)
+    finally:
+        fm.close()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_stats_do_not_change_the_results(dump_folder, tmp_path, jobs):
+    stats = RunStats()
+    chain_counts = run_stats_sweep(dump_folder, str(tmp_path / "stats"), stats, jobs)
+    assert run_stats_sweep(dump_folder, str(tmp_path / "plain"), NO_STATS) == chain_counts
+    for x in (3, 5):
+        assert filecmp.cmp(get_results_file_path(str(tmp_path / "stats"), x, 2),
+                           get_results_file_path(str(tmp_path / "plain"), x, 2), shallow=False)
+    assert stats.counters["chains_emitted"] == sum(chain_counts.values())
+    assert stats.counters["gadget_hits"] == stats.counters["region_hits"] - stats.counters["call_filter_rejections"]
+    assert not NO_STATS.counters and not NO_STATS.timers
+
+
+def test_worker_stats_are_merged(dump_folder, tmp_path):
+    stats = [RunStats(), RunStats()]
+    for jobs, job_stats in zip((1, 2), stats):
+        run_stats_sweep(dump_folder, str(tmp_path / f"jobs{jobs}"), job_stats, jobs)
+    assert {name: stats[0].counters[name] for name in SCAN_COUNTERS} == {
+        name: stats[1].counters[name] for name in SCAN_COUNTERS}
+    assert all(stats[0].counters[name] > 0 for name in SCAN_COUNTERS)
+    assert set(stats[0].timers) == set(stats[1].timers)
+
+
+def test_cache_hit_rates():
+    stats = RunStats()
+    stats.count("img_cache_hits", 3)
+    stats.merge({"timers": {"call_filter": 0.5}, "counters": {"img_cache_misses": 1, "validation_hits": 2}})
+    assert stats.get_cache_hit_rates() == {"img_cache": 0.75}
+    assert stats.timers["call_filter"] == 0.5
+
+
+def test_stats_report_of_the_command_line(dump_folder, tmp_path):
+    command = [sys.executable, os.path.join(SRC_DIR, "__main__.py"), dump_folder, "--x", "3", "5", "--y", "2",
+               "--call-filter"]
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, os.path.join(SRC_DIR, "file_manager")]))
+    os.makedirs(tmp_path / "stats")
+    os.makedirs(tmp_path / "plain")
+    subprocess.run(command + ["--stats", str(tmp_path / "report.json")], cwd=tmp_path / "stats", env=environment,
+                   check=True, capture_output=True)
+    subprocess.run(command, cwd=tmp_path / "plain", env=environment, check=True, capture_output=True)
+
+    with open(tmp_path / "report.json", 'r') as report_file:
+        report = json.load(report_file)
+    chain_counts = run_stats_sweep(dump_folder, str(tmp_path / "sweep"), NO_STATS)
+    assert report["version"] == RUN_STATS_VERSION
+    assert report["chain_counts"] == {f"{x}_{y}": count for (x, y), count in chain_counts.items()}
+    assert report["counters"]["chains_emitted"] == sum(chain_counts.values())
+    assert {"metadata_load", "stack_mapping", "region_lookup", "call_filter", "segmentation",
+            "writer"} <= set(report["stage_seconds"])
+    for x in (3, 5):
+        assert filecmp.cmp(get_results_file_path(str(tmp_path / "stats" / "analysis_results"), x, 2),
+                           get_results_file_path(str(tmp_path / "plain" / "analysis_results"), x, 2), shallow=False)
@@ -0,0 +1,106 @@
+import os
+import zipfile
+
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from rop_chains import scan_stacks
+from stack_prefetcher import StackPrefetcher
+
+
+def get_stack_words(folder_name: str, **arguments) -> list:
+    fm = ProcessDumpManager(folder_name, **arguments)
+    try:
+        # every array is only valid until the next one is requested
+        return [(stack["file_name"], words.tobytes()) for stack, words in fm.iter_stack_words()]
+    finally:
+        fm.close()
+
+
+@pytest.mark.parametrize("prefetch_depth, prefetch_memory_limit", [(1, 256 << 20), (3, 256 << 20), (3, 1)])
+def test_prefetch_matches_mapping(dump_folder, prefetch_depth, prefetch_memory_limit):
+    expected = get_stack_words(dump_folder)
+    assert get_stack_words(dump_folder, prefetch_depth=prefetch_depth,
+                           prefetch_memory_limit=prefetch_memory_limit) == expected
+
+    fm = ProcessDumpManager(dump_folder, prefetch_depth=prefetch_depth, prefetch_memory_limit=prefetch_memory_limit)
+    try:
+        hits = [stack_hits.hit_indices.tolist() for stack_hits in scan_stacks(fm, GadgetFilter(call_filter=True))]
+    finally:
+        fm.close()
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        assert hits == [stack_hits.hit_indices.tolist()
+                        for stack_hits in scan_stacks(fm, GadgetFilter(call_filter=True))]
+    finally:
+        fm.close()
+
+
+def test_prefetch_from_an_archive(dump_folder, tmp_path):
+    archive_path = str(tmp_path / "dump.zip")
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for root, _, file_names in os.walk(dump_folder):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                zip_file.write(path, os.path.relpath(path, dump_folder))
+    assert get_stack_words(archive_path, prefetch_depth=2) == get_stack_words(dump_folder)
+
+
+def test_missing_stack_file_is_skipped(make_dump_folder, capsys):
+    folder_name = make_dump_folder()
+    fm = ProcessDumpManager(folder_name)
+    missing_file_name = fm.stack_info[1]["file_name"]
+    fm.close()
+    os.remove(os.path.join(folder_name, "stacks", missing_file_name))
+
+    expected = get_stack_words(folder_name)
+    assert missing_file_name not in [file_name for file_name, _ in expected]
+    capsys.readouterr()
+    assert get_stack_words(folder_name, prefetch_depth=2) == expected
+    assert missing_file_name in capsys.readouterr().out
+
+
+def test_regions_are_prefaulted_once(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        prefetcher = StackPrefetcher(fm, queue_depth=2, min_region_hits=1)
+        for _ in prefetcher.iter_stack_files():
+            pass
+        assert 0 < prefetcher.regions_prefaulted == len(prefetcher.prefaulted_regions) <= len(fm.dmp_info)
+    finally:
+        fm.close()
+
+
+class RecordingPrefetcher(StackPrefetcher):
+    """
+    Records the stack files loaded and which of them were closed.
+    """
+    def __init__(self, fm, queue_depth: int):
+        super().__init__(fm, queue_depth)
+        self.loaded = []
+        self.closed = set()
+
+    def load_stack_file(self, index: int):
+        member = super().load_stack_file(index)
+        close = member.close
+
+        def record_close():
+            self.closed.add(index)
+            close()
+        member.close = record_close
+        self.loaded.append(index)
+        return member
+
+
+def test_files_loaded_ahead_are_closed_when_iteration_stops(dump_folder):
+    fm = ProcessDumpManager(dump_folder)
+    try:
+        prefetcher = RecordingPrefetcher(fm, queue_depth=3)
+        stack_files = prefetcher.iter_stack_files()
+        index, _ = next(stack_files)
+        assert index == 0
+        stack_files.close()
+        assert prefetcher.closed == set(prefetcher.loaded)
+    finally:
+        fm.close()
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from process_dump_manager import ProcessDumpManager
+from gadget_filter import GadgetFilter
+from rop_chains import scan_stacks
+from triage import estimate_density, get_sample_windows, triage_dump_folder
+
+
+def get_full_density(folder_name: str) -> float:
+    fm = ProcessDumpManager(folder_name)
+    try:
+        stacks = list(scan_stacks(fm, GadgetFilter()))
+    finally:
+        fm.close()
+    return sum(len(stack_hits.hit_indices) for stack_hits in stacks) / sum(stack_hits.word_count for stack_hits in stacks)
+
+
+def test_whole_stacks_give_the_full_scan_density(dump_folder):
+    result = triage_dump_folder(dump_folder, byte_budget=1 << 30, time_budget=60)
+    assert result["windows_sampled"] == result["windows_placed"]
+    assert result["score"] == pytest.approx(get_full_density(dump_folder))
+    assert result["score_low"] == pytest.approx(result["score"]) == pytest.approx(result["score_high"])
+
+
+def test_byte_budget_with_many_small_stacks(make_dump_folder):
+    # every stack gets a window, but only the budget is read
+    folder_name = make_dump_folder(stack_count=200, stack_size=0x1000, writable_region_count=0)
+    result = triage_dump_folder(folder_name, byte_budget=0x10000, time_budget=60)
+    assert result["windows_placed"] == 200
+    assert result["bytes_sampled"] == 0x10000
+    assert result["windows_sampled"] == 16
+
+
+@pytest.mark.parametrize("byte_budget", [0x10, 0x2000, 0x5000])
+def test_byte_budget_with_stride(dump_folder, byte_budget):
+    result = triage_dump_folder(dump_folder, byte_budget=byte_budget, time_budget=60, stride=0x1000)
+    assert 0 < result["bytes_sampled"] <= byte_budget
+
+
+def test_stride_smaller_than_window_does_not_overlap(dump_folder):
+    result = triage_dump_folder(dump_folder, byte_budget=1 << 30, time_budget=60, window_size=0x1000, stride=0x100)
+    fm = ProcessDumpManager(dump_folder)
+    stack_bytes = sum(stack["stack_size"] for stack in fm.stack_info)
+    windows = get_sample_windows(fm, 0x1000 // fm.word_size, 1 << 30, 0x100 // fm.word_size)
+    fm.close()
+    assert result["bytes_sampled"] == stack_bytes
+    assert len(set(windows)) == len(windows) == result["windows_placed"]
+    assert result["score"] == pytest.approx(get_full_density(dump_folder))
+
+
+def test_partial_sample_has_bounds(dump_folder):
+    result = triage_dump_folder(dump_folder, byte_budget=0x4000, time_budget=60, window_size=0x400, stride=0x400)
+    assert result["score_low"] < result["score"] < result["score_high"]
+    assert result["score_low"] <= get_full_density(dump_folder) <= result["score_high"]
+
+
+def test_estimate_density_without_sample():
+    assert estimate_density(np.zeros(0), np.zeros(0), 10) == (0.0, 0.0, 1.0)